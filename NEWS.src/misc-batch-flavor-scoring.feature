@@ -0,0 +1 @@
+Flavor scoring in trove lookups and update planning now uses cached bitmask forms of the flavors, which makes it several times faster when many candidate flavors are scored.
@@ -0,0 +1 @@
+Adding a trove to the local database collects its file and tag rows and writes them with a few bulk statements when the trove is done.
@@ -0,0 +1 @@
+Dependency resolution against trove lists now matches provides and requires in the dep_freeze extension, with providers indexed by dependency class and name.
@@ -0,0 +1 @@
+Tag descriptions can now say "concurrent True" to let a tag handler run at the same time as other concurrent handlers, and "after <tag>" to make it wait for another tag's handler. Output is still reported in handler order.
@@ -0,0 +1 @@
+OpenPGP signatures are verified using libgmp when pycrypto was built without it, and key material is parsed faster.
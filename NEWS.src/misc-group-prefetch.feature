@@ -0,0 +1 @@
+Group cooks now fetch dependencies, sizes and path hashes for all referenced troves up front, with one request per repository server and servers queried in parallel.
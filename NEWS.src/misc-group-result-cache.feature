@@ -0,0 +1 @@
+The new groupResultCache configuration option lets group cooks reuse the dependency resolution, dependency check and path conflict results of groups whose inputs have not changed since their last committed build.
@@ -0,0 +1 @@
+addArchive now unpacks zip archives, and tar and cpio archives compressed with gzip or bzip2 (or not at all), without running external tools. The sha1s computed while unpacking into the destdir are reused when packaging.
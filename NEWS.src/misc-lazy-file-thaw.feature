@@ -0,0 +1 @@
+File streams are now thawed lazily: individual streams are decoded the first time they are used, and untouched streams are refrozen by copying their original data.
@@ -0,0 +1 @@
+The new lowMemoryUpdates configuration option keeps the trove changesets used while planning an update in a temporary file, thawing them only when they are needed, which bounds the memory used by very large updates.
@@ -0,0 +1 @@
+Troves now keep their file references in a packed form, which uses roughly a quarter of the memory the previous dictionary did.
@@ -0,0 +1 @@
+RPM capsule payloads are extracted with a pool of writer threads, and each file is checked against the digest recorded in the RPM header as it is written.
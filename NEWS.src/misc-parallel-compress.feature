@@ -0,0 +1 @@
+cvc cook now compresses the file contents of built packages on multiple threads; the new compressThreads configuration option controls how many (0, the default, uses one per CPU).
@@ -0,0 +1 @@
+Trove lookups now query all repositories of a round in parallel, and send the later labels of a label path in the same round as the first.
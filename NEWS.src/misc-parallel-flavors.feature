@@ -0,0 +1 @@
+cvc cook --parallel-flavors builds all requested flavors of a package at the same time, each in its own build directory, and commits them together.
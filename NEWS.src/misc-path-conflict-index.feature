@@ -0,0 +1 @@
+Checking an update for path conflicts looks up the added paths through the path index instead of joining them against every installed file.
@@ -0,0 +1 @@
+The new queryCache option names a directory where label queries and dependency lookups are remembered between runs. Label query results are reused as long as the repository reports no changes to their labels through the new getLabelChangeMarks call (protocol version 74). Repositories keep a change counter per label for this, which needs a schema migration to version 18.2; until it is run, clients do not cache label query results from that repository. The dependencies of a trove never change, so they are kept without any check.
@@ -0,0 +1 @@
+Rollbacks keep file contents in a pool shared by the whole rollback stack instead of copying them into every rollback, and the new rollbackRetainCount and rollbackRetainSize settings remove old rollbacks after each update.
@@ -0,0 +1 @@
+Counting the steps of a rollback and checking whether a rollback is local read only the trove lists of its changesets, not their file streams and contents.
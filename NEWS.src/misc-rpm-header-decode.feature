@@ -0,0 +1 @@
+RPM header tags are decoded a whole array at a time, which makes building phantom troves during capsule database sync much faster.
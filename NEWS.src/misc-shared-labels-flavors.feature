@@ -0,0 +1 @@
+Labels, label branches, flavors and dependency sets parsed from repository responses are now shared between equal values, which makes hashing and comparing trove tuples cheaper. The shared flavors and dependency sets are read-only; modifying one raises TypeError, and copy() returns one which can be modified.
@@ -0,0 +1 @@
+The new signatureCache option names a file where verified trove signatures are remembered, so later runs do not verify them again; keys read from the keyrings are reloaded when the keyrings change.
@@ -0,0 +1 @@
+The new streamingApply configuration option starts applying each update changeset as soon as its trove information has arrived, writing files to disk while the rest of the changeset is still downloading.
@@ -0,0 +1 @@
+Trove digests are remembered between computations, and the frozen file and trove lists are kept until they change, so signing and verifying large troves no longer re-serializes and re-hashes them each time.
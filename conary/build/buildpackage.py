@@ -78,10 +78,19 @@ class BuildComponent(dict):
         used to obtain the contents of the file when creating a changeset
         to commit to the repository
         """
+        sb = os.lstat(realPath)
+        # reuse the sha1 addArchive computed while unpacking this file, as
+        # long as the file hasn't been touched since
+        knownSha1 = None
+        digest = getattr(self.recipe, '_unpackedDigests', {}).get(path)
+        if digest and digest[0:3] == (sb.st_ino, sb.st_size, sb.st_ctime):
+            knownSha1 = digest[3]
+
         # skip uid/gid lookups because packagepolicy will change the
         # ownerships according to Ownership settings anyway
         (f, linkCount, inode) = files.FileFromFilesystem(realPath, None,
-                                        inodeInfo = True, assumeRoot = True)
+                                        inodeInfo = True, assumeRoot = True,
+                                        statBuf = sb, knownSha1 = knownSha1)
         f.inode.perms.set(f.inode.perms() & 01777)
         self[path] = (realPath, f)
         if (f.inode.perms() & 0400) != 0400:
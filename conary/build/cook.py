@@ -20,6 +20,7 @@ Contains the functions which builds a recipe and commits the
 resulting packages to the repository.
 """
 
+import errno
 import fcntl
 import itertools
 import os
@@ -515,7 +516,10 @@ def cookObject(repos, cfg, loaderList, sourceVersion,
 
     db = database.Database(cfg.root, cfg.dbPath)
     type = loaderList[0].getRecipe().getType()
+    groupResults = None
     if type == recipe.RECIPE_TYPE_GROUP:
+        if cfg.groupResultCache and not changeSetFile:
+            groupResults = []
         ret = cookGroupObjects(repos, db, cfg,
                                [ x.getRecipe() for x in loaderList ],
                                sourceVersion,
@@ -524,7 +528,8 @@ def cookObject(repos, cfg, loaderList, sourceVersion,
                                requireCleanSources = requireCleanSources,
                                callback = callback,
                                ignoreDeps = ignoreDeps,
-                               groupOptions=groupOptions)
+                               groupOptions=groupOptions,
+                               groupResults = groupResults)
         needsSigning = True
     else:
         assert(len(loaderList) == 1)
@@ -595,6 +600,13 @@ def cookObject(repos, cfg, loaderList, sourceVersion,
     else:
         repos.commitChangeSet(cs, callback = callback)
 
+        # only results which made it into the repository may be reused
+        if groupResults:
+            resultCache = grouprecipe.GroupResultCache(cfg.groupResultCache)
+            for entry in groupResults:
+                if not entry[1][1].isOnLocalHost():
+                    resultCache.set(*entry)
+
     if cleanup:
         (fn, args) = cleanup
         fn(*args)
@@ -701,7 +713,7 @@ def cookGroupObjects(repos, db, cfg, recipeClasses, sourceVersion, macros={},
                      targetLabel = None, alwaysBumpCount=False,
                      callback = callbacks.CookCallback(),
                      requireCleanSources = False, groupOptions=None,
-                     ignoreDeps = False):
+                     ignoreDeps = False, groupResults = None):
     """
     Turns a group recipe object into a change set. Returns the absolute
     changeset created, a list of the names of the packages built, and
@@ -724,6 +736,10 @@ def cookGroupObjects(repos, db, cfg, recipeClasses, sourceVersion, macros={},
     full version with any other existing troves with the same name,
     even if their flavors would differentiate them.
     @type alwaysBumpCount: bool
+    @param groupResults: if not None, (fingerprint, troveTup, troveList,
+    size, pathConflicts) is appended for each group which can be recorded
+    in a L{grouprecipe.GroupResultCache} once the changeset is committed
+    @type groupResults: list
     """
     enforceManagedPolicy = (cfg.enforceManagedPolicy
                             and targetLabel != versions.CookLabel())
@@ -900,6 +916,14 @@ def cookGroupObjects(repos, db, cfg, recipeClasses, sourceVersion, macros={},
         recipeObj.doProcess('GROUP_ENFORCEMENT')
         recipeObj.doProcess('ERROR_REPORTING')
 
+        if groupResults is not None:
+            for group in recipeObj.iterGroupList():
+                if group.fingerprint is not None:
+                    groupResults.append((group.fingerprint,
+                        (group.name, targetVersion, grpFlavor),
+                        [ x[0:3] for x in group.iterTroveListInfo() ],
+                        group.getSize(), group.pathConflicts))
+
         for primaryName in recipeObj.getPrimaryGroupNames():
             changeSet.addPrimaryTrove(primaryName, targetVersion, grpFlavor)
 
@@ -1560,7 +1584,10 @@ def _createPackageChangeSet(repos, db, cfg, bldList, loader, recipeObj,
     troveList = [x[1] for x in packageList] + grpMap.values()
     _doCopyForwardMetadata(troveList, recipeObj)
 
-    changeSet = changeset.CreateFromFilesystem(packageList)
+    # compressing file contents dominates writing the changeset out, so
+    # spread that across cfg.compressThreads worker threads
+    changeSet = changeset.CreateFromFilesystem(packageList,
+                            compressThreads = cfg.compressThreads or None)
 
     for packageName in grpMap:
         changeSet.addPrimaryTrove(packageName, targetVersion, flavor)
@@ -2182,13 +2209,180 @@ def cookItem(repos, cfg, item, prep=0, macros={},
             raise CookError(str(e))
     return tuple(built), changeSetFile
 
+def _forkCook(cookIds, fn, *args, **kwargs):
+    """
+    Runs fn in a child process with the same process setup cookCommand
+    uses for its build children, and returns the pid of the child. The
+    child exits with status 0 if fn returns and 1 if it raises.
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+
+    try:
+        try:
+            if cookIds:
+                os.setgid(cookIds[1])
+                os.setuid(cookIds[0])
+            os.umask(0022)
+            resource.setrlimit(resource.RLIMIT_CORE, (0,0))
+            fn(*args, **kwargs)
+            status = 0
+        except (errors.ConaryError, builderrors.CookError), e:
+            log.error(str(e))
+            status = 1
+        except:
+            traceback.print_exc()
+            status = 1
+    finally:
+        # never return into the parent's code from the child, and don't
+        # lose the build output still sitting in the buffers
+        sys.stdout.flush()
+        sys.stderr.flush()
+        if log.errorOccurred():
+            os._exit(1)
+        os._exit(status)
+
+def _waitForCooks(pids):
+    """
+    Waits for all of the children in pids to exit, and returns the
+    exit status of the first one which failed (or 0).
+    """
+    failed = 0
+    for pid in pids:
+        while True:
+            try:
+                status = os.waitpid(pid, 0)[1]
+                break
+            except KeyboardInterrupt:
+                for otherPid in pids:
+                    try:
+                        os.kill(otherPid, signal.SIGINT)
+                    except OSError:
+                        pass
+            except OSError, e:
+                if e.errno != errno.EINTR:
+                    raise
+
+        if os.WIFSIGNALED(status):
+            failed = failed or 1
+        elif os.WEXITSTATUS(status):
+            failed = failed or os.WEXITSTATUS(status)
+
+    return failed
+
+def _cookFlavorsInParallel(repos, cfg, item, cookIds = None,
+                           changeSetFile = None, **cookArgs):
+    """
+    Cooks all of the flavors of a single package or recipe file at once,
+    each flavor in its own child process and build directory, and commits
+    the results as a single changeset (or writes them to a single
+    changeset file).
+
+    Sources are downloaded for each flavor, one flavor at a time, before
+    any building starts, so the builds find everything they need in the
+    lookaside cache rather than racing each other to fetch the same
+    files.
+
+    @param item: (name, versionStr, flavorList) as built by cookCommand
+    @type item: tuple
+    """
+    name, versionStr, flavorList = item
+    isRecipeFile = name.endswith('.recipe') and os.path.isfile(name)
+
+    # fetch sources serially; anything which doesn't depend on the flavor
+    # is only downloaded once
+    for flavor in flavorList:
+        pid = _forkCook(cookIds, cookItem, repos, cfg,
+                        (name, versionStr, [ flavor ]),
+                        downloadOnly = True, **cookArgs)
+        status = _waitForCooks([ pid ])
+        if status:
+            sys.exit(status)
+
+    csDir = tempfile.mkdtemp(prefix = 'cook-')
+    try:
+        if cookIds:
+            os.chown(csDir, cookIds[0], cookIds[1])
+
+        buildPath = cfg.buildPath
+        csFiles = []
+        pids = []
+        for idx, flavor in enumerate(flavorList):
+            csFile = os.path.join(csDir, '%d.ccs' % idx)
+            csFiles.append(csFile)
+            cfg.buildPath = os.path.join(buildPath, 'flavor-%d' % idx)
+            try:
+                pids.append(_forkCook(cookIds, cookItem, repos, cfg,
+                                      (name, versionStr, [ flavor ]),
+                                      changeSetFile = csFile, **cookArgs))
+            finally:
+                cfg.buildPath = buildPath
+
+        status = _waitForCooks(pids)
+        if status:
+            sys.exit(status)
+
+        csList = [ changeset.ChangeSetFromFile(x) for x in csFiles ]
+        cs = changeset.ReadOnlyChangeSet()
+        try:
+            for flavorCs in csList:
+                cs.merge(flavorCs)
+        except changeset.ChangeSetKeyConflictError, e:
+            # the flavors disagree on the contents of a file with the same
+            # pathId; this is the same limitation which keeps cookCommand
+            # from cooking flavors of packages together
+            log.warning('Unable to merge the flavors of %s into a single '
+                        'changeset (%s); committing them separately'
+                        % (name, e))
+            cs = None
+            csList = [ changeset.ChangeSetFromFile(x) for x in csFiles ]
+        else:
+            csList = [ cs ]
+
+        built = sorted(itertools.chain(*[
+                    [ (x.getName(), x.getNewVersion(), x.getNewFlavor())
+                      for x in flavorCs.iterNewTroveList() ]
+                    for flavorCs in csList ]))
+
+        if not changeSetFile and isRecipeFile:
+            # name the changeset the way cookItem does for a serial cook
+            flavor = flavorList[0]
+            if flavor is not None:
+                flavor = deps.overrideFlavor(cfg.buildFlavor, flavor)
+            recipeClass = getRecipeInfoFromPath(repos, cfg, name,
+                                                buildFlavor = flavor)[1]
+            changeSetFile = "%s-%s.ccs" % (recipeClass.name,
+                                           recipeClass.version)
+
+        if changeSetFile:
+            if cs is None:
+                raise CookError('Cannot write flavors of %s to a single '
+                                'change set' % name)
+            cs.writeToFile(changeSetFile)
+        else:
+            for flavorCs in csList:
+                repos.commitChangeSet(flavorCs)
+    finally:
+        util.rmtree(csDir, ignore_errors = True)
+
+    for component, version, flavor in built:
+        print "Created component:", component, version,
+        if flavor is not None:
+            print str(flavor).replace("\n", " "),
+        print
+    if changeSetFile:
+        print 'Changeset written to:', changeSetFile
+    else:
+        print 'Changeset committed to the repository.'
+
 def cookCommand(cfg, args, prep, macros, emerge = False,
                 resume = None, allowUnknownFlags = False,
                 showBuildReqs = False, ignoreDeps = False,
                 profile = False, logBuild = True,
                 crossCompile = None, cookIds=None, downloadOnly=False,
                 groupOptions=None,
-                changeSetFile=None,
+                changeSetFile=None, parallelFlavors=False,
                 ):
     # this ensures the repository exists
     client = conaryclient.ConaryClient(cfg)
@@ -2227,6 +2421,12 @@ def cookCommand(cfg, args, prep, macros, emerge = False,
         # check.
         if trove.troveIsGroup(name):
             finalItems.append((name, version, flavorList))
+        elif (parallelFlavors and len(flavorList) > 1 and not
+                (prep or downloadOnly or emerge or resume or showBuildReqs
+                 or profile)):
+            # each flavor still gets its own cook (and build directory),
+            # but they run at the same time
+            finalItems.append((name, version, flavorList))
         else:
             for flavor in flavorList:
                 finalItems.append((name, version, [flavor]))
@@ -2235,6 +2435,19 @@ def cookCommand(cfg, args, prep, macros, emerge = False,
         raise CookError("Cannot cook multiple troves to change set")
 
     for item in finalItems:
+        if (isinstance(item, tuple) and len(item[2]) > 1
+                and not trove.troveIsGroup(item[0])):
+            _cookFlavorsInParallel(repos, cfg, item, cookIds = cookIds,
+                                   changeSetFile = changeSetFile,
+                                   macros = macros,
+                                   allowUnknownFlags = allowUnknownFlags,
+                                   ignoreDeps = ignoreDeps,
+                                   logBuild = logBuild,
+                                   crossCompile = crossCompile,
+                                   callback = CookCallback(),
+                                   groupOptions = groupOptions)
+            continue
+
         # we want to fork here to isolate changes the recipe might make
         # in the environment (such as environment variables)
         # first, we need to ignore the tty output in the child process
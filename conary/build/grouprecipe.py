@@ -16,6 +16,8 @@
 
 
 import copy
+import cPickle
+import os
 from itertools import chain, izip
 
 from conary.build import defaultrecipes
@@ -34,8 +36,8 @@ from conary import conaryclient
 from conary import callbacks
 from conary.deps import deps
 from conary import errors
-from conary.lib import graph, log, util
-from conary.repository import changeset, trovesource, searchsource
+from conary.lib import graph, log, sha1helper, threadpool, util
+from conary.repository import changeset, netclient, trovesource, searchsource
 from conary import trove
 from conary import versions
 from conary import files
@@ -48,11 +50,15 @@ ADD_REASON_ADDALL = 3   # added as part of an "addAll"
 ADD_REASON_REPLACE = 4  # added as part of a "replace" command.
 ADD_REASON_INCLUDED_GROUP = 5 # added because its in an included group
 ADD_REASON_COPIED = 6    # added because it was copied from another group
+ADD_REASON_REUSED = 7    # added because a build with the same inputs did
 
 ADDALL_NORECURSE = 0
 ADDALL_RECURSE   = 1
 ADDALL_FLATTEN   = 2
 
+# maximum number of servers TroveCache.prefetchTroveData talks to at once
+MAX_PREFETCH_THREADS = 8
+
 class AddAllFlags(object):
 
     __slots__ = [ 'ref', 'recurse', 'copyCompatibilityClass', 'copyScripts',
@@ -1453,6 +1459,8 @@ class _SingleGroup(object):
         self.reasons = {}
         self.newGroupList = {}
         self.buildRefs = []
+        self.fingerprint = None
+        self.pathConflicts = None
 
     def setSize(self, size):
         self.size = size
@@ -1592,6 +1600,8 @@ class _SingleGroup(object):
             return "Included by replace of %s=%s[%s]" % reason[1]
         elif reasonType == ADD_REASON_COPIED:
             return "Included due to copy/move of components from %s" % reason[1]
+        elif reasonType == ADD_REASON_REUSED:
+            return "Reused from previous build %s=%s[%s]" % reason[1]
         else:
             raise errors.InternalConaryError("Unknown inclusion reason")
 
@@ -1970,6 +1980,132 @@ class TroveCache(trovecache.TroveCache):
                                  weakRef=True, *childChildTup)
 
 
+    def iterReachableTroves(self, troveTupList):
+        """
+            Yields each trove in troveTupList along with everything those
+            troves reference, strongly or weakly.  Collections must already
+            be cached; getChildren() guarantees their weak reference lists
+            are complete, so one level is enough.
+        """
+        seen = set()
+        for troveTup in troveTupList:
+            if troveTup not in seen:
+                seen.add(troveTup)
+                yield troveTup
+            if not self.troveIsCached(troveTup):
+                continue
+            for childTup in self.cache[troveTup].iterTroveList(
+                                            strongRefs=True, weakRefs=True):
+                if childTup not in seen:
+                    seen.add(childTup)
+                    yield childTup
+
+    def prefetchTroveData(self, troveTupList, getDeps = True,
+                          getSizes = True, getPathHashes = True,
+                          numThreads = None):
+        """
+            Fetches dependencies, sizes and path hashes for all of the
+            components in troveTupList with one call per server for each
+            kind of information, talking to different servers in parallel.
+            Anything already known is skipped, and the results land in the
+            same caches getDepsForTroveList() and getTroveInfo() use.
+
+            This is only an optimization; if a server can't answer, the
+            troves are left alone and the regular lookups deal with them
+            later.
+        """
+        isColl = trove.troveIsCollection
+        sizeCache = self.troveInfoCache.setdefault(
+                                        trove._TROVEINFO_TAG_SIZE, {})
+        hashCache = self.troveInfoCache.setdefault(
+                                        trove._TROVEINFO_TAG_PATH_HASHES, {})
+
+        byServer = {}
+        for troveTup in troveTupList:
+            if (isColl(troveTup[0]) or self.troveIsCached(troveTup)
+                    or troveTup[1].isOnLocalHost()):
+                continue
+            needDeps = getDeps and troveTup not in self.depCache
+            needSize = getSizes and troveTup not in sizeCache
+            needHashes = getPathHashes and troveTup not in hashCache
+            if not (needDeps or needSize or needHashes):
+                continue
+            l = byServer.setdefault(troveTup[1].getHost(), ([], [], []))
+            if needDeps:
+                l[0].append(troveTup)
+            if needSize:
+                l[1].append(troveTup)
+            if needHashes:
+                l[2].append(troveTup)
+
+        if not byServer:
+            return
+
+        troveSource = self.troveSource
+        def _fetch(item):
+            host, (depTups, sizeTups, hashTups) = item
+            try:
+                if depTups:
+                    try:
+                        depList = troveSource.getDepsForTroveList(depTups)
+                    except netclient.PartialResultsError, e:
+                        depList = e.partialResults
+                else:
+                    depList = []
+                if sizeTups:
+                    sizeList = troveSource.getTroveInfo(
+                                trove._TROVEINFO_TAG_SIZE, sizeTups)
+                else:
+                    sizeList = []
+                if hashTups:
+                    hashList = troveSource.getTroveInfo(
+                                trove._TROVEINFO_TAG_PATH_HASHES, hashTups)
+                else:
+                    hashList = []
+            except errors.ConaryError, e:
+                log.debug('unable to prefetch trove data from %s: %s'
+                          % (host, e))
+                return None
+            return depList, sizeList, hashList
+
+        jobs = sorted(byServer.iteritems())
+        log.info('Prefetching trove data for %d troves from %d servers'
+                 % (len(set(chain(*chain(*byServer.itervalues())))),
+                    len(jobs)))
+        if numThreads is None:
+            numThreads = min(len(jobs), MAX_PREFETCH_THREADS)
+        if not self._concurrentCalls([ x[0] for x in jobs ]):
+            numThreads = 1
+
+        for (host, (depTups, sizeTups, hashTups)), result in \
+                izip(jobs, threadpool.imap(_fetch, jobs,
+                                           numThreads = numThreads)):
+            if result is None:
+                continue
+            depList, sizeList, hashList = result
+            for troveTup, depInfo in izip(depTups, depList):
+                if depInfo is not None:
+                    self.depCache[troveTup] = depInfo
+            for troveTup, size in izip(sizeTups, sizeList):
+                if size is not None:
+                    sizeCache[troveTup] = size
+            for troveTup, pathHashes in izip(hashTups, hashList):
+                if pathHashes is not None:
+                    hashCache[troveTup] = pathHashes
+
+    def _concurrentCalls(self, hostList):
+        # only network repository proxies can be called from more than
+        # one thread; shim clients and anything else are called serially
+        serverCache = getattr(self.troveSource, 'c', None)
+        if serverCache is None:
+            return False
+        try:
+            servers = [ serverCache[x] for x in hostList ]
+        except errors.ConaryError:
+            return False
+        return not [ x for x in servers
+                     if not getattr(x, '_concurrentCalls', False) ]
+
     def isRedirect(self, troveTup):
         return self.cache[troveTup].isRedirect()
 
@@ -1986,6 +2122,159 @@ class TroveCache(trovecache.TroveCache):
         return self.cache[troveTup].includeTroveByDefault(*childTrove)
 
 
+class GroupResultCache(object):
+    """
+        Remembers which group trove was committed from a given set of
+        inputs (see L{groupFingerprint}), along with the troves it ended
+        up containing, its size and the path conflicts found for it, so a
+        later cook with the same inputs can reuse the result of dependency
+        resolution and conflict checking.  Entries are stored one per file
+        in a directory, named by the fingerprint.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _entryPath(self, fingerprint):
+        return os.path.join(self.path, sha1helper.sha1ToString(fingerprint))
+
+    @staticmethod
+    def _freeze(tup):
+        return (tup[0], tup[1].freeze(), tup[2].freeze())
+
+    @staticmethod
+    def _thaw(tup):
+        return (tup[0], versions.ThawVersion(tup[1]), deps.ThawFlavor(tup[2]))
+
+    def get(self, fingerprint):
+        """
+            Returns (troveTup, troveList, size, pathConflicts) for the group
+            last committed from inputs matching fingerprint, or None.
+            troveList holds (troveTup, explicit, byDefault) for each trove
+            the group contained.
+        """
+        try:
+            f = open(self._entryPath(fingerprint))
+            try:
+                frzTup, frzTroveList, size, frzConflicts = cPickle.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError, EOFError, ValueError, TypeError,
+                cPickle.UnpicklingError):
+            return None
+
+        troveList = [ (self._thaw(x[0]), x[1], x[2]) for x in frzTroveList ]
+        conflicts = None
+        if frzConflicts is not None:
+            conflicts = [ (tuple(self._thaw(x) for x in conflictSet), paths)
+                          for conflictSet, paths in frzConflicts ]
+
+        return self._thaw(frzTup), troveList, size, conflicts
+
+    def set(self, fingerprint, troveTup, troveList, size, conflicts):
+        frzTroveList = [ (self._freeze(x[0]), bool(x[1]), bool(x[2]))
+                         for x in troveList ]
+        frzConflicts = None
+        if conflicts is not None:
+            frzConflicts = [ (tuple(self._freeze(x) for x in conflictSet),
+                              paths)
+                             for conflictSet, paths in conflicts ]
+        try:
+            util.mkdirChain(self.path)
+            f = util.AtomicFile(self._entryPath(fingerprint), chmod = 0644)
+            cPickle.dump((self._freeze(troveTup), frzTroveList, size,
+                          frzConflicts), f, 2)
+            f.commit()
+        except (IOError, OSError), e:
+            log.warning('unable to save group results for %s: %s'
+                        % (troveTup[0], e))
+
+
+def groupFingerprint(group, searchFlavor, labelPath, searchPath,
+                     childFingerprints):
+    """
+        Returns a digest of everything dependency resolution, dependency
+        checking and path conflict checking depend on for group: its
+        contents (before dependencies are resolved), the flags controlling
+        those steps, the search flavor and path, and the fingerprints of
+        the groups it contains.
+
+        Returns None if the result can't be reused, which is the case for
+        groups which resolve dependencies against labels (new troves
+        could show up on those labels at any time) and for groups which
+        contain such groups.
+    """
+    if None in childFingerprints:
+        return None
+    if group.autoResolve:
+        for item in searchPath:
+            if not isinstance(item, tuple):
+                return None
+
+    def _tupStr(tup):
+        return '%s=%s[%s]' % (tup[0], tup[1].freeze(), tup[2].freeze())
+
+    lines = [ group.name, searchFlavor.freeze(),
+              ' '.join(str(x) for x in labelPath),
+              ' '.join(isinstance(x, tuple) and _tupStr(x) or str(x)
+                       for x in searchPath),
+              '%s %s %s %s' % (bool(group.autoResolve), bool(group.depCheck),
+                               bool(group.checkOnlyByDefaultDeps),
+                               bool(group.checkPathConflicts)) ]
+    lines.extend(sorted('%s %d %d' % (_tupStr(x[0]), bool(x[1]), bool(x[2]))
+                        for x in group.iterTroveListInfo()))
+    lines.extend(sorted(sha1helper.sha1ToString(x)
+                        for x in childFingerprints))
+    return sha1helper.sha1String('\n'.join(lines))
+
+
+def _reuseGroupResult(group, cache, resultCache):
+    """
+        Fills in group from the trove last committed with the same
+        fingerprint, if that trove is still available and holds exactly
+        the troves recorded for it. Returns True if it was.
+    """
+    entry = resultCache.get(group.fingerprint)
+    if entry is None:
+        return False
+
+    troveTup, troveList, size, conflicts = entry
+    try:
+        if not cache.hasTroves([ troveTup ])[troveTup]:
+            return False
+        trv = cache.getTrove(withFiles = False, *troveTup)
+    except errors.ConaryError:
+        return False
+
+    # a build with different inputs may have been committed with that
+    # version since; groups built along with this one get the new version
+    # and aren't part of the recorded list
+    committed = set((childTup, isStrong, byDefault)
+                    for childTup, byDefault, isStrong
+                    in trv.iterTroveListInfo()
+                    if not (trove.troveIsGroup(childTup[0])
+                            and childTup[1] == troveTup[1]))
+    if committed != set(troveList):
+        return False
+
+    recorded = set(x[0] for x in troveList)
+    for childTup in group.iterTroveList():
+        if childTup not in recorded:
+            return False
+
+    for childTup, explicit, byDefault in troveList:
+        if (group.hasTrove(*childTup)
+                and (not explicit or group.troves[childTup][0])):
+            continue
+        group.addTrove(childTup, explicit, byDefault, [],
+                       reason=(ADD_REASON_REUSED, troveTup))
+
+    group.setSize(size)
+    group.pathConflicts = conflicts
+    log.info('Reusing results from %s=%s[%s]' % troveTup)
+    return True
+
+
 def buildGroups(recipeObj, cfg, repos, callback, troveCache=None):
     """
         Main function for finding, adding, and checking the troves requested
@@ -2074,10 +2363,26 @@ def buildGroups(recipeObj, cfg, repos, callback, troveCache=None):
         resolveSource = recipeObj._getSearchSource()
     groupsWithConflicts = {}
 
+    resultCache = None
+    fingerprints = {}
+    if getattr(cfg, 'groupResultCache', None):
+        resultCache = GroupResultCache(cfg.groupResultCache)
+
     newGroups = processAddAllDirectives(recipeObj, troveMap, cache, repos)
 
     groupList = _sortGroups(recipeObj.iterGroupList())
 
+    # fetch the deps, sizes and path hashes for everything the groups
+    # reference now, in a few large calls, instead of group by group
+    if hasattr(cache, 'prefetchTroveData'):
+        getDeps = bool([ x for x in groupList
+                         if x.autoResolve or x.depCheck ])
+        getPathHashes = bool([ x for x in groupList
+                               if x.checkPathConflicts ])
+        cache.prefetchTroveData(list(cache.iterReachableTroves(troveTupList)),
+                                getDeps = getDeps,
+                                getPathHashes = getPathHashes)
+
     unmatchedGlobalReplaceSpecs = set()
     for group in groupList:
         group.cache = cache
@@ -2116,13 +2421,24 @@ def buildGroups(recipeObj, cfg, repos, callback, troveCache=None):
         if group.isEmpty():
             raise CookError('%s has no troves in it' % group.name)
 
-        if group.autoResolve:
+        reused = False
+        if resultCache is not None:
+            group.fingerprint = groupFingerprint(group,
+                        recipeObj.getSearchFlavor(), labelPath,
+                        resolveSource.getSearchPath(),
+                        [ fingerprints.get(x[0]) for x in
+                          group.iterNewGroupList() ])
+            fingerprints[group.name] = group.fingerprint
+            if group.fingerprint is not None:
+                reused = _reuseGroupResult(group, cache, resultCache)
+
+        if group.autoResolve and not reused:
             callback.done()
             log.info('Resolving dependencies...')
             resolveGroupDependencies(group, cache, cfg,
                                      repos, labelPath, flavor, callback,
                                      resolveSource)
-        elif group.depCheck:
+        elif group.depCheck and not reused:
             callback.done()
             log.info('Checking for dependency closure...')
             failedDeps = checkGroupDependencies(group, cfg, cache, callback)
@@ -2133,9 +2449,13 @@ def buildGroups(recipeObj, cfg, repos, callback, troveCache=None):
         if isinstance(group, SingleGroup):
             checkForRedirects(group, repos, cache, cfg.buildFlavor)
 
-        callback.done()
-        log.info('Calculating size and checking hashes...')
-        conflicts = calcSizeAndCheckHashes(group, cache, callback)
+        if reused:
+            conflicts = group.pathConflicts
+        else:
+            callback.done()
+            log.info('Calculating size and checking hashes...')
+            conflicts = calcSizeAndCheckHashes(group, cache, callback)
+            group.pathConflicts = conflicts
 
         if conflicts:
             groupsWithConflicts[group.name] = conflicts
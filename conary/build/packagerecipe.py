@@ -528,6 +528,9 @@ class AbstractPackageRecipe(Recipe):
         self._componentReqs = {}
         self._componentProvs = {}
         self._derivedFiles = {} # used only for derived packages
+        # destdir path -> (st_ino, st_size, st_ctime, sha1) for files
+        # unpacked by addArchive
+        self._unpackedDigests = {}
         self.byDefaultIncludeSet = frozenset()
         self.byDefaultExcludeSet = frozenset()
         self._repos = None
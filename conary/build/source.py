@@ -31,7 +31,7 @@ import tempfile
 import stat
 import httplib
 
-from conary.lib import debugger, digestlib, log, magic, sha1helper
+from conary.lib import debugger, digestlib, extract, log, magic, sha1helper
 from conary import rpmhelper
 from conary.lib import openpgpfile, util
 from conary.build import action, errors, filter
@@ -661,6 +661,19 @@ class addArchive(_Source):
     def doDownload(self):
         return self._findSource()
 
+    # There are things we know we know...
+    _tarSuffix  = ['tar', 'tgz', 'tbz2', 'txz', 'taZ',
+                   'tar.gz', 'tar.bz2', '.tar.xz', 'tar.Z',
+                   'tar.lzo',
+                   ]
+    _cpioSuffix = ["cpio", "cpio.gz", "cpio.bz2"]
+
+    def _isTar(self, f):
+        return True in [f.endswith(x) for x in self._tarSuffix]
+
+    def _isCpio(self, f):
+        return True in [f.endswith(x) for x in self._cpioSuffix]
+
     @staticmethod
     def _cpioOwners(fullOutput):
         lines = fullOutput.split('\n')
@@ -681,6 +694,181 @@ class addArchive(_Source):
             owner, group = fields[1].split('/')
             yield (fields[5], owner, group)
 
+    def _extractInProcess(self, f, destDir, archiveType = None):
+        """
+        Unpacks zip archives, and tar and cpio archives which are either
+        uncompressed or compressed with gzip or bzip2, without running
+        any external tools. Returns a list of (path, user, group) tuples
+        for the archive's members, or None if the archive has to be
+        unpacked by L{_extractWithTools} instead.
+        """
+        destdir = self.recipe.macros.destdir
+        # only files unpacked into the destdir are packaged directly, so
+        # that is the only place their digests are useful
+        inDestDir = (destDir == destdir or destDir.startswith(destdir + '/'))
+        # matches the -p passed to tar by _extractWithTools
+        preserveModes = self.dir.startswith('/') or not self._isTar(f)
+        extractor = extract.ArchiveExtractor(destDir,
+                preserveModes = preserveModes, computeDigests = inDestDir)
+
+        try:
+            if archiveType == 'zip':
+                extractor.extractZip(f)
+            else:
+                fileObj = extract.openArchive(f)
+                if fileObj is None:
+                    return None
+                try:
+                    if self._isCpio(f):
+                        extractor.extractCpio(fileObj)
+                    elif (self._isTar(f) or
+                          isinstance(fileObj, extract.ReadAheadDecompressor)):
+                        # compressed archives which aren't obviously
+                        # anything else are assumed to be tar archives
+                        extractor.extractTar(fileObj)
+                    else:
+                        return None
+                finally:
+                    fileObj.close()
+        except extract.ExtractError, e:
+            log.debug('unpacking %s with external tools: %s',
+                      os.path.basename(f), e)
+            return None
+
+        if inDestDir:
+            prefix = destDir[len(destdir):]
+            for relPath, digest in extractor.digests.iteritems():
+                self.recipe._unpackedDigests[
+                        util.normpath(prefix + '/' + relPath)] = digest
+
+        return extractor.owners
+
+    def _extractWithTools(self, f, destDir):
+        """
+        Unpacks tar and cpio archives, including .deb files, by piping
+        them through the external compression and archive tools. Returns
+        a list of (path, user, group) tuples for the archive's members.
+        """
+        m = magic.magic(f)
+        _uncompress = "cat"
+        # command to run to get ownership info; if this isn't set, use
+        # stdout from the command
+        ownerListCmd = None
+        # function which parses the ownership string to get file ownership
+        # details
+        ownerParser = None
+
+        actionPathBuildRequires = []
+        # Question: can magic() ever get these wrong?!
+        if f.endswith('deb'):
+            # We want to use the normal tar processing so we can
+            # preserve ownership
+            if self.debArchive is None:
+                self.debArchive = 'data.tar'
+
+            # binutils is needed for ar
+            actionPathBuildRequires.append('ar')
+
+            # Need to determine how data is compressed
+            cfile = util.popen('ar t %s' %f)
+            debData = [ x.strip() for x in cfile.readlines()
+                        if x.startswith(self.debArchive) ]
+            cfile.close()
+            if not debData:
+                raise SourceError('no %s found in %s' %(self.debArchive, f))
+            debData = debData[0]
+
+            if debData.endswith('.gz'):
+                _uncompress = "gzip -d -c"
+                actionPathBuildRequires.append('gzip')
+            elif debData.endswith('.bz2'):
+                _uncompress = "bzip2 -d -c"
+                actionPathBuildRequires.append('bzip2')
+            elif debData.endswith('.xz'):
+                _uncompress = "xz -d -c"
+                actionPathBuildRequires.append('xz')
+            elif debData.endswith('.lzma'):
+                _uncompress = "xz -d -c"
+                actionPathBuildRequires.append('xz')
+            else:
+                # data.tar?  Alternatively, yet another
+                # compressed format that we need to add
+                # support for
+                _uncompress = 'cat'
+                actionPathBuildRequires.append('cat')
+
+        if isinstance(m, magic.bzip) or f.endswith("bz2"):
+            _uncompress = "bzip2 -d -c"
+            actionPathBuildRequires.append('bzip2')
+        if isinstance(m, magic.xz) or f.endswith('xz'):
+            _uncompress = 'xz -d -c'
+            actionPathBuildRequires.append('xz')
+        elif isinstance(m, magic.gzip) or f.endswith("gz") \
+               or f.endswith(".Z"):
+            _uncompress = "gzip -d -c"
+            actionPathBuildRequires.append('gzip')
+        elif isinstance(m, magic.lzo) or f.endswith(".lzo"):
+            _uncompress = "lzop -dcq"
+            actionPathBuildRequires.append('lzop')
+
+        if self._isTar(f):
+            preserve = ''
+            if self.dir.startswith('/'):
+                preserve = 'p'
+            _unpack = ("%(tar)s -C '%%s' -xvvS%%sf -"
+                    % self.recipe.macros % (destDir, preserve))
+            ownerParser = self._tarOwners
+            actionPathBuildRequires.append(self.recipe.macros.tar)
+        elif self._isCpio(f):
+            _unpack = "( cd '%s' && cpio -iumd --quiet )" % (destDir,)
+            ownerListCmd = "cpio -tv --quiet"
+            ownerParser = self._cpioOwners
+            actionPathBuildRequires.append('cpio')
+        elif _uncompress != 'cat':
+            # if we know we've got an archive, we'll default to
+            # assuming it's an archive of a tar for now
+            # TODO: do something smarter about the contents of the
+            # archive
+            # Note: .deb handling currently depends on this default
+            _unpack = (("%(tar)s -C '%%s' -xvvSpf -" % self.recipe.macros)
+                    % (destDir,))
+            ownerParser = self._tarOwners
+            actionPathBuildRequires.append('tar')
+        else:
+            raise SourceError, "unknown archive format: " + f
+
+        self._addActionPathBuildRequires(actionPathBuildRequires)
+        if f.endswith('.deb'):
+            # special handling for .deb files - need to put
+            # the .deb file on the command line
+            cmd = "ar p '%s' %s | %s | %s" %(
+                         f, debData, _uncompress, _unpack)
+        else:
+            cmd = "%s < '%s' | %s" % (_uncompress, f, _unpack)
+        fObj = os.popen(cmd)
+        s = fObj.read()
+        output = ""
+        while s:
+            output += s
+            s = fObj.read()
+
+        fObj.close()
+
+        if ownerListCmd:
+            cmd = "%s < '%s' | %s" % (_uncompress, f, ownerListCmd)
+            fObj = os.popen(cmd)
+            s = fObj.read()
+            output = ""
+            while s:
+                output += s
+                s = fObj.read()
+
+            fObj.close()
+
+        if ownerParser:
+            return list(ownerParser(output))
+        return []
+
     def do(self):
         f = self.doDownload()
         Ownership  = {}
@@ -717,8 +905,9 @@ class addArchive(_Source):
             if (self.preserveOwnership or self.preserveSetid or self.preserveDirectories):
                 raise SourceError('cannot preserveOwnership, preserveSetid, or preserveDirectories for xpi or zip archives')
 
-            util.execute("unzip -q -o -d '%s' '%s'" % (destDir, f))
-            self._addActionPathBuildRequires(['unzip'])
+            if self._extractInProcess(f, destDir, 'zip') is None:
+                util.execute("unzip -q -o -d '%s' '%s'" % (destDir, f))
+                self._addActionPathBuildRequires(['unzip'])
 
         elif f.endswith(".rpm"):
             if (self.preserveSetid or self.preserveDirectories):
@@ -743,133 +932,16 @@ class addArchive(_Source):
             _extractFilesFromISO(f, directory=destDir)
 
         else:
-            m = magic.magic(f)
-            _uncompress = "cat"
-            # command to run to get ownership info; if this isn't set, use
-            # stdout from the command
-            ownerListCmd = None
-            # function which parses the ownership string to get file ownership
-            # details
-            ownerParser = None
             ExcludeDirectories = []
+            owners = None
+            if not f.endswith('.deb'):
+                owners = self._extractInProcess(f, destDir)
+            if owners is None:
+                owners = self._extractWithTools(f, destDir)
 
-            actionPathBuildRequires = []
-            # Question: can magic() ever get these wrong?!
-            if f.endswith('deb'):
-                # We want to use the normal tar processing so we can
-                # preserve ownership
-                if self.debArchive is None:
-                    self.debArchive = 'data.tar'
-
-                # binutils is needed for ar
-                actionPathBuildRequires.append('ar')
-
-                # Need to determine how data is compressed
-                cfile = util.popen('ar t %s' %f)
-                debData = [ x.strip() for x in cfile.readlines()
-                            if x.startswith(self.debArchive) ]
-                cfile.close()
-                if not debData:
-                    raise SourceError('no %s found in %s' %(self.debArchive, f))
-                debData = debData[0]
-
-                if debData.endswith('.gz'):
-                    _uncompress = "gzip -d -c"
-                    actionPathBuildRequires.append('gzip')
-                elif debData.endswith('.bz2'):
-                    _uncompress = "bzip2 -d -c"
-                    actionPathBuildRequires.append('bzip2')
-                elif debData.endswith('.xz'):
-                    _uncompress = "xz -d -c"
-                    actionPathBuildRequires.append('xz')
-                elif debData.endswith('.lzma'):
-                    _uncompress = "xz -d -c"
-                    actionPathBuildRequires.append('xz')
-                else:
-                    # data.tar?  Alternatively, yet another
-                    # compressed format that we need to add
-                    # support for
-                    _uncompress = 'cat'
-                    actionPathBuildRequires.append('cat')
-
-            if isinstance(m, magic.bzip) or f.endswith("bz2"):
-                _uncompress = "bzip2 -d -c"
-                actionPathBuildRequires.append('bzip2')
-            if isinstance(m, magic.xz) or f.endswith('xz'):
-                _uncompress = 'xz -d -c'
-                actionPathBuildRequires.append('xz')
-            elif isinstance(m, magic.gzip) or f.endswith("gz") \
-                   or f.endswith(".Z"):
-                _uncompress = "gzip -d -c"
-                actionPathBuildRequires.append('gzip')
-            elif isinstance(m, magic.lzo) or f.endswith(".lzo"):
-                _uncompress = "lzop -dcq"
-                actionPathBuildRequires.append('lzop')
-
-            # There are things we know we know...
-            _tarSuffix  = ['tar', 'tgz', 'tbz2', 'txz', 'taZ',
-                           'tar.gz', 'tar.bz2', '.tar.xz', 'tar.Z',
-                           'tar.lzo',
-                           ]
-            _cpioSuffix = ["cpio", "cpio.gz", "cpio.bz2"]
-
-            if True in [f.endswith(x) for x in _tarSuffix]:
-                preserve = ''
-                if self.dir.startswith('/'):
-                    preserve = 'p'
-                _unpack = ("%(tar)s -C '%%s' -xvvS%%sf -"
-                        % self.recipe.macros % (destDir, preserve))
-                ownerParser = self._tarOwners
-                actionPathBuildRequires.append(self.recipe.macros.tar)
-            elif True in [f.endswith(x) for x in _cpioSuffix]:
-                _unpack = "( cd '%s' && cpio -iumd --quiet )" % (destDir,)
-                ownerListCmd = "cpio -tv --quiet"
-                ownerParser = self._cpioOwners
-                actionPathBuildRequires.append('cpio')
-            elif _uncompress != 'cat':
-                # if we know we've got an archive, we'll default to
-                # assuming it's an archive of a tar for now
-                # TODO: do something smarter about the contents of the
-                # archive
-                # Note: .deb handling currently depends on this default
-                _unpack = (("%(tar)s -C '%%s' -xvvSpf -" % self.recipe.macros)
-                        % (destDir,))
-                ownerParser = self._tarOwners
-                actionPathBuildRequires.append('tar')
-            else:
-                raise SourceError, "unknown archive format: " + f
-
-            self._addActionPathBuildRequires(actionPathBuildRequires)
-            if f.endswith('.deb'):
-                # special handling for .deb files - need to put
-                # the .deb file on the command line
-                cmd = "ar p '%s' %s | %s | %s" %(
-                             f, debData, _uncompress, _unpack)
-            else:
-                cmd = "%s < '%s' | %s" % (_uncompress, f, _unpack)
-            fObj = os.popen(cmd)
-            s = fObj.read()
-            output = ""
-            while s:
-                output += s
-                s = fObj.read()
-
-            fObj.close()
-
-            if ownerListCmd:
-                cmd = "%s < '%s' | %s" % (_uncompress, f, ownerListCmd)
-                fObj = os.popen(cmd)
-                s = fObj.read()
-                output = ""
-                while s:
-                    output += s
-                    s = fObj.read()
-
-                fObj.close()
-
-            if ownerParser and self.preserveOwnership:
+            if self.preserveOwnership:
                 destdir = self.recipe.macros.destdir
-                for (path, user, group) in ownerParser(output):
+                for (path, user, group) in owners:
                     if user != 'root' or group != 'root':
                         path = util.normpath(os.path.join(self.dir, path))
                         d = Ownership.setdefault((user, group),[])
@@ -21,7 +21,8 @@ Module implementing tag file handling
 import os
 
 from conary.build import filter
-from conary.lib.cfg import CfgEnum, CfgList, CfgString, ConfigFile, ParseError
+from conary.lib.cfg import CfgBool, CfgEnum, CfgList, CfgString, ConfigFile
+from conary.lib.cfg import ParseError
 from conary.lib.cfg import directive
 
 EXCLUDE, INCLUDE = range(2)
@@ -59,6 +60,10 @@ class TagFile(ConfigFile):
     description       = CfgString
     datasource        = (CfgDataSource, 'args')
     implements        = CfgImplements
+    # the handler may run at the same time as other concurrent handlers
+    concurrent        = (CfgBool, False)
+    # tags whose handlers have to finish before this one starts
+    after             = CfgList(CfgString)
 
     def __init__(self, filename, macros = {}, warn=False):
         ConfigFile.__init__(self)
@@ -419,6 +419,8 @@ class CookCommand(CvcCommand):
             'no-deps': optparse.SUPPRESS_HELP,
             'ignore-buildreqs' : 'do not check build requirements',
             'show-buildreqs': (VERBOSE_HELP,'show build requirements for recipe'),
+            'parallel-flavors' : 'build all requested flavors of a package'
+                        ' at the same time and commit them together',
             'prep'    : 'unpack, but do not build',
             'download': 'download, but do not unpack or build',
             'resume'  : ('resume building at given loc (default at failure)',
@@ -441,6 +443,7 @@ class CookCommand(CvcCommand):
         argDef['ignore-buildreqs'] = NO_PARAM
         argDef['show-buildreqs' ] = NO_PARAM
         argDef['prep'] = NO_PARAM
+        argDef['parallel-flavors'] = NO_PARAM
         argDef['download'] = NO_PARAM
         argDef['resume'] = STRICT_OPT_PARAM
         argDef['to-file'] = ONE_PARAM
@@ -498,6 +501,7 @@ class CookCommand(CvcCommand):
             downloadOnly = True
 
         showBuildReqs = argSet.pop('show-buildreqs', False)
+        parallelFlavors = argSet.pop('parallel-flavors', False)
 
         if argSet.has_key('quiet'):
             cfg.quiet = True
@@ -566,6 +570,7 @@ class CookCommand(CvcCommand):
                          crossCompile=crossCompile, downloadOnly=downloadOnly,
                          groupOptions=groupOptions,
                          changeSetFile=targetFile,
+                         parallelFlavors=parallelFlavors,
                          )
         except builderrors.GroupFlavorChangedError, err:
             err.args = (err.args[0] +
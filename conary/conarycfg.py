@@ -566,6 +566,8 @@ class ConaryContext(ConfigSection):
     buildPath             =  (CfgPath, '~/conary/builds')
     cleanAfterCook        =  (CfgBool, True)
     commitRelativeChangeset = (CfgBool, False)
+    compressThreads       =  (CfgInt, 0, "Number of threads used to "
+            "compress file contents of cooked packages; 0 uses one per CPU")
     componentDirs         =  (CfgPathList, ('/etc/conary/components',
                                             '/etc/conary/distro/components',
                                             '~/.conary/components'))
@@ -589,7 +591,12 @@ class ConaryContext(ConfigSection):
     flavorPreferences     =  CfgList(CfgFlavor)
     fullVersions          =  CfgBool
     fullFlavors           =  CfgBool
+    groupResultCache      =  (CfgPath, None, "Directory used to remember "
+            "the dependency resolution and path conflict results of cooked "
+            "groups so unchanged groups can reuse them; unset disables it")
     localRollbacks        =  CfgBool
+    lowMemoryUpdates      =  (CfgBool, False, "Keep the troves used while "
+            "planning an update in a temporary file instead of in memory")
     keepRequired          =  CfgBool
     ignoreDependencies    =  (CfgDependencyClassList,
                               [ deps.AbiDependency, deps.RpmLibDependencies])
@@ -604,6 +611,10 @@ class ConaryContext(ConfigSection):
                                             '/etc/conary/mirrors',))
     modelPath             =  '/etc/conary/system-model'
     name                  =  None
+    queryCache            =  (CfgPath, None, "Directory used to remember "
+            "the results of label queries and dependency lookups between "
+            "runs; they are reused while the repository reports no changes "
+            "to their labels. Unset disables it")
     quiet                 =  CfgBool
     pinTroves             =  CfgRegExpList
     policyDirs            =  (CfgPathList, ('/usr/lib/conary/policy',
@@ -611,6 +622,9 @@ class ConaryContext(ConfigSection):
                                             '/etc/conary/policy',
                                             '~/.conary/policy'))
     shortenGroupFlavors   =  CfgBool
+    signatureCache        =  (CfgPath, None, "File used to remember which "
+            "trove signatures verified, so later runs don't verify them "
+            "again; unset disables it")
     syncCapsuleDatabase   =  (CfgCapsuleSync, 'update')
     # Upstream Conary proxy
     conaryProxy           =  CfgProxy
@@ -641,6 +655,12 @@ class ConaryContext(ConfigSection):
     factoryTemplate       =  None
     repositoryMap         =  CfgRepoMap
     resolveLevel          =  (CfgInt, 2)
+    rollbackRetainCount   =  (CfgInt, None, "Number of rollbacks to keep; "
+            "older rollbacks are removed after each update. Unset keeps "
+            "them all")
+    rollbackRetainSize    =  (CfgInt, None, "Space, in megabytes, the "
+            "rollbacks may use; older rollbacks are removed after each "
+            "update. Unset keeps them all")
     root                  =  (CfgPath, '/')
     recipeTemplateDirs    =  (CfgPathList, ('~/.conary/recipeTemplates',
                                             '/etc/conary/recipeTemplates'))
@@ -653,6 +673,9 @@ class ConaryContext(ConfigSection):
                                             '/etc/conary/distro/site',
                                             '~/.conary/site'))
     sourceSearchDir       =  (CfgPath, '.')
+    streamingApply        =  (CfgBool, False, "Start applying each "
+            "changeset as soon as its trove information has been "
+            "downloaded, writing files as their contents arrive")
     threaded              =  (CfgBool, True)
     downloadFirst         =  (CfgBool, False)
     tmpDir                =  (CfgPath, _getDefaultTempDir())
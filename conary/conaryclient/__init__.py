@@ -104,6 +104,8 @@ class ConaryClient(ClientClone, ClientBranch, ClientUpdate, ClientNewTrove,
         # Set up the callbacks for the PGP key cache
         keyCache = openpgpkey.getKeyCache()
         keyCache.setPublicPath(cfg.pubRing)
+        if cfg.signatureCache:
+            keyCache.setSignatureCachePath(cfg.signatureCache)
         keyCacheCallback = openpgpkey.KeyCacheCallback(self.repos,
                                                        cfg)
         keyCache.setCallback(keyCacheCallback)
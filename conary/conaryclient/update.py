@@ -2670,8 +2670,12 @@ conary erase '%s=%s[%s]'
         @rtype: L{database.UpdateJob}
         @return: the new update job
         """
+        spillDir = None
+        if self.cfg.lowMemoryUpdates:
+            spillDir = self.cfg.tmpDir
         updJob = database.UpdateJob(self.db, lazyCache = self.lzCache,
-                                    closeDatabase = closeDatabase)
+                                    closeDatabase = closeDatabase,
+                                    spillDir = spillDir)
         return updJob
 
     @api.publicApi
@@ -3251,7 +3255,8 @@ conary erase '%s=%s[%s]'
                 # Replace the trove source with one that can store
                 # dependencies
                 troveSource = trovesource.ChangesetFilesTroveSource(self.db,
-                                                             storeDeps=True)
+                                    storeDeps=True,
+                                    spillDir=uJob.troveSource.spillDir)
                 uJob.troveSource = troveSource
                 first = False
             troveSource.addChangeSet(changeSet, includesFileContents = incFConts)
@@ -3492,7 +3497,7 @@ conary erase '%s=%s[%s]'
                               + '\n    '.join('%s=%s[%s]' % ((x[0],) + x[1])
                                               for x in sorted(extraTroves)))
 
-    def _createCs(self, repos, db, jobSet, uJob):
+    def _createCs(self, repos, db, jobSet, uJob, streaming = False):
         baseCs = changeset.ReadOnlyChangeSet()
 
         cs, remainder = uJob.getTroveSource().createChangeSet(jobSet,
@@ -3501,8 +3506,14 @@ conary erase '%s=%s[%s]'
                                     useDatabase = False)
         baseCs.merge(cs)
         if remainder:
+            kwargs = {}
+            if streaming:
+                # file contents keep arriving while the changeset is
+                # applied
+                kwargs['streaming'] = True
             newCs = repos.createChangeSet(remainder, recurse = False,
-                                          callback = self.updateCallback)
+                                          callback = self.updateCallback,
+                                          **kwargs)
             baseCs.merge(newCs)
 
         self._replaceIncomplete(baseCs, db, db, repos)
@@ -3561,7 +3572,8 @@ conary erase '%s=%s[%s]'
 
             self.updateCallback.setChangesetHunk(i + 1, len(allJobs))
             try:
-                newCs = self._createCs(repos, db, job, uJob)
+                newCs = self._createCs(repos, db, job, uJob,
+                                       streaming = cfg.streamingApply)
             except:
                 q.put((True, sys.exc_info()))
                 return
@@ -3667,11 +3679,30 @@ conary erase '%s=%s[%s]'
         # Calls _applyUpdateL, but deals with locks too
         try:
             self.db.commitLock(True)
-            return self._applyUpdateL(*args, **kwargs)
+            rc = self._applyUpdateL(*args, **kwargs)
+            commitFlags = kwargs.get('commitFlags')
+            if commitFlags is None or not commitFlags.test:
+                self._pruneRollbacks()
+            return rc
         finally:
             self.db.commitLock(False)
             self.db.close()
 
+    def _pruneRollbacks(self):
+        maxCount = self.cfg.rollbackRetainCount
+        maxSize = self.cfg.rollbackRetainSize
+        if maxCount is None and maxSize is None:
+            return
+
+        rollbackStack = self.db.getRollbackStack()
+        if rollbackStack is None:
+            return
+
+        if maxSize is not None:
+            maxSize *= 1024 * 1024
+
+        rollbackStack.prune(maxCount = maxCount, maxSize = maxSize)
+
     def _applyUpdateL(self, uJob, tagScript = None, journal = None,
                      callback = None, autoPinList = None,
                      commitFlags = None):
@@ -3726,7 +3757,8 @@ conary erase '%s=%s[%s]'
             # this handles change sets which include change set files
             # if we have the job already downloaded, skip this
             self.updateCallback.setChangesetHunk(0, 0)
-            newCs = self._createCs(self.repos, self.db, allJobs[0], uJob)
+            newCs = self._createCs(self.repos, self.db, allJobs[0], uJob,
+                                   streaming = self.cfg.streamingApply)
             self.updateCallback.setUpdateHunk(0, 0)
             self.updateCallback.setUpdateJob(allJobs[0])
             kwargs['jobIdx'] = 0
@@ -3761,7 +3793,8 @@ conary erase '%s=%s[%s]'
             else:
                 for i, job in enumerate(allJobs):
                     self.updateCallback.setChangesetHunk(i + 1, len(allJobs))
-                    newCs = self._createCs(self.repos, self.db, job, uJob)
+                    newCs = self._createCs(self.repos, self.db, job, uJob,
+                                        streaming = self.cfg.streamingApply)
                     _applyCs(job, newCs, i, len(allJobs))
             if self.getRepos():
                 self.getRepos()._clearHostCache()
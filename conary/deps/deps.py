@@ -17,6 +17,7 @@
 
 import itertools
 import re
+import threading
 import weakref
 from conary.lib import api
 from conary.lib.ext import dep_freeze
@@ -835,7 +836,7 @@ def UnknownDependencyFactory(intTag):
 
 class DependencySet(object):
 
-    __slots__ = ( '_members', '_hash' )
+    __slots__ = ( '_members', '_hash', '__weakref__' )
 
     def _getMembers(self):
         m = self._members
@@ -951,15 +952,16 @@ class DependencySet(object):
             return
 
         i = 0
-        a = self.addDep
+        # not self.addDep, which shared (read-only) sets don't allow
+        a = DependencySet.addDep
         depSetSplit = dep_freeze.depSetSplit
         while i < len(frz):
             (i, tag, frozen) = depSetSplit(i, frz)
             depClass = dependencyClasses[tag]
-            a(depClass, depClass.thawDependency(frozen))
+            a(self, depClass, depClass.thawDependency(frozen))
 
     def copy(self):
-        new = self.__class__()
+        new = self._baseClass()
         if type(self._members) == str:
             new.thaw(self._members)
         else:
@@ -980,8 +982,8 @@ class DependencySet(object):
     def union(self, other, mergeType = DEP_MERGE_TYPE_NORMAL):
         if other is None:
             return
-        assert(isinstance(other, self.__class__)
-                or isinstance(self, other.__class__))
+        assert(isinstance(other, self._baseClass)
+                or isinstance(self, other._baseClass))
         self._hash = None
         a = self.addDep
         for tag, members in other.members.iteritems():
@@ -1001,7 +1003,7 @@ class DependencySet(object):
 
     def intersection(self, other, strict=True):
         assert(hasattr(other, '_members'))
-        newDep = self.__class__()
+        newDep = self._baseClass()
         for tag, depClass in self.members.iteritems():
             if tag in other.members:
                 dep = depClass.intersection(other.members[tag], strict=strict)
@@ -1014,9 +1016,9 @@ class DependencySet(object):
         return self.intersection(other)
 
     def difference(self, other, strict=True):
-        assert(isinstance(other, self.__class__)
-               or isinstance(self, other.__class__))
-        newDep = self.__class__()
+        assert(isinstance(other, self._baseClass)
+               or isinstance(self, other._baseClass))
+        newDep = self._baseClass()
         a = newDep.addDep
         for tag, depClass in self.members.iteritems():
             c = depClass.__class__
@@ -1058,6 +1060,8 @@ class DependencySet(object):
         return self.score(other) is not False
 
     def __eq__(self, other, skipSet = None):
+        if self is other:
+            return True
         if other is None:
             return False
         # No much sense in comparing stuff that is not the same class as ours;
@@ -1162,6 +1166,9 @@ class DependencySet(object):
 
     thaw = __init__
 
+    # class of the new objects copy() and friends return
+    _baseClass = property(lambda self: self.__class__)
+
 
 # A special class for representing Flavors
 class Flavor(DependencySet):
@@ -1177,7 +1184,7 @@ class Flavor(DependencySet):
 
     @api.developerApi
     def toStrongFlavor(self):
-        newDep = self.__class__()
+        newDep = self._baseClass()
         for tag, depClass in self.members.iteritems():
             newDep.members[tag] = depClass.toStrongFlavor()
         return newDep
@@ -1187,6 +1194,33 @@ class Flavor(DependencySet):
         return self.toStrongFlavor().score(
                     other.toStrongFlavor()) is not False
 
+class _SharedDependencySet(object):
+    """
+    Makes the dependency sets handed out by ThawSharedDependencySet()
+    and ThawSharedFlavor() read-only, as everyone who thawed the same
+    frozen form holds the same object. copy() (and pickling) returns a
+    plain DependencySet or Flavor which can be modified.
+    """
+    __slots__ = ()
+
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError('shared %s objects can not be modified; use copy()'
+                        % self._baseClass.__name__)
+
+    addDep = addDeps = removeDeps = removeDepsByClass = addEmptyDepClass = \
+            union = thaw = _readOnly
+
+    def __reduce__(self):
+        return (self._baseClass, (self.freeze(),))
+
+class SharedDependencySet(_SharedDependencySet, DependencySet):
+    __slots__ = ()
+    _baseClass = DependencySet
+
+class SharedFlavor(_SharedDependencySet, Flavor):
+    __slots__ = ()
+    _baseClass = Flavor
+
 def ThawDependencySet(frz):
     return DependencySet(frz)
 
@@ -1208,6 +1242,39 @@ def ThawFlavor(frz):
     f.thaw(frz)
     return f
 
+def _thawShared(cls, frz):
+    key = (cls, frz)
+    depSet = sharedDepSetCache.get(key, None)
+    if depSet is None:
+        depSet = cls(frz)
+        # the frozen form is kept and the hash is computed up front, so
+        # comparing and hashing shared objects never thaws them
+        hash(depSet)
+        sharedDepSetCache[key] = depSet
+
+    return depSet
+
+def ThawSharedDependencySet(frz):
+    """
+    Like ThawDependencySet(), but returns the same read-only object for
+    every caller thawing the same frozen dependency set. Use copy() to
+    get one which can be modified.
+    """
+    return _thawShared(SharedDependencySet, frz)
+
+def ThawSharedFlavor(frz):
+    """
+    Like ThawFlavor(), but returns the same read-only object for every
+    caller thawing the same frozen flavor. Use copy() to get one which
+    can be modified.
+    """
+    if isinstance(frz, unicode):
+        try:
+            frz = frz.encode("ascii")
+        except UnicodeEncodeError:
+            raise ParseError, ("invalid characters in flavor '%s'" % frz)
+    return _thawShared(SharedFlavor, frz)
+
 @api.developerApi
 def overrideFlavor(oldFlavor, newFlavor, mergeType=DEP_MERGE_TYPE_OVERRIDE):
     """
@@ -1812,6 +1879,12 @@ def getShortFlavorDescriptors(flavors):
 
 
 class DependencyMatcher(object):
+    """
+    Index of the dependencies provided by a collection of items, used to
+    find which items satisfy the dependencies in a set. Providers are kept
+    by dependency class and name, with their flags in a set, and the
+    lookups are done by dep_freeze on the frozen form of each set.
+    """
 
     def __init__(self, ignoreDepClasses=()):
         self.ignoreDepClasses = set()
@@ -1825,64 +1898,197 @@ class DependencyMatcher(object):
         for depClassId, depName, depFlags in depSet.iterRawDeps():
             if depClassId in self.ignoreDepClasses:
                 continue
-            depValue = (depClassId, depFlags, data)
-            values = self.depMap.get(depName)
+            depValue = (frozenset(depFlags), data)
+            key = (depClassId, depName)
+            values = self.depMap.get(key)
             if values is not None:
                 values.append(depValue)
             else:
-                self.depMap[depName] = [depValue]
+                self.depMap[key] = [depValue]
 
     def find(self, depSet):
-        setMatches = []
-        for depClassId, depName, depFlags in depSet.iterRawDeps():
-            depMatches = []
-            for provClassId, provFlags, provData in self.depMap.get(depName, ()):
-                if provClassId != depClassId:
-                    continue
-                if provFlags == depFlags:
-                    depMatches.append(provData)
-                    continue
-                for depFlag in depFlags:
-                    assert depFlag[0] not in '~!'
-                    if depFlag not in provFlags:
-                        break
-                else:
-                    depMatches.append(provData)
-            setMatches.append(depMatches)
-        return setMatches
+        """
+        Returns a list with an entry for each dependency in depSet, in
+        frozen (sorted) order. Each entry is the list of data for the
+        providers which satisfy that dependency.
+        """
+        return dep_freeze.depSetMatch(self.depMap, depSet.freeze())
+
+    def findAll(self, depSets):
+        """
+        Like find(), for each of a list of dependency sets.
+        """
+        depSetMatch = dep_freeze.depSetMatch
+        depMap = self.depMap
+        return [ depSetMatch(depMap, x.freeze()) for x in depSets ]
 
     def check(self, depSet):
-        unsatisfied = None
-        for depClassId, depName, depFlags in depSet.iterRawDeps():
-            if depClassId in self.ignoreDepClasses:
-                continue
-            found = False
-            for provClassId, provFlags, provData in self.depMap.get(depName, ()):
-                if provClassId != depClassId:
-                    continue
-                if provFlags == depFlags:
-                    found = True
-                    break
-                for depFlag in depFlags:
-                    assert depFlag[0] not in '~!'
-                    if depFlag not in provFlags:
-                        break
-                else:
-                    found = True
-                    break
-            if not found:
-                if unsatisfied is None:
-                    unsatisfied = DependencySet()
-                depClass = dependencyClasses[depClassId]
-                dep = DependencyClass.thawRawDep(depName, depFlags)
-                unsatisfied.addDep(depClass, dep)
+        """
+        Returns a DependencySet of the dependencies in depSet which
+        nothing provides, or None if everything is provided.
+        """
+        unmatched = dep_freeze.depSetUnmatched(self.depMap, depSet.freeze(),
+                                               self.ignoreDepClasses)
+        if not unmatched:
+            return None
+
+        unsatisfied = DependencySet()
+        for depClassId, depName, depFlags in unmatched:
+            depClass = dependencyClasses[depClassId]
+            dep = DependencyClass.thawRawDep(depName, depFlags)
+            unsatisfied.addDep(depClass, dep)
         return unsatisfied
 
+    def checkAll(self, depSets):
+        """
+        Like check(), for each of a list of dependency sets.
+        """
+        return [ self.check(x) for x in depSets ]
+
     def clear(self):
         self.depMap.clear()
 
+def _flagBit(key):
+    bit = _flagBits.get(key)
+    if bit is None:
+        bit = 1 << len(_flagBits)
+        _flagBits[key] = bit
+    return bit
+
+def _compileFlavor(flavor):
+    """
+    Returns the bitmask form of a flavor used by scoreFlavors(), or None
+    if the flavor has to be scored by DependencySet.score() instead.
+    Every dependency and every dependency flag gets its own bit; the
+    result is (depMask, neededMask, senseMasks, sigCount, table), where
+    table is what scoring other flavors against this one needs.
+
+    Must be called with _compileLock held, as the bits are only
+    meaningful until the tables are next reset.
+    """
+    key = flavor.freeze()
+    if key in compiledFlavorCache:
+        return compiledFlavorCache[key]
+
+    depMask = neededMask = 0
+    senseMasks = [ 0 ] * (FLAG_SENSE_DISALLOWED + 1)
+    sigCount = 0
+    for tag, depClass in flavor.members.iteritems():
+        significant = depClass.depNameSignificant
+        if not significant and len(depClass.members) > 1:
+            # DependencyClass.emptyDepsScore() scores only one dep of
+            # classes like this
+            compiled = None
+            break
+
+        for dep in depClass.members.itervalues():
+            bit = _flagBit((tag, dep.name))
+            depMask |= bit
+            if significant:
+                sigCount += 1
+                neededMask |= bit
+            elif not dep.flags:
+                neededMask |= bit
+
+            for flag, sense in dep.flags.iteritems():
+                senseMasks[sense] |= _flagBit((tag, dep.name, flag))
+    else:
+        if senseMasks[FLAG_SENSE_UNSPECIFIED]:
+            compiled = None
+        else:
+            allMask = 0
+            for mask in senseMasks:
+                allMask |= mask
+
+            # for each sense a required flag can have, the flags of this
+            # flavor which make it fail to match and the ones which add
+            # to the score
+            table = []
+            for reqSense, pairs in _flavorScoreTable:
+                conflicts = 0
+                weights = []
+                for sysSense, thisScore in pairs:
+                    if sysSense == FLAG_SENSE_UNSPECIFIED:
+                        mask = ~allMask
+                    else:
+                        mask = senseMasks[sysSense]
+                    if thisScore is None:
+                        conflicts |= mask
+                    elif mask:
+                        weights.append((mask, thisScore))
+                table.append((reqSense, conflicts, weights))
+
+            compiled = (depMask, neededMask, tuple(senseMasks), sigCount,
+                        table)
+
+    compiledFlavorCache[key] = compiled
+    return compiled
+
+def scoreFlavors(system, flavors):
+    """
+    Scores a list of flavors against a single system flavor, returning
+    the same list of results [ system.score(x) for x in flavors ] would.
+    Compiled forms of the flavors are cached, so scoring the same flavors
+    repeatedly is cheap.
+    """
+    _compileLock.acquire()
+    try:
+        # bits are never reassigned while flavors compiled with them
+        # are in use, so the tables are only reset between calls
+        if (len(_flagBits) > MAX_FLAG_BITS or
+                len(compiledFlavorCache) > MAX_COMPILED_FLAVORS):
+            _flagBits.clear()
+            compiledFlavorCache.clear()
+        return _scoreFlavors(system, flavors)
+    finally:
+        _compileLock.release()
+
+def _scoreFlavors(system, flavors):
+    compiledSystem = _compileFlavor(system)
+    if compiledSystem is None:
+        return [ system.score(x) for x in flavors ]
+
+    missing = ~compiledSystem[0]
+    table = compiledSystem[4]
+
+    scores = []
+    for flavor in flavors:
+        compiled = _compileFlavor(flavor)
+        if compiled is None:
+            scores.append(system.score(flavor))
+            continue
+
+        _, needed, reqSenses, score, _ = compiled
+        if needed & missing:
+            scores.append(False)
+            continue
+
+        for reqSense, conflicts, weights in table:
+            reqMask = reqSenses[reqSense]
+            if not reqMask:
+                continue
+            if reqMask & conflicts:
+                score = False
+                break
+            for mask, thisScore in weights:
+                mask &= reqMask
+                if mask:
+                    score += thisScore * bin(mask).count('1')
+
+        scores.append(score)
+
+    return scores
+
 
 dependencyCache = weakref.WeakValueDictionary()
+sharedDepSetCache = weakref.WeakValueDictionary()
+# frozen flavor -> compiled form, and (tag, name[, flag]) -> bit, for
+# scoreFlavors(); both are reset together once either gets this big
+compiledFlavorCache = {}
+_flagBits = {}
+_compileLock = threading.Lock()
+MAX_COMPILED_FLAVORS = 10000
+MAX_FLAG_BITS = 4096
 
 ident = '(?:[0-9A-Za-z_-]+)'
 flag = '(?:~?!?IDENT)'
@@ -1953,3 +2159,15 @@ flavorScores = {
       (FLAG_SENSE_PREFERNOT,   FLAG_SENSE_PREFERRED) :   -1,
       (FLAG_SENSE_PREFERNOT,   FLAG_SENSE_PREFERNOT) :    1
 }
+
+# flavorScores grouped by the sense of the required flag, for
+# scoreFlavors() (through _compileFlavor()); pairs which always score zero
+# are dropped
+_flavorScoreTable = []
+for _reqSense in (FLAG_SENSE_REQUIRED, FLAG_SENSE_PREFERRED,
+                  FLAG_SENSE_PREFERNOT, FLAG_SENSE_DISALLOWED):
+    _flavorScoreTable.append((_reqSense,
+        [ (_sysSense, _score) for (_sysSense, _r), _score
+                in sorted(flavorScores.iteritems())
+                if _r == _reqSense and _score != 0 ]))
+del _reqSense, _sysSense, _r, _score
@@ -286,6 +286,9 @@ class File(streams.StreamSet):
     hasContents = False
     skipChmod = False
     ignoreUnknown = streams.PRESERVE_UNKNOWN
+    # files are thawed by the million and most callers only look at one or
+    # two of their streams; the rest are thawed when they're first used
+    lazyThaw = True
     streamDict = {
         FILE_STREAM_INODE    : (SMALL, InodeStream, "inode"),
         FILE_STREAM_FLAGS    : (SMALL, FlagsStream, "flags"),
@@ -653,7 +656,7 @@ class RegularFile(File):
         File.__init__(self, *args, **kargs)
 
 def FileFromFilesystem(path, pathId, possibleMatch = None, inodeInfo = False,
-        assumeRoot=False, statBuf=None, sha1FailOk=False):
+        assumeRoot=False, statBuf=None, sha1FailOk=False, knownSha1=None):
     if statBuf:
         s = statBuf
     else:
@@ -765,6 +768,10 @@ def FileFromFilesystem(path, pathId, possibleMatch = None, inodeInfo = False,
             prelink.wait()
             f.contents.size.set(size)
             sha1 = d.digest()
+        elif knownSha1 is not None:
+            # the caller already has the contents checksummed
+            sha1 = knownSha1
+            f.contents.size.set(s.st_size)
         else:
             try:
                 sha1 = sha1helper.sha1FileBin(path)
@@ -39,6 +39,8 @@ import struct
 import sys
 import errno
 
+from conary.lib import threadpool
+
 class Error(Exception):
     "Base exception"
 
@@ -57,6 +59,9 @@ class ShortReadError(Exception):
 class OutOfOrderRead(Exception):
     "Read out of order"
 
+class DigestMismatchError(Error):
+    "File contents do not match the expected digest"
+
 class CpioHeader(object):
     __slots__ = [
         'magic',
@@ -214,65 +219,138 @@ class CpioStream(object):
         return buf
 
 class CpioExploder(CpioStream):
-
-    def explode(self, destDir):
-        linkMap = {}
-        for ent in self:
-            try:
-                target = destDir + '/' + ent.filename
-
-                parent = os.path.dirname(target)
-                if not os.path.exists(parent):
-                    os.makedirs(parent)
-
-                if stat.S_ISCHR(ent.header.mode):
-                    os.mknod(target, stat.S_IFCHR,
-                             os.makedev(ent.rdevmajor, ent.rdevminor))
-                elif stat.S_ISBLK(ent.header.mode):
-                    os.mknod(target, stat.S_IFBLK,
-                             os.makedev(ent.rdevmajor, ent.rdevminor))
-                elif stat.S_ISDIR(ent.header.mode):
-                    os.mkdir(target)
-                elif stat.S_ISFIFO(ent.header.mode):
-                    os.mkfifo(target)
-                elif stat.S_ISLNK(ent.header.mode):
-                    os.symlink(ent.payload.read(),target)
-                elif stat.S_ISREG(ent.header.mode):
-                    # save hardlinks until after the file content is written
-                    if ent.header.nlink > 1 and ent.header.filesize == 0:
-                        l = linkMap.get(ent.header.inode, [])
-                        l.append(target)
-                        linkMap[ent.header.inode] = l
+    """
+    Writes the contents of a cpio stream into a directory. The stream is
+    read (and decompressed) once, in order, by the calling thread, which
+    also creates directories, links and device nodes. Regular files are
+    written out by a pool of threads.
+    """
+
+    # regular files larger than this are written by the reading thread
+    # instead of being held in memory for a writer thread
+    maxBufferedSize = 1024 * 1024
+
+    def _writeFile(self, (target, mode, contents, digest)):
+        f = open(target, "w")
+        f.write(contents)
+        f.close()
+        if digest:
+            self._checkDigest(target, contents, digest)
+        os.chmod(target, mode & 0777)
+
+    @staticmethod
+    def _checkDigest(target, contents, (digestClass, expected)):
+        if isinstance(contents, str):
+            contents = digestClass(contents)
+        if contents.hexdigest() != expected:
+            raise DigestMismatchError(target)
+
+    def explode(self, destDir, digests = None, numThreads = None):
+        """
+        @param digests: expected digests of regular files, keyed by path
+        relative to destDir (with a leading /); each value is a
+        (digest class, hex digest) tuple. Files are checked as they are
+        written, and DigestMismatchError is raised for the first one which
+        doesn't match.
+        @type digests: dict
+        @param numThreads: number of threads writing regular files; see
+        L{threadpool.imap}
+        @type numThreads: int
+        """
+        if digests is None:
+            digests = {}
+        # (content target, hardlink targets) pairs, linked once every
+        # file has been written
+        links = []
+
+        def _entries():
+            linkMap = {}
+            for ent in self:
+                try:
+                    target = destDir + '/' + ent.filename
+
+                    parent = os.path.dirname(target)
+                    if not os.path.exists(parent):
+                        os.makedirs(parent)
+
+                    if stat.S_ISCHR(ent.header.mode):
+                        os.mknod(target, stat.S_IFCHR,
+                                 os.makedev(ent.header.rdevmajor,
+                                            ent.header.rdevminor))
+                    elif stat.S_ISBLK(ent.header.mode):
+                        os.mknod(target, stat.S_IFBLK,
+                                 os.makedev(ent.header.rdevmajor,
+                                            ent.header.rdevminor))
+                    elif stat.S_ISDIR(ent.header.mode):
+                        os.mkdir(target)
+                    elif stat.S_ISFIFO(ent.header.mode):
+                        os.mkfifo(target)
+                    elif stat.S_ISLNK(ent.header.mode):
+                        os.symlink(ent.payload.read(),target)
+                    elif stat.S_ISREG(ent.header.mode):
+                        # save hardlinks until after the file content is
+                        # written
+                        if ent.header.nlink > 1 and ent.header.filesize == 0:
+                            l = linkMap.get(ent.header.inode, [])
+                            l.append(target)
+                            linkMap[ent.header.inode] = l
+                            continue
+
+                        path = ent.filename
+                        if path.startswith('.'):
+                            path = path[1:]
+                        if not path.startswith('/'):
+                            path = '/' + path
+                        digest = digests.get(path)
+                        if ent.header.filesize <= self.maxBufferedSize:
+                            yield (target, ent.header.mode,
+                                   ent.payload.read(), digest)
+                        else:
+                            if digest:
+                                d = digest[0]()
+                            f = open(target, "w")
+                            buf = ent.payload.read(64 * 1024)
+                            while buf:
+                                f.write(buf)
+                                if digest:
+                                    d.update(buf)
+                                buf = ent.payload.read(64 * 1024)
+                            f.close()
+                            if digest:
+                                self._checkDigest(target, d, digest)
+                            os.chmod(target, ent.header.mode & 0777)
+
+                        if ent.header.nlink > 1 and ent.header.filesize:
+                            # the last entry with the same inode should
+                            # contain the contents so this list should always
+                            # have at least one entry
+                            l = linkMap.get(ent.header.inode, [])
+                            assert(l)
+                            links.append((target, l))
                         continue
-
-                    f = open(target, "w")
-                    buf = ent.payload.read(64 * 1024)
-                    while buf:
-                        f.write(buf)
-                        buf = ent.payload.read(64 * 1024)
-                    f.close()
-                else:
-                    raise Error("unknown file mode 0%o for %s"
-                                % (ent.header.mode, ent.filename))
-
-                # create hardlinks after the file content is written
-                if ent.header.nlink > 1 and ent.header.filesize:
-                    l = linkMap.get(ent.header.inode, [])
-                    # the last entry with the same inode should contain the
-                    # contents so this list should always have at least one
-                    # entry
-                    assert(l)
-                    for t in l:
-                        os.link(target, t)
-                # create hardlinks after the file content is written
-
-            except OSError, e:
-                if e.errno == errno.EEXIST:
-                    pass
-                else:
-                    raise
-            if not stat.S_ISLNK(ent.header.mode):
-                os.chmod(target, ent.header.mode & 0777)
+                    else:
+                        raise Error("unknown file mode 0%o for %s"
+                                    % (ent.header.mode, ent.filename))
+                except OSError, e:
+                    if e.errno == errno.EEXIST:
+                        pass
+                    else:
+                        raise
+                if not stat.S_ISLNK(ent.header.mode):
+                    os.chmod(target, ent.header.mode & 0777)
+
+        for x in threadpool.imap(self._writeFile, _entries(),
+                                 numThreads = numThreads):
+            pass
+
+        # create hardlinks after the file content is written
+        for target, l in links:
+            for t in l:
+                try:
+                    os.link(target, t)
+                except OSError, e:
+                    if e.errno != errno.EEXIST:
+                        raise
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,88 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Modular exponentiation using libgmp, for use when pycrypto was built
+without its own GMP support. powm is None if libgmp can't be loaded, and
+callers should fall back to the builtin pow().
+"""
+
+import ctypes
+import ctypes.util
+
+
+# mpz_t is { int, int, pointer }; leave room for any padding
+_MPZ_SIZE = 32
+
+
+def _load():
+    name = ctypes.util.find_library('gmp')
+    for name in (name, 'libgmp.so.10', 'libgmp.so.3'):
+        if not name:
+            continue
+        try:
+            return ctypes.CDLL(name)
+        except OSError:
+            pass
+    return None
+
+
+_gmp = _load()
+if _gmp is not None:
+    # the mpz_* names are macros for these
+    _mpz_init = _gmp['__gmpz_init']
+    _mpz_init_set_str = _gmp['__gmpz_init_set_str']
+    _mpz_clear = _gmp['__gmpz_clear']
+    _mpz_powm = _gmp['__gmpz_powm']
+    _mpz_sizeinbase = _gmp['__gmpz_sizeinbase']
+    _mpz_sizeinbase.restype = ctypes.c_size_t
+    _mpz_get_str = _gmp['__gmpz_get_str']
+    _mpz_get_str.restype = ctypes.c_char_p
+
+
+class _Mpz(object):
+    __slots__ = ('buf',)
+
+    def __init__(self, value=None):
+        self.buf = ctypes.create_string_buffer(_MPZ_SIZE)
+        if value is None:
+            _mpz_init(self.buf)
+        else:
+            _mpz_init_set_str(self.buf, '%x' % value, 16)
+
+    def __del__(self):
+        _mpz_clear(self.buf)
+
+    def value(self):
+        out = ctypes.create_string_buffer(_mpz_sizeinbase(self.buf, 16) + 2)
+        _mpz_get_str(out, 16, self.buf)
+        return long(out.value, 16)
+
+
+def _powm(base, exp, mod):
+    if base < 0 or exp < 0 or mod <= 0:
+        return pow(base, exp, mod)
+    # keep a reference to each _Mpz until the call returns; dropping one
+    # frees its limbs
+    result, base, exp, mod = _Mpz(), _Mpz(base), _Mpz(exp), _Mpz(mod)
+    _mpz_powm(result.buf, base.buf, exp.buf, mod.buf)
+    return result.value()
+
+
+if _gmp is not None:
+    powm = _powm
+else:
+    powm = None
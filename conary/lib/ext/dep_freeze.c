@@ -21,11 +21,15 @@
 static PyObject * depSetSplit(PyObject *self, PyObject *args);
 static PyObject * depSplit(PyObject *self, PyObject *args);
 static PyObject * depSetFreeze(PyObject *self, PyObject *args);
+static PyObject * depSetMatch(PyObject *self, PyObject *args);
+static PyObject * depSetUnmatched(PyObject *self, PyObject *args);
 
 static PyMethodDef methods[] = {
     { "depSetSplit", depSetSplit, METH_VARARGS },
     { "depSplit", depSplit, METH_VARARGS },
     { "depSetFreeze", depSetFreeze, METH_VARARGS },
+    { "depSetMatch", depSetMatch, METH_VARARGS },
+    { "depSetUnmatched", depSetUnmatched, METH_VARARGS },
     {NULL}  /* Sentinel */
 };
 
@@ -98,43 +102,31 @@ static PyObject * depSetSplit(PyObject *self, PyObject *args) {
 
 }
 
-static PyObject * depSplit(PyObject *self, PyObject *args) {
-    /* Borrowed references */
-    PyObject *dataArg;
-    PyObject *ret = NULL;
+/* Splits size bytes of a frozen dependency into a name and a list of
+   flags, returning new references to both. */
+static int depSplitRaw(const char *frozen, Py_ssize_t size,
+                       PyObject **namePtr, PyObject **flagsPtr) {
     /* Kept references */
     PyObject *flags = NULL, *name = NULL;
     PyObject *flag = NULL;
-    char *origData, *data = NULL, *chptr, *endPtr;
-
-    /* This avoids PyArg_ParseTuple because it's sloooow */
-    if (PyTuple_GET_SIZE(args) != 1) {
-        PyErr_SetString(PyExc_TypeError, "exactly one argument expected");
-        goto cleanup;
-    }
-
-    dataArg = PyTuple_GET_ITEM(args, 0);
-
-    if (!PYBYTES_CheckExact(dataArg)) {
-        PyErr_SetString(PyExc_TypeError, "first argument must be a string");
-        goto cleanup;
-    }
-
-    origData = PYBYTES_AS_STRING(dataArg);
+    const char *chptr, *limit;
+    char *data = NULL, *endPtr, *strPtr;
+    int rc = -1;
 
     /* Copy the original string over, replace single : with a '\0' and
        double :: with a single :, and \X with X (where X is anything,
        including backslash)  */
-    endPtr = data = PyMem_Malloc(strlen(origData) + 1);
+    endPtr = data = PyMem_Malloc(size + 1);
     if (data == NULL) {
         PyErr_NoMemory();
         goto cleanup;
     }
-    chptr = origData;
-    while (*chptr) {
+    chptr = frozen;
+    limit = frozen + size;
+    while (chptr < limit && *chptr) {
         if (*chptr == ':') {
             chptr++;
-            if (*chptr == ':') {
+            if (chptr < limit && *chptr == ':') {
                 *endPtr++ = ':';
                 chptr++;
             } else {
@@ -142,7 +134,9 @@ static PyObject * depSplit(PyObject *self, PyObject *args) {
             }
         } else if (*chptr == '\\') {
             chptr++;
-            *endPtr++ = *chptr++;
+            if (chptr < limit) {
+                *endPtr++ = *chptr++;
+            }
         } else { 
             *endPtr++ = *chptr++;
         }
@@ -152,19 +146,19 @@ static PyObject * depSplit(PyObject *self, PyObject *args) {
 
     /* We're left with a '\0' separated list of name, flag1, ..., flagN. Get
        the name first. */
-    chptr = data;
-    name = PYBYTES_FromString(chptr);
+    strPtr = data;
+    name = PYBYTES_FromString(strPtr);
     if (name == NULL) {
         goto cleanup;
     }
-    chptr += strlen(data) + 1;
+    strPtr += strlen(data) + 1;
 
     flags = PyList_New(0);
     if (flags == NULL) {
         goto cleanup;
     }
-    while (chptr < endPtr) {
-        flag = PYBYTES_FromString(chptr);
+    while (strPtr < endPtr) {
+        flag = PYBYTES_FromString(strPtr);
         if (flag == NULL) {
             goto cleanup;
         }
@@ -172,10 +166,13 @@ static PyObject * depSplit(PyObject *self, PyObject *args) {
             goto cleanup;
         }
         Py_CLEAR(flag);
-        chptr += strlen(chptr) + 1;
+        strPtr += strlen(strPtr) + 1;
     }
 
-    ret = PyTuple_Pack(2, name, flags);
+    *namePtr = name;
+    *flagsPtr = flags;
+    name = flags = NULL;
+    rc = 0;
 
 cleanup:
     Py_XDECREF(name);
@@ -184,9 +181,230 @@ cleanup:
     if (data != NULL) {
         PyMem_Free(data);
     }
+    return rc;
+}
+
+static PyObject * depSplit(PyObject *self, PyObject *args) {
+    /* Borrowed references */
+    PyObject *dataArg;
+    /* Kept references */
+    PyObject *flags, *name, *ret;
+
+    /* This avoids PyArg_ParseTuple because it's sloooow */
+    if (PyTuple_GET_SIZE(args) != 1) {
+        PyErr_SetString(PyExc_TypeError, "exactly one argument expected");
+        return NULL;
+    }
+
+    dataArg = PyTuple_GET_ITEM(args, 0);
+
+    if (!PYBYTES_CheckExact(dataArg)) {
+        PyErr_SetString(PyExc_TypeError, "first argument must be a string");
+        return NULL;
+    }
+
+    if (depSplitRaw(PYBYTES_AS_STRING(dataArg), PYBYTES_GET_SIZE(dataArg),
+                    &name, &flags)) {
+        return NULL;
+    }
+
+    ret = PyTuple_Pack(2, name, flags);
+    Py_DECREF(name);
+    Py_DECREF(flags);
     return ret;
 }
 
+/* Looks up each dependency of a frozen dependency set in index, which maps
+   (tag, name) to a list of (flagSet, data) providers. A provider satisfies
+   a dependency when every flag of the dependency is in its flagSet.
+
+   If matches is not NULL, a list of the data of the providers satisfying
+   each dependency is appended to it. If unmatched is not NULL, (tag, name,
+   flags) is appended to it for each dependency no provider satisfies,
+   skipping dependencies whose tag is in ignore. */
+static int depSetMatchRaw(PyObject *index, PyObject *frozenObj,
+                          PyObject *ignore, PyObject *matches,
+                          PyObject *unmatched) {
+    /* Borrowed references */
+    PyObject *providers, *provider, *flagSet;
+    /* Kept references */
+    PyObject *tagObj = NULL, *name = NULL, *flags = NULL, *key = NULL;
+    PyObject *found = NULL, *item = NULL;
+    char *data, *ptr, *limit, *depStart;
+    Py_ssize_t size, i, j;
+    long tag;
+    int rc = -1, satisfied, hasFlag;
+
+    PYBYTES_AsStringAndSize(frozenObj, &data, &size);
+    ptr = data;
+    limit = data + size;
+
+    while (ptr < limit) {
+        tag = 0;
+        while (ptr < limit && *ptr != '#') {
+            if (*ptr < '0' || *ptr > '9') {
+                goto invalid;
+            }
+            tag = tag * 10 + (*ptr - '0');
+            ptr++;
+        }
+        if (ptr == limit) {
+            goto invalid;
+        }
+        depStart = ++ptr;
+        while (ptr < limit && *ptr != '|') {
+            ptr++;
+        }
+
+        tagObj = PYINT_FromLong(tag);
+        if (tagObj == NULL) {
+            goto cleanup;
+        }
+
+        if (ignore != NULL) {
+            i = PySequence_Contains(ignore, tagObj);
+            if (i < 0) {
+                goto cleanup;
+            } else if (i) {
+                Py_CLEAR(tagObj);
+                /* skip the separator */
+                ptr++;
+                continue;
+            }
+        }
+
+        if (depSplitRaw(depStart, ptr - depStart, &name, &flags)) {
+            goto cleanup;
+        }
+        /* skip the separator */
+        ptr++;
+
+        key = PyTuple_Pack(2, tagObj, name);
+        if (key == NULL) {
+            goto cleanup;
+        }
+
+        if (matches != NULL && (found = PyList_New(0)) == NULL) {
+            goto cleanup;
+        }
+
+        satisfied = 0;
+        providers = PyDict_GetItem(index, key);
+        if (providers != NULL && !PyList_CheckExact(providers)) {
+            PyErr_SetString(PyExc_TypeError, "index values must be lists");
+            goto cleanup;
+        }
+        for (i = 0; providers != NULL && i < PyList_GET_SIZE(providers);
+                    i++) {
+            provider = PyList_GET_ITEM(providers, i);
+            if (!PyTuple_CheckExact(provider) ||
+                    PyTuple_GET_SIZE(provider) != 2) {
+                PyErr_SetString(PyExc_TypeError,
+                                "providers must be (flagSet, data) tuples");
+                goto cleanup;
+            }
+            flagSet = PyTuple_GET_ITEM(provider, 0);
+
+            hasFlag = 1;
+            for (j = 0; j < PyList_GET_SIZE(flags); j++) {
+                hasFlag = PySequence_Contains(flagSet,
+                                              PyList_GET_ITEM(flags, j));
+                if (hasFlag < 0) {
+                    goto cleanup;
+                } else if (!hasFlag) {
+                    break;
+                }
+            }
+            if (!hasFlag) {
+                continue;
+            }
+
+            satisfied = 1;
+            if (found == NULL) {
+                break;
+            }
+            if (PyList_Append(found, PyTuple_GET_ITEM(provider, 1))) {
+                goto cleanup;
+            }
+        }
+
+        if (found != NULL) {
+            if (PyList_Append(matches, found)) {
+                goto cleanup;
+            }
+            Py_CLEAR(found);
+        }
+
+        if (unmatched != NULL && !satisfied) {
+            item = PyTuple_Pack(3, tagObj, name, flags);
+            if (item == NULL || PyList_Append(unmatched, item)) {
+                goto cleanup;
+            }
+            Py_CLEAR(item);
+        }
+
+        Py_CLEAR(tagObj);
+        Py_CLEAR(name);
+        Py_CLEAR(flags);
+        Py_CLEAR(key);
+    }
+
+    rc = 0;
+    goto cleanup;
+
+invalid:
+    PyErr_SetString(PyExc_ValueError, "invalid frozen dependency");
+
+cleanup:
+    Py_XDECREF(tagObj);
+    Py_XDECREF(name);
+    Py_XDECREF(flags);
+    Py_XDECREF(key);
+    Py_XDECREF(found);
+    Py_XDECREF(item);
+    return rc;
+}
+
+static PyObject * depSetMatch(PyObject *self, PyObject *args) {
+    PyObject *index, *frozen, *matches;
+
+    if (!PyArg_ParseTuple(args, "O!O!", &PyDict_Type, &index,
+                          &PYBYTES_Type, &frozen)) {
+        return NULL;
+    }
+
+    matches = PyList_New(0);
+    if (matches == NULL) {
+        return NULL;
+    }
+    if (depSetMatchRaw(index, frozen, NULL, matches, NULL)) {
+        Py_DECREF(matches);
+        return NULL;
+    }
+
+    return matches;
+}
+
+static PyObject * depSetUnmatched(PyObject *self, PyObject *args) {
+    PyObject *index, *frozen, *ignore, *unmatched;
+
+    if (!PyArg_ParseTuple(args, "O!O!O", &PyDict_Type, &index,
+                          &PYBYTES_Type, &frozen, &ignore)) {
+        return NULL;
+    }
+
+    unmatched = PyList_New(0);
+    if (unmatched == NULL) {
+        return NULL;
+    }
+    if (depSetMatchRaw(index, frozen, ignore, NULL, unmatched)) {
+        Py_DECREF(unmatched);
+        return NULL;
+    }
+
+    return unmatched;
+}
+
 static void escapeName(char ** sPtr, PyObject * strObj) {
     int size;
     char * s;
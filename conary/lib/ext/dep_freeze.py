@@ -74,3 +74,41 @@ def depSplit(frozen):
     else:
         flagList = []
     return name, flagList
+
+
+def _iterDepSet(frozen):
+    offset = 0
+    while offset < len(frozen):
+        offset, tag, depStr = depSetSplit(offset, frozen)
+        name, flags = depSplit(depStr)
+        yield tag, name, flags
+
+
+def depSetMatch(index, frozen):
+    matches = []
+    for tag, name, flags in _iterDepSet(frozen):
+        found = []
+        for flagSet, data in index.get((tag, name), ()):
+            for flag in flags:
+                if flag not in flagSet:
+                    break
+            else:
+                found.append(data)
+        matches.append(found)
+    return matches
+
+
+def depSetUnmatched(index, frozen, ignore):
+    unmatched = []
+    for tag, name, flags in _iterDepSet(frozen):
+        if tag in ignore:
+            continue
+        for flagSet, data in index.get((tag, name), ()):
+            for flag in flags:
+                if flag not in flagSet:
+                    break
+            else:
+                break
+        else:
+            unmatched.append((tag, name, flags))
+    return unmatched
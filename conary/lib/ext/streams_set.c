@@ -41,14 +41,23 @@ struct tagInfo {
     int size;
     PyObject * name;
     PyObject * type;
+    /* -1 if not known yet, otherwise whether a default constructed
+       object of this type freezes to an empty string */
+    int defaultEmpty;
 };
 
 typedef struct {
     PyObject_HEAD
     struct tagInfo * tags;
     int tagCount;
+    /* set from the lazyThaw class attribute */
+    int lazy;
 } StreamSetDefObject;
 
+/* values for lazyTags[].offset which aren't offsets into lazyData */
+#define LAZY_DONE -1        /* the stream object exists */
+#define LAZY_EMPTY -2       /* not in the frozen data; default value */
+
 typedef struct {
     PyObject_HEAD
     int unknownCount;
@@ -57,10 +66,20 @@ typedef struct {
         int sizeType;
         PyObject * data;
     } * unknownTags;
+    /* Only used for classes which set lazyThaw. lazyTags parallels
+       ssd->tags; lazyCount is the number of entries which aren't
+       LAZY_DONE. lazyData holds the frozen data the offsets point into, and
+       is only set while some tag still has an offset into it. */
+    PyObject * lazyData;
+    int lazyCount;
+    struct lazyTag {
+        int offset;
+        int size;
+    } * lazyTags;
 } StreamSetObject;
 
 static int Thaw_raw(PyObject * self, StreamSetDefObject * ssd,
-		    char * data, int dataLen, int offset);
+		    PyObject * dataObj, char * data, int dataLen, int offset);
 
 /* ------------------------------------- */
 /* StreamSetDef Implementation           */
@@ -96,6 +115,7 @@ static int StreamSetDef_Init(PyObject * self, PyObject * args,
         goto onerror;
     }
 
+    ssd->lazy = 0;
     ssd->tagCount = Py_SIZE(items);
     ssd->tags = PyMem_Malloc(ssd->tagCount * sizeof(*ssd->tags));
     if (ssd->tags == NULL) {
@@ -119,6 +139,7 @@ static int StreamSetDef_Init(PyObject * self, PyObject * args,
         ssd->tags[i].size = size;
         ssd->tags[i].name = PYBYTES_FromString(name);
         ssd->tags[i].type = streamType;
+        ssd->tags[i].defaultEmpty = -1;
         Py_INCREF(streamType);
     }
 
@@ -155,7 +176,7 @@ static StreamSetDefObject * StreamSet_GetSSD(PyTypeObject *o) {
     /* returns a borrowed reference to the ssd */
     PyObject *sd;
     int rc;
-    PyObject *arg;
+    PyObject *arg, *lazy;
     StreamSetDefObject * ssd;
     
     /* This looks in the class itself, not in the object or in parent classes */
@@ -199,11 +220,219 @@ static StreamSetDefObject * StreamSet_GetSSD(PyTypeObject *o) {
     Py_DECREF(arg);
     if (-1 == rc)
 	return NULL;
+
+    /* classes opt into lazy thawing; it's only safe when every stream
+       type in streamDict refreezes to the data it was thawed from */
+    lazy = PyObject_GetAttrString((PyObject *) o, "lazyThaw");
+    if (lazy) {
+        ssd->lazy = PyObject_IsTrue(lazy);
+        Py_DECREF(lazy);
+        if (ssd->lazy == -1)
+            return NULL;
+    } else {
+        PyErr_Clear();
+    }
+
     PyObject_SetAttrString((PyObject *) o, "_streamDict",
 			   (PyObject *) ssd);
     return (StreamSetDefObject *) ssd;
 }
 
+/* ------------------------------------- */
+/* Lazy thawing                          */
+
+/* Returns the index of the tag whose attribute is called name, -1 if name
+   isn't one of them, or -2 on error */
+static int lazyFindTag(StreamSetDefObject * ssd, PyObject * name) {
+    int i, rc;
+
+    for (i = 0; i < ssd->tagCount; i++)
+        if (ssd->tags[i].name == name)
+            return i;
+
+    for (i = 0; i < ssd->tagCount; i++) {
+        rc = PyObject_RichCompareBool(ssd->tags[i].name, name, Py_EQ);
+        if (rc == -1)
+            return -2;
+        if (rc)
+            return i;
+    }
+
+    return -1;
+}
+
+static int lazyHasData(StreamSetObject * sset, StreamSetDefObject * ssd) {
+    int i;
+
+    for (i = 0; i < ssd->tagCount; i++)
+        if (sset->lazyTags[i].offset >= 0)
+            return 1;
+
+    return 0;
+}
+
+/* Forgets any lazy state and marks every tag as unthawed */
+static int lazyReset(StreamSetObject * sset, StreamSetDefObject * ssd) {
+    int i;
+
+    if (sset->lazyTags == NULL && ssd->tagCount) {
+        sset->lazyTags = PyMem_Malloc(ssd->tagCount *
+                                      sizeof(*sset->lazyTags));
+        if (sset->lazyTags == NULL) {
+            PyErr_NoMemory();
+            return -1;
+        }
+    }
+
+    for (i = 0; i < ssd->tagCount; i++) {
+        sset->lazyTags[i].offset = LAZY_EMPTY;
+        sset->lazyTags[i].size = 0;
+    }
+    sset->lazyCount = ssd->tagCount;
+    Py_CLEAR(sset->lazyData);
+
+    return 0;
+}
+
+/* Builds the stream object for tag i and stores it in the instance. The
+   setattro hook does the bookkeeping. */
+static int lazyThawTag(StreamSetObject * sset, StreamSetDefObject * ssd,
+                       int i) {
+    struct lazyTag * lt = sset->lazyTags + i;
+    PyObject * type = ssd->tags[i].type;
+    PyObject * obj, * ro;
+    char * data;
+    int rc, lazySet = 0;
+
+    if (lt->offset == LAZY_EMPTY) {
+        obj = PyObject_CallFunction(type, NULL);
+    } else {
+        data = PYBYTES_AS_STRING(sset->lazyData) + lt->offset;
+
+        if (PyType_Check(type) &&
+                PyType_IsSubtype((PyTypeObject *) type,
+                                 &allStreams[STREAM_SET].pyType)) {
+            StreamSetDefObject * subSsd;
+
+            subSsd = StreamSet_GetSSD((PyTypeObject *) type);
+            if (subSsd == NULL)
+                return -1;
+            lazySet = subSsd->lazy;
+        }
+
+        if (lazySet) {
+            /* let the nested set hold on to its frozen data as well */
+            obj = PyObject_CallFunction(type, "s#", data, lt->size);
+        } else {
+            obj = PyObject_CallFunction(type, NULL);
+            if (obj) {
+                ro = PyObject_CallMethod(obj, "thaw", "s#", data, lt->size);
+                if (!ro) {
+                    Py_CLEAR(obj);
+                } else {
+                    Py_DECREF(ro);
+                }
+            }
+        }
+    }
+
+    if (!obj)
+        return -1;
+
+    rc = PyObject_SetAttr((PyObject *) sset, ssd->tags[i].name, obj);
+    Py_DECREF(obj);
+    return rc;
+}
+
+/* Thaws every tag which still refers to lazyData */
+static int lazyThawData(StreamSetObject * sset, StreamSetDefObject * ssd) {
+    int i;
+
+    for (i = 0; i < ssd->tagCount && sset->lazyData; i++) {
+        if (sset->lazyTags[i].offset >= 0 && lazyThawTag(sset, ssd, i))
+            return -1;
+    }
+
+    return 0;
+}
+
+/* Returns 1 if a default constructed stream for tag i freezes to nothing,
+   0 if it doesn't, and -1 on error */
+static int lazyDefaultIsEmpty(StreamSetDefObject * ssd, int i) {
+    PyObject * obj, * frz;
+
+    if (ssd->tags[i].defaultEmpty != -1)
+        return ssd->tags[i].defaultEmpty;
+
+    obj = PyObject_CallFunction(ssd->tags[i].type, NULL);
+    if (!obj)
+        return -1;
+    frz = PyObject_CallMethod(obj, "freeze", NULL);
+    Py_DECREF(obj);
+    if (!frz)
+        return -1;
+
+    if (!PYBYTES_Check(frz)) {
+        Py_DECREF(frz);
+        PyErr_SetString(PyExc_TypeError, "freeze() must return a string");
+        return -1;
+    }
+
+    ssd->tags[i].defaultEmpty = (PYBYTES_GET_SIZE(frz) == 0);
+    Py_DECREF(frz);
+    return ssd->tags[i].defaultEmpty;
+}
+
+static PyObject * StreamSet_GetAttr(PyObject * self, PyObject * name) {
+    StreamSetObject * sset = (StreamSetObject *) self;
+    StreamSetDefObject * ssd;
+    int i;
+
+    if (sset->lazyCount) {
+        ssd = StreamSet_GetSSD(Py_TYPE(self));
+        if (ssd == NULL)
+            return NULL;
+
+        i = lazyFindTag(ssd, name);
+        if (i == -2)
+            return NULL;
+
+        if (i >= 0 && sset->lazyTags[i].offset != LAZY_DONE &&
+                lazyThawTag(sset, ssd, i))
+            return NULL;
+    }
+
+    return PyObject_GenericGetAttr(self, name);
+}
+
+static int StreamSet_SetAttr(PyObject * self, PyObject * name,
+                             PyObject * value) {
+    StreamSetObject * sset = (StreamSetObject *) self;
+    StreamSetDefObject * ssd;
+    int i, rc;
+
+    rc = PyObject_GenericSetAttr(self, name, value);
+    if (rc || !sset->lazyCount)
+        return rc;
+
+    ssd = StreamSet_GetSSD(Py_TYPE(self));
+    if (ssd == NULL)
+        return -1;
+
+    i = lazyFindTag(ssd, name);
+    if (i == -2)
+        return -1;
+
+    if (i >= 0 && sset->lazyTags[i].offset != LAZY_DONE) {
+        sset->lazyTags[i].offset = LAZY_DONE;
+        sset->lazyCount--;
+        if (sset->lazyData && !lazyHasData(sset, ssd))
+            Py_CLEAR(sset->lazyData);
+    }
+
+    return 0;
+}
+
 static int _StreamSet_doEq(PyObject * self,
 			   PyObject * args,
 			   PyObject * kwargs) {
@@ -670,7 +899,7 @@ static PyObject * StreamSet_Freeze(StreamSetObject * self,
     int i, len, useAlloca = 0;
     PyObject * attr, *rc, * skipSet = Py_None;
     PyObject * freezeKnown = Py_True, * freezeUnknown = Py_True;
-    int unknownCount;
+    int unknownCount, copyLazy, isEmpty;
 
     if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|OOO", kwlist, &skipSet,
                                      &freezeKnown, &freezeUnknown, NULL))
@@ -706,6 +935,11 @@ static PyObject * StreamSet_Freeze(StreamSetObject * self,
     } else
 	vals = PyMem_Malloc(len);
 
+    /* tags which haven't been thawed yet can't have changed, so a plain
+       freeze can reuse their frozen data as is */
+    copyLazy = (sset->lazyCount && skipSet == Py_None &&
+                freezeUnknown == Py_True);
+
     for (i = 0; i < ssd->tagCount; i++) {
         if (freezeKnown == Py_False ||
                     (skipSet != Py_None &&
@@ -715,15 +949,33 @@ static PyObject * StreamSet_Freeze(StreamSetObject * self,
 	    continue;
         }
 
-	attr = PyObject_GetAttr((PyObject *) self, ssd->tags[i].name);
-        if (PyObject_IsInstance((PyObject *) attr,
-                                (PyObject *) &allStreams[STREAM_SET].pyType)) {
-            vals[i] = PyObject_CallMethod(attr, "freeze", "OOO", skipSet,
-                                          freezeKnown, freezeUnknown);
+        isEmpty = 0;
+        if (copyLazy && sset->lazyTags[i].offset == LAZY_EMPTY)
+            isEmpty = lazyDefaultIsEmpty(ssd, i);
+
+        if (isEmpty == 1) {
+            Py_INCREF(Py_None);
+            vals[i] = Py_None;
+        } else if (isEmpty == -1) {
+            vals[i] = NULL;
+        } else if (copyLazy && sset->lazyTags[i].offset >= 0) {
+            vals[i] = PYBYTES_FromStringAndSize(
+                        PYBYTES_AS_STRING(sset->lazyData) +
+                            sset->lazyTags[i].offset,
+                        sset->lazyTags[i].size);
         } else {
-            vals[i] = PyObject_CallMethod(attr, "freeze", "O", skipSet);
+            attr = PyObject_GetAttr((PyObject *) self, ssd->tags[i].name);
+            if (!attr) {
+                vals[i] = NULL;
+            } else if (PyObject_IsInstance((PyObject *) attr,
+                                (PyObject *) &allStreams[STREAM_SET].pyType)) {
+                vals[i] = PyObject_CallMethod(attr, "freeze", "OOO", skipSet,
+                                              freezeKnown, freezeUnknown);
+            } else {
+                vals[i] = PyObject_CallMethod(attr, "freeze", "O", skipSet);
+            }
+            Py_XDECREF(attr);
         }
-	Py_DECREF(attr);
 
 	if (!vals[i]) {
 	    /* an error occurred when calling the freeze method for the
@@ -758,11 +1010,17 @@ static int StreamSet_Init(PyObject * o, PyObject * args,
     StreamSetDefObject * ssd;
     int i;
     int offset = 0;
+    PyObject * dataObj = Py_None;
     char * data = NULL;
     int dataLen;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|z#i", kwlist, &data, 
-				     &dataLen, &offset)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|Oi", kwlist, &dataObj,
+				     &offset)) {
+        return -1;
+    }
+    if (dataObj != Py_None &&
+            !PyArg_Parse(dataObj, "s#;data must be a string or None",
+                         &data, &dataLen)) {
         return -1;
     }
     ssd = StreamSet_GetSSD(Py_TYPE(o));
@@ -772,6 +1030,21 @@ static int StreamSet_Init(PyObject * o, PyObject * args,
     self->unknownCount = 0;
     self->unknownTags = NULL;
 
+    if (ssd->lazy) {
+        /* stream objects are created when they're first looked up */
+        if (lazyReset(self, ssd))
+            return -1;
+
+        if (!data)
+            return 0;
+
+        if (Thaw_raw(o, ssd, PYBYTES_CheckExact(dataObj) ? dataObj : NULL,
+                     data, dataLen, offset))
+            return -1;
+
+        return 0;
+    }
+
     for (i = 0; i < ssd->tagCount; i++) {
 	PyObject * obj;
 
@@ -789,7 +1062,7 @@ static int StreamSet_Init(PyObject * o, PyObject * args,
     if (!data)
 	return 0;
 
-    if (Thaw_raw(o, ssd, data, dataLen, offset))
+    if (Thaw_raw(o, ssd, NULL, data, dataLen, offset))
 	return -1;
 
     return 0;
@@ -805,15 +1078,21 @@ static void StreamSet_Dealloc(PyObject * self) {
 
     if (sset->unknownCount)
         PyMem_Free(sset->unknownTags);
+    Py_CLEAR(sset->lazyData);
+    PyMem_Free(sset->lazyTags);
     Py_TYPE(self)->tp_free(self);
 }
 
 static PyObject * StreamSet_Thaw(PyObject * o, PyObject * args) {
+    PyObject * dataObj;
     char * data = NULL;
     int dataLen;
     StreamSetDefObject * ssd;
 
-    if (!PyArg_ParseTuple(args, "s#", &data, &dataLen))
+    if (!PyArg_ParseTuple(args, "O", &dataObj))
+        return NULL;
+    if (!PyArg_Parse(dataObj, "s#;thaw() argument must be a string",
+                     &data, &dataLen))
         return NULL;
 
     ssd = StreamSet_GetSSD(Py_TYPE(o));
@@ -821,21 +1100,31 @@ static PyObject * StreamSet_Thaw(PyObject * o, PyObject * args) {
 	return NULL;
     }
 
-    if (Thaw_raw(o, ssd, data, dataLen, 0))
+    if (Thaw_raw(o, ssd, PYBYTES_CheckExact(dataObj) ? dataObj : NULL,
+                 data, dataLen, 0))
 	return NULL;
 
     Py_INCREF(Py_None);
     return Py_None;
 }
 
+/* dataObj is the string data points into. When it's given and the set is
+   lazy, tags which haven't been thawed yet just remember where their data
+   is instead of being thawed. */
 static int Thaw_raw(PyObject * self, StreamSetDefObject * ssd,
-		    char * data, int dataLen, int offset) {
+		    PyObject * dataObj, char * data, int dataLen, int offset) {
     char * streamData, * chptr, * end;
     int size, i, sizeType;
     PyObject * attr, * ro;
     int ignoreUnknown = -1;
     unsigned int streamId;
     StreamSetObject * sset = (StreamSetObject *) self;
+    int lazy = (sset->lazyTags != NULL && dataObj != NULL);
+
+    /* offsets from an earlier thaw point into a different string */
+    if (lazy && sset->lazyData != NULL && sset->lazyData != dataObj &&
+            lazyThawData(sset, ssd))
+        return -1;
 
     end = data + dataLen;
     chptr = data + offset;
@@ -877,6 +1166,18 @@ static int Thaw_raw(PyObject * self, StreamSetDefObject * ssd,
             continue;
 	}
 
+        if (lazy && sset->lazyTags[i].offset == LAZY_EMPTY) {
+            if (sset->lazyData == NULL) {
+                Py_INCREF(dataObj);
+                sset->lazyData = dataObj;
+            }
+            sset->lazyTags[i].offset = streamData - data;
+            sset->lazyTags[i].size = size;
+            continue;
+        }
+
+	/* this thaws the tag first if it's still lazy, so repeated tags
+	   behave the same as they do for eagerly thawed sets */
 	attr = PyObject_GetAttr((PyObject *) self, ssd->tags[i].name);
         if (!attr) {
             return -1;
@@ -1196,8 +1497,8 @@ PyTypeObject StreamSetType = {
     StreamSet_Hash,                 /*tp_hash */
     0,				    /*tp_call*/
     0,                              /*tp_str*/
-    0,                              /*tp_getattro*/
-    0,                              /*tp_setattro*/
+    StreamSet_GetAttr,              /*tp_getattro*/
+    StreamSet_SetAttr,              /*tp_setattro*/
     0,                              /*tp_as_buffer*/
     Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,             /*tp_flags*/
     NULL,                           /* tp_doc */
@@ -0,0 +1,608 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+In-process extraction of tar, cpio and zip archives.
+
+Compressed tar and cpio streams are decompressed on a separate thread so
+decompression overlaps with writing files out; zip members are independent
+of each other and are extracted by a pool of threads. Optionally the sha1 of
+every regular file is computed while it is written, so callers don't have
+to read the files back to checksum them.
+"""
+
+import bz2
+import errno
+import grp
+import os
+import pwd
+import Queue
+import stat
+import StringIO
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+
+from conary.lib import cpiostream, digestlib, log, threadpool, util
+
+
+class ExtractError(Exception):
+    """
+    Raised when an archive can't be extracted in-process. Members which
+    were already extracted are left in the destination directory.
+    """
+
+
+_compressionMagic = [
+    ('\x1f\x8b', 'gzip'),
+    ('BZh', 'bzip2'),
+    ('\xfd7zXZ\x00', 'xz'),
+    ('\x89LZO', 'lzo'),
+    ('\x1f\x9d', 'compress'),
+]
+
+def sniffCompression(path):
+    """
+    Returns the name of the compression used by the file at path ('gzip',
+    'bzip2', 'xz', 'lzo' or 'compress'), or None if it does not look
+    compressed.
+    """
+    f = open(path)
+    try:
+        head = f.read(6)
+    finally:
+        f.close()
+
+    for prefix, name in _compressionMagic:
+        if head.startswith(prefix):
+            return name
+    return None
+
+
+class ReadAheadDecompressor(object):
+    """
+    Read-only file object returning the decompressed contents of a gzip or
+    bzip2 stream. Decompression runs on its own thread, at most
+    queueSize chunks ahead of the reader. Concatenated streams (as written
+    by pigz or pbzip2) are decompressed in order; trailing garbage after the
+    last stream is ignored, as gzip does. Input which ends before the end
+    of a stream makes read() raise ExtractError.
+    """
+
+    chunkSize = 256 * 1024
+
+    _magic = { 'gzip' : '\x1f\x8b', 'bzip2' : 'BZh' }
+
+    def _newDecompressor(self):
+        if self.compression == 'gzip':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return bz2.BZ2Decompressor()
+
+    def _streamEnded(self, decomp):
+        """
+        Returns True if decomp has seen the end of its stream.
+        """
+        if self.compression == 'gzip':
+            # data past the end of a stream is left in unused_data
+            try:
+                decomp.decompress('\0')
+            except zlib.error:
+                return False
+            return bool(decomp.unused_data)
+
+        try:
+            decomp.decompress('')
+        except EOFError:
+            return True
+        return False
+
+    def _run(self):
+        try:
+            decomp = self._newDecompressor()
+            done = False
+            while not done and not self._abort:
+                buf = self.fileObj.read(self.chunkSize)
+                if not buf:
+                    break
+
+                while buf:
+                    try:
+                        out = decomp.decompress(buf)
+                    except EOFError:
+                        # the bzip2 stream ended right at the end of the
+                        # last read
+                        out = None
+                        unused = buf
+                    else:
+                        unused = decomp.unused_data
+                    if out:
+                        self._queue.put(out)
+
+                    buf = unused
+                    if buf:
+                        # the end of this stream was reached; another may
+                        # follow
+                        if self.compression == 'gzip':
+                            out = decomp.flush()
+                            if out:
+                                self._queue.put(out)
+                        magic = self._magic[self.compression]
+                        # a read can end in the middle of the next magic
+                        while len(buf) < len(magic) and magic.startswith(buf):
+                            more = self.fileObj.read(self.chunkSize)
+                            if not more:
+                                break
+                            buf += more
+                        if not buf.startswith(magic):
+                            done = True
+                            break
+                        decomp = self._newDecompressor()
+
+            if not done and not self._abort:
+                if not self._streamEnded(decomp):
+                    raise ExtractError('%s stream is truncated'
+                                       % self.compression)
+                if self.compression == 'gzip':
+                    out = decomp.flush()
+                    if out:
+                        self._queue.put(out)
+            self._queue.put(None)
+        except:
+            self._queue.put(sys.exc_info())
+
+    def read(self, size = -1):
+        while not self._eof and (size < 0 or self._bufLen < size):
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+            elif type(item) is tuple:
+                self._eof = True
+                raise item[0], item[1], item[2]
+            else:
+                self._buf.append(item)
+                self._bufLen += len(item)
+
+        data = ''.join(self._buf)
+        if size < 0 or size >= len(data):
+            self._buf = []
+            self._bufLen = 0
+            return data
+
+        self._buf = [ data[size:] ]
+        self._bufLen = len(data) - size
+        return data[:size]
+
+    def close(self):
+        self._abort = True
+        # unblock the decompressor if it is waiting on a full queue
+        while self._thread.isAlive():
+            try:
+                self._queue.get(timeout = 0.1)
+            except Queue.Empty:
+                pass
+        self._thread.join()
+        self.fileObj.close()
+
+    def __init__(self, fileObj, compression, queueSize = 8):
+        assert(compression in self._magic)
+        self.fileObj = fileObj
+        self.compression = compression
+        self._queue = Queue.Queue(queueSize)
+        self._buf = []
+        self._bufLen = 0
+        self._eof = False
+        self._abort = False
+        self._thread = threading.Thread(target = self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+
+def openArchive(path):
+    """
+    Opens the file at path for reading its (decompressed) contents.
+    Returns None if the compression used can't be handled in-process.
+    """
+    compression = sniffCompression(path)
+    if compression not in (None, 'gzip', 'bzip2'):
+        return None
+
+    f = open(path)
+    if compression:
+        return ReadAheadDecompressor(f, compression)
+    return f
+
+
+class ArchiveExtractor(object):
+    """
+    Extracts archives into destDir.
+
+    @ivar owners: list of (path, user, group) tuples for every archive
+    member extracted, in archive order; paths are relative to destDir
+    @ivar digests: dict mapping the destDir-relative path of each regular
+    file extracted to a (st_ino, st_size, st_ctime, sha1) tuple; empty
+    unless computeDigests was set
+    """
+
+    def __init__(self, destDir, preserveModes = False, computeDigests = False,
+                 numThreads = None):
+        """
+        @param preserveModes: keep setuid/setgid bits and ignore the umask,
+        like tar -p
+        @param computeDigests: record the sha1 of each regular file
+        @param numThreads: threads used to extract zip members
+        """
+        self.destDir = os.path.normpath(destDir)
+        self.preserveModes = preserveModes
+        self.computeDigests = computeDigests
+        self.numThreads = numThreads
+        self.owners = []
+        self.digests = {}
+        self._sha1s = {}
+        self._dirs = []
+        # symlinks created from the archive; nothing is extracted through
+        # them, as they may point outside of destDir
+        self._symlinks = set()
+        self._umask = os.umask(022)
+        os.umask(self._umask)
+
+    def _relPath(self, name):
+        name = os.path.normpath(name.lstrip('/'))
+        if name == '.':
+            return ''
+        if name == '..' or name.startswith('../'):
+            return None
+        parent = os.path.dirname(name)
+        while parent:
+            if parent in self._symlinks:
+                return None
+            parent = os.path.dirname(parent)
+        return name
+
+    def _target(self, relPath):
+        if not relPath:
+            return self.destDir
+        return self.destDir + '/' + relPath
+
+    def _mode(self, mode):
+        if self.preserveModes:
+            return mode & 07777
+        return mode & 0777 & ~self._umask
+
+    def _forget(self, relPath):
+        # drops what we remember about relPath and anything below it
+        prefix = relPath + '/'
+        inside = lambda x: x == relPath or x.startswith(prefix)
+        self._dirs = [ x for x in self._dirs if not inside(x[0]) ]
+        for path in [ x for x in self._sha1s.keys() if inside(x) ]:
+            del self._sha1s[path]
+        self._symlinks.difference_update(
+                        [ x for x in self._symlinks if inside(x) ])
+
+    def _prepare(self, relPath):
+        # replace whatever was there before, like tar and cpio -u do
+        target = self._target(relPath)
+        if not relPath:
+            # never remove destDir itself
+            return target
+        util.mkdirChain(os.path.dirname(target))
+        try:
+            sb = os.lstat(target)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+            return target
+
+        if stat.S_ISDIR(sb.st_mode):
+            util.rmtree(target)
+        else:
+            os.unlink(target)
+        self._forget(relPath)
+        return target
+
+    def _writeFile(self, relPath, src, mode, mtime):
+        target = self._prepare(relPath)
+
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        dest = os.fdopen(fd, 'w')
+        if self.computeDigests:
+            digest = digestlib.sha1()
+        else:
+            digest = None
+        util.copyfileobj(src, dest, digest = digest)
+        dest.close()
+
+        os.chmod(target, mode)
+        os.utime(target, (mtime, mtime))
+        if digest:
+            self._sha1s[relPath] = digest.digest()
+
+    def _mkdir(self, relPath, mode, mtime):
+        target = self._target(relPath)
+        if os.path.islink(target) or (os.path.exists(target) and
+                                      not os.path.isdir(target)):
+            os.unlink(target)
+            self._forget(relPath)
+        util.mkdirChain(target)
+        # permissions and times are set once the directory is populated
+        self._dirs.append((relPath, mode, mtime))
+
+    def _symlink(self, relPath, linkTo):
+        target = self._prepare(relPath)
+        os.symlink(linkTo, target)
+        self._symlinks.add(relPath)
+
+    def _hardlink(self, relPath, linkRelPath):
+        target = self._prepare(relPath)
+        os.link(self._target(linkRelPath), target)
+        if linkRelPath in self._sha1s:
+            self._sha1s[relPath] = self._sha1s[linkRelPath]
+
+    def _mknod(self, relPath, mode, rdev):
+        target = self._prepare(relPath)
+        try:
+            if stat.S_ISFIFO(mode):
+                os.mkfifo(target, mode & 0777)
+            else:
+                os.mknod(target, mode, rdev)
+        except OSError, e:
+            if e.errno != errno.EPERM:
+                raise
+            log.warning('cannot create device node %s: %s', relPath,
+                        e.strerror)
+
+    def _finish(self):
+        # deepest directories first, so setting the times of a child
+        # doesn't modify its parent afterwards
+        self._dirs.sort(reverse = True)
+        for relPath, mode, mtime in self._dirs:
+            target = self._target(relPath)
+            os.chmod(target, mode)
+            os.utime(target, (mtime, mtime))
+        self._dirs = []
+
+        # stat at the very end; adding hardlinks changes the ctime
+        for relPath, sha1 in self._sha1s.iteritems():
+            sb = os.lstat(self._target(relPath))
+            self.digests[relPath] = (sb.st_ino, sb.st_size, sb.st_ctime, sha1)
+        self._sha1s = {}
+
+    def extractTar(self, fileObj):
+        """
+        Extracts a tar stream read from fileObj. Raises ExtractError if
+        the stream does not start with a valid tar header.
+        """
+        try:
+            tar = tarfile.open(fileobj = fileObj, mode = 'r|')
+        except tarfile.ReadError, e:
+            raise ExtractError(str(e))
+
+        try:
+            for member in tar:
+                relPath = self._relPath(member.name)
+                if relPath is None:
+                    log.warning('skipping archive member %s outside of the '
+                                'destination directory', member.name)
+                    continue
+
+                if member.isdir():
+                    self._mkdir(relPath, self._mode(member.mode),
+                                member.mtime)
+                elif member.isfile():
+                    src = tar.extractfile(member)
+                    self._writeFile(relPath, src, self._mode(member.mode),
+                                    member.mtime)
+                elif member.issym():
+                    self._symlink(relPath, member.linkname)
+                elif member.islnk():
+                    linkRelPath = self._relPath(member.linkname)
+                    if linkRelPath is None:
+                        log.warning('skipping hard link %s to %s outside of '
+                                    'the destination directory', member.name,
+                                    member.linkname)
+                        continue
+                    self._hardlink(relPath, linkRelPath)
+                elif member.ischr() or member.isblk() or member.isfifo():
+                    if member.ischr():
+                        fmt = stat.S_IFCHR
+                    elif member.isblk():
+                        fmt = stat.S_IFBLK
+                    else:
+                        fmt = stat.S_IFIFO
+                    self._mknod(relPath, fmt | self._mode(member.mode),
+                                os.makedev(member.devmajor, member.devminor))
+                else:
+                    log.warning('skipping archive member %s of unknown type',
+                                member.name)
+                    continue
+
+                self.owners.append((relPath or '.',
+                                    member.uname or str(member.uid),
+                                    member.gname or str(member.gid)))
+        finally:
+            tar.close()
+            self._finish()
+
+    def extractCpio(self, fileObj):
+        """
+        Extracts a new ASCII (newc) cpio stream read from fileObj. Raises
+        ExtractError if the stream does not start with a valid header.
+        """
+        archive = cpiostream.CpioStream(fileObj)
+        entries = iter(archive)
+        try:
+            first = entries.next()
+        except StopIteration:
+            return
+        except (cpiostream.InvalidMagicError,
+                cpiostream.IncompleteHeaderError,
+                cpiostream.InvalidFieldValue), e:
+            raise ExtractError('not a cpio archive: %s' % e)
+
+        def _entries():
+            yield first
+            for ent in entries:
+                yield ent
+
+        # hardlinked files carry their contents with the last link only
+        linkMap = {}
+        try:
+            for ent in _entries():
+                header = ent.header
+                relPath = self._relPath(ent.filename)
+                if relPath is None:
+                    log.warning('skipping archive member %s outside of the '
+                                'destination directory', ent.filename)
+                    continue
+
+                mode = header.mode
+                # cpio restores modes as they are in the archive
+                perms = mode & 07777
+                if stat.S_ISDIR(mode):
+                    self._mkdir(relPath, perms, header.mtime)
+                elif stat.S_ISLNK(mode):
+                    self._symlink(relPath, ent.payload.read())
+                elif stat.S_ISREG(mode):
+                    if header.nlink > 1 and not header.filesize:
+                        linkMap.setdefault(header.inode, []).append(
+                                                (relPath, perms, header.mtime))
+                    else:
+                        self._writeFile(relPath, ent.payload, perms,
+                                        header.mtime)
+                        if header.nlink > 1:
+                            for linkPath, _, _ in linkMap.pop(header.inode,
+                                                              []):
+                                self._hardlink(linkPath, relPath)
+                elif (stat.S_ISCHR(mode) or stat.S_ISBLK(mode) or
+                      stat.S_ISFIFO(mode)):
+                    self._mknod(relPath, mode,
+                                os.makedev(header.rdevmajor,
+                                           header.rdevminor))
+                else:
+                    log.warning('skipping archive member %s of unknown type',
+                                ent.filename)
+                    continue
+
+                self.owners.append((relPath or '.', _userName(header.uid),
+                                    _groupName(header.gid)))
+
+            # whatever is left are hardlinked empty files
+            for linkList in linkMap.itervalues():
+                relPath, perms, mtime = linkList[0]
+                self._writeFile(relPath, StringIO.StringIO(), perms, mtime)
+                for linkPath, _, _ in linkList[1:]:
+                    self._hardlink(linkPath, relPath)
+        finally:
+            self._finish()
+
+    def extractZip(self, path):
+        """
+        Extracts the zip archive at path. Members are decompressed and
+        written by a pool of threads. Raises ExtractError if the archive
+        can't be read or uses features zipfile doesn't support.
+        """
+        try:
+            archive = zipfile.ZipFile(path)
+            members = archive.infolist()
+        except (zipfile.BadZipfile, zipfile.LargeZipFile, IOError), e:
+            raise ExtractError(str(e))
+
+        for info in members:
+            if info.flag_bits & 0x1:
+                raise ExtractError('%s is encrypted' % info.filename)
+            if info.compress_type not in (zipfile.ZIP_STORED,
+                                          zipfile.ZIP_DEFLATED):
+                raise ExtractError('%s uses unsupported compression type %d'
+                                   % (info.filename, info.compress_type))
+
+        fileList = []
+        symlinkList = []
+        try:
+            for info in members:
+                relPath = self._relPath(info.filename)
+                if relPath is None:
+                    log.warning('skipping archive member %s outside of the '
+                                'destination directory', info.filename)
+                    continue
+
+                mode = info.external_attr >> 16
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                if info.filename.endswith('/') or stat.S_ISDIR(mode):
+                    if info.create_system != 3 or not mode:
+                        mode = 0777 & ~self._umask
+                    self._mkdir(relPath, mode & 0777, mtime)
+                elif info.create_system == 3 and stat.S_ISLNK(mode):
+                    # made once the files are written, so no worker
+                    # writes through them
+                    symlinkList.append((relPath,
+                                        archive.read(info.filename)))
+                else:
+                    if info.create_system != 3 or not mode:
+                        mode = 0666 & ~self._umask
+                    # directories must exist before the workers run
+                    util.mkdirChain(os.path.dirname(self._target(relPath)))
+                    fileList.append((relPath, info, mode & 0777, mtime))
+
+            # members can appear more than once; the last one wins, and
+            # two workers must never write the same path
+            last = dict((x[0], i) for i, x in enumerate(fileList))
+            fileList = [ x for i, x in enumerate(fileList)
+                            if last[x[0]] == i ]
+
+            local = threading.local()
+            handles = []
+            def _extractOne((relPath, info, mode, mtime)):
+                if not hasattr(local, 'archive'):
+                    local.archive = zipfile.ZipFile(path)
+                    handles.append(local.archive)
+                src = local.archive.open(info)
+                self._writeFile(relPath, src, mode, mtime)
+
+            try:
+                for x in threadpool.imap(_extractOne, fileList,
+                                         numThreads = self.numThreads):
+                    pass
+            finally:
+                for handle in handles:
+                    handle.close()
+
+            for relPath, linkTo in symlinkList:
+                self._symlink(relPath, linkTo)
+        finally:
+            archive.close()
+            self._finish()
+
+        # zip archives don't carry ownership information
+        for info in members:
+            relPath = self._relPath(info.filename)
+            if relPath is not None:
+                self.owners.append((relPath or '.', 'root', 'root'))
+
+
+def _userName(uid):
+    try:
+        return pwd.getpwuid(uid)[0]
+    except KeyError:
+        return str(uid)
+
+def _groupName(gid):
+    try:
+        return grp.getgrgid(gid)[0]
+    except KeyError:
+        return str(gid)
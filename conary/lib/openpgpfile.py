@@ -48,9 +48,14 @@ warnings.filterwarnings("ignore", r"the sha module is deprecated",
 from Crypto.PublicKey import DSA
 
 from Crypto.PublicKey import pubkey
+try:
+    from Crypto.PublicKey import _fastmath
+except ImportError:
+    _fastmath = None
 
 from conary import constants
 from conary.lib import util, digestlib
+from conary.lib.ext import bignum
 
 # key types defined in RFC 2440 page 49
 PK_ALGO_RSA                  = 1
@@ -1308,18 +1313,17 @@ class PGP_BaseKeySig(PGP_BasePacket):
 
         ret = []
         for i in range(count):
-            buf = PGP_BaseKeySig._readBin(stream, 2)
-            mLen = (int2FromBytes(*buf) + 7) // 8
+            mLen, = struct.unpack('>H', PGP_BaseKeySig._readExact(stream, 2))
+            mLen = (mLen + 7) // 8
             if discard:
                 # Skip the MPI len
                 PGP_BaseKeySig._readExact(stream, mLen)
                 ret.append(None)
+            elif mLen:
+                data = PGP_BaseKeySig._readExact(stream, mLen)
+                ret.append(long(binascii.hexlify(data), 16))
             else:
-                data = PGP_BaseKeySig._readBin(stream, mLen)
-                r = 0L
-                for i in data:
-                    r = r * 256 + i
-                ret.append(r)
+                ret.append(0L)
         return ret
 
     @staticmethod
@@ -1893,7 +1897,7 @@ class PGP_Signature(PGP_BaseKeySig):
         """Verify the signature on sigString generated with cryptoKey"""
         sigString = PGP_Signature.finalizeSignature(sigString, cryptoKey,
                                                     pubKeyAlg, hashAlg)
-        return cryptoKey.verify(sigString, signature)
+        return verifyWithKey(cryptoKey, sigString, signature)
 
     def initSubPackets(self):
         self._hashedSubPackets = []
@@ -3621,3 +3625,28 @@ def key_type(cryptoKey):
         return 'DSA'
     else:
         raise TypeError("Unrecognized key type: " + keyName)
+
+
+def verifyWithKey(cryptoKey, data, signature):
+    """Verify signature on data with a pycrypto public key. This is the
+    same as cryptoKey.verify(data, signature), but does the modular
+    exponentiation in libgmp when pycrypto was built without it."""
+    if _fastmath is not None or bignum.powm is None:
+        return cryptoKey.verify(data, signature)
+    try:
+        keyType = key_type(cryptoKey)
+    except TypeError:
+        return cryptoKey.verify(data, signature)
+    if isinstance(data, str):
+        data = pubkey.bytes_to_long(data)
+    if keyType == 'RSA':
+        return bignum.powm(signature[0], cryptoKey.e, cryptoKey.n) == data
+    r, s = signature
+    p, q = cryptoKey.p, cryptoKey.q
+    if not (0 < r < q) or not (0 < s < q):
+        return False
+    w = pubkey.inverse(s, q)
+    v = (bignum.powm(cryptoKey.g, (data * w) % q, p) *
+         bignum.powm(cryptoKey.y, (r * w) % q, p)) % p % q
+    return v == r
+
@@ -23,7 +23,7 @@ from time import time
 
 from conary import callbacks, versions
 from conary.lib.util import log
-from conary.lib import graph, util, api
+from conary.lib import graph, util, api, sha1helper
 
 import openpgpfile
 from openpgpfile import BadPassPhrase
@@ -41,7 +41,7 @@ from openpgpfile import TRUST_UNTRUSTED, TRUST_TRUSTED
 
 class OpenPGPKey(object):
     __slots__ = ['fingerprint', 'cryptoKey', 'revoked', 'timestamp',
-                 'trustLevel', 'signatures', 'id']
+                 'trustLevel', 'signatures', 'id', 'sigCache']
     def __init__(self, key, cryptoKey, trustLevel=255):
         """
         Instantiates a OpenPGPKey object
@@ -60,6 +60,7 @@ class OpenPGPKey(object):
         self.revoked, self.timestamp = key.getEndOfLife()
         self.trustLevel = trustLevel
         self.signatures = []
+        self.sigCache = None
         self._initSignatures(key)
 
     def _initSignatures(self, key):
@@ -141,8 +142,17 @@ class OpenPGPKey(object):
         # because in some cases the calling function wants to aggregate a list
         # of failed/passed signatures all at once.
 
-        if (self.fingerprint == sig[0]
-            and self.cryptoKey.verify(data+str(sig[1]), sig[2])):
+        if self.fingerprint != sig[0]:
+            return -1
+
+        data += str(sig[1])
+        if self.sigCache is None:
+            verified = openpgpfile.verifyWithKey(self.cryptoKey, data, sig[2])
+        else:
+            verified = self.sigCache.verified(self, (data, sig[2]),
+                                              openpgpfile.verifyWithKey,
+                                              self.cryptoKey, data, sig[2])
+        if verified:
             return self.trustLevel
         else:
             return -1
@@ -173,10 +183,91 @@ class OpenPGPKeySignature(object):
             return self._verifies
         # We need to get the signer's crypto alg
         sigKey = keyRetrievalCallback(self.signer)
-        self._verifies = openpgpfile.PGP_Signature.verifySignature(self.sigId,
-                sigKey.cryptoKey, self.signature, self.pubKeyAlg, self.hashAlg)
+        args = (self.sigId, sigKey.cryptoKey, self.signature, self.pubKeyAlg,
+                self.hashAlg)
+        if sigKey.sigCache is None:
+            self._verifies = openpgpfile.PGP_Signature.verifySignature(*args)
+        else:
+            self._verifies = sigKey.sigCache.verified(sigKey,
+                    (self.sigId, self.signature, self.pubKeyAlg, self.hashAlg),
+                    openpgpfile.PGP_Signature.verifySignature, *args)
         return self._verifies
 
+class SignatureCache(object):
+    """
+    Remembers which signatures verified, so the public key math for each
+    signature is only done once. Entries are digests of everything the
+    result depends on: the signing key's fingerprint, whether and when it
+    was revoked or expires, and the signed data and signature. A key which
+    gets revoked or has its expiration changed no longer matches the
+    entries made with it. Signatures which fail are not remembered.
+
+    If a path is given, verified signatures are appended to that file as
+    they are found, and the ones found by earlier runs are read from it.
+    """
+    # start over once the file holds this many entries
+    maxEntries = 100000
+
+    def __init__(self, path = None):
+        self.path = path
+        self._verified = None
+
+    def _load(self):
+        self._verified = set()
+        if self.path is None:
+            return
+
+        try:
+            data = open(self.path).read()
+        except (IOError, OSError):
+            return
+
+        if len(data) > self.maxEntries * 20:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            return
+
+        self._verified.update(data[i:i + 20]
+                              for i in xrange(0, len(data) - 19, 20))
+
+    def _save(self, entry):
+        try:
+            util.mkdirChain(os.path.dirname(self.path))
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                         0600)
+            try:
+                os.write(fd, entry)
+            finally:
+                os.close(fd)
+        except (IOError, OSError), e:
+            log.debug('unable to save signature cache %s: %s'
+                      % (self.path, e))
+            self.path = None
+
+    def verified(self, key, sigInfo, verify, *args):
+        """
+        Returns whether the signature described by sigInfo, which was made
+        with key, is valid. verify(*args) is called to find out unless the
+        signature is already known to be good.
+        """
+        if self._verified is None:
+            self._load()
+
+        entry = sha1helper.sha1String(repr((key.fingerprint, key.revoked,
+                                            key.timestamp, sigInfo)))
+        if entry in self._verified:
+            return True
+
+        if not verify(*args):
+            return False
+
+        self._verified.add(entry)
+        if self.path is not None:
+            self._save(entry)
+        return True
+
 class _KeyNotFound(KeyNotFound):
     errorIsUncatchable = True
 
@@ -220,6 +311,8 @@ class OpenPGPKeyFileCache(OpenPGPKeyCache):
         OpenPGPKeyCache.__init__(self)
         self.callback = callback
         self.publicPaths = []
+        self.sigCache = SignatureCache()
+        self._keyringState = None
         self._setPrivateKeyringPath()
 
     def _setPrivateKeyringPath(self, privatePath = None):
@@ -247,6 +340,30 @@ class OpenPGPKeyFileCache(OpenPGPKeyCache):
     def setPrivatePath(self, path):
         self.privatePath = path
 
+    def setSignatureCachePath(self, path):
+        """
+        Remember verified signatures in the file at path, so later runs
+        don't need to verify them again.
+        """
+        self.sigCache = SignatureCache(path)
+
+    def _checkKeyrings(self):
+        # keys parsed from the keyrings are dropped when the keyrings
+        # change, so revocations and new expiration dates are noticed
+        state = []
+        for path in self.publicPaths:
+            try:
+                sb = os.stat(path)
+            except OSError:
+                state.append(None)
+            else:
+                state.append((sb.st_ino, sb.st_size, sb.st_mtime))
+
+        if state != self._keyringState:
+            if self._keyringState is not None:
+                self.publicDict = {}
+            self._keyringState = state
+
     @api.publicApi
     def setCallback(self, callback):
         self.callback = callback
@@ -265,6 +382,7 @@ class OpenPGPKeyFileCache(OpenPGPKeyCache):
         @return: True if the key was found
         """
         # if we have this key cached, return it immediately
+        self._checkKeyrings()
         if keyId in self.publicDict:
             if self.publicDict[keyId] is None:
                 raise _KeyNotFound(keyId)
@@ -296,6 +414,11 @@ class OpenPGPKeyFileCache(OpenPGPKeyCache):
 
 
     def _getPublicKey(self, keyId, label = None, warn = True):
+        key = self._loadPublicKey(keyId, label = label, warn = warn)
+        key.sigCache = self.sigCache
+        return key
+
+    def _loadPublicKey(self, keyId, label = None, warn = True):
         for publicPath in self.publicPaths:
             try:
                 key = seekKeyById(keyId, publicPath)
@@ -0,0 +1,157 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+Helpers for running independent pieces of work on a small pool of threads.
+
+Results are always handed back in the order the work was submitted, so
+callers which need deterministic output (changesets, journals, logs) can
+use these as drop-in replacements for the builtin map functions. Work
+which spends most of its time in C code that drops the interpreter lock
+(zlib, sha1, file and socket I/O) benefits the most.
+"""
+
+import os
+import Queue
+import sys
+import threading
+
+
+def cpuCount():
+    """
+    Returns the number of online processors, or 1 if that can't be
+    determined.
+    """
+    try:
+        count = os.sysconf('SC_NPROCESSORS_ONLN')
+    except (AttributeError, ValueError, OSError):
+        return 1
+    if count < 1:
+        return 1
+    return count
+
+
+def _worker(func, inQueue, results, cond):
+    while True:
+        job = inQueue.get()
+        if job is None:
+            return
+
+        idx, item = job
+        try:
+            ret = (True, func(item))
+        except:
+            ret = (False, sys.exc_info())
+
+        cond.acquire()
+        try:
+            results[idx] = ret
+            cond.notify()
+        finally:
+            cond.release()
+
+
+def imap(func, iterable, numThreads = None, window = None):
+    """
+    Like itertools.imap, but func is called from a pool of worker threads.
+
+    @param func: callable applied to each item
+    @param iterable: items to process; consumed lazily from the calling
+    thread
+    @param numThreads: number of worker threads; defaults to one per
+    online CPU. If 1 or less, no threads are created at all.
+    @type numThreads: int
+    @param window: maximum number of items which have been submitted but
+    whose results have not yet been yielded. Bounds the memory used for
+    results which are produced faster than they are consumed. Defaults to
+    twice the number of threads.
+    @type window: int
+    @return: generator yielding func(item) in the order of iterable. If
+    func raised an exception for an item, it is reraised (with its original
+    traceback) when that item's result is reached.
+    """
+    if numThreads is None:
+        numThreads = cpuCount()
+
+    if numThreads <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    if window is None:
+        window = numThreads * 2
+    window = max(window, 1)
+
+    inQueue = Queue.Queue()
+    results = {}
+    cond = threading.Condition()
+    threads = []
+    for i in range(numThreads):
+        thread = threading.Thread(target = _worker,
+                                  args = (func, inQueue, results, cond))
+        thread.setDaemon(True)
+        thread.start()
+        threads.append(thread)
+
+    try:
+        items = iter(iterable)
+        submitted = 0
+        nextIdx = 0
+        exhausted = False
+        while True:
+            while not exhausted and submitted - nextIdx < window:
+                try:
+                    item = items.next()
+                except StopIteration:
+                    exhausted = True
+                    break
+                inQueue.put((submitted, item))
+                submitted += 1
+
+            if nextIdx == submitted:
+                break
+
+            cond.acquire()
+            try:
+                while nextIdx not in results:
+                    # a timeout keeps us responsive to KeyboardInterrupt
+                    cond.wait(1)
+                ok, ret = results.pop(nextIdx)
+            finally:
+                cond.release()
+
+            nextIdx += 1
+            if not ok:
+                raise ret[0], ret[1], ret[2]
+
+            yield ret
+    finally:
+        for thread in threads:
+            inQueue.put(None)
+        for thread in threads:
+            thread.join()
+
+
+def map(func, iterable, numThreads = None):
+    """
+    Like the builtin map, but func is called from a pool of worker threads.
+    See L{imap} for the meaning of the parameters. Returns a list of
+    results parallel to iterable.
+    """
+    items = list(iterable)
+    return list(imap(func, items, numThreads = numThreads,
+                     window = len(items)))
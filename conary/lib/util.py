@@ -34,6 +34,7 @@ import struct
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import types
 import urllib
@@ -976,16 +977,19 @@ class SeekableNestedFile:
             self.start = start
 
     def _fdInfo(self):
-        if hasattr(self.file, '_fdInfo'):
-            fd, start, size = self.file._fdInfo()
-            start += self.start
-            size = self.size
+        return self._fdRange(0, self.size)
+
+    def _fdRange(self, offset, size):
+        # the range is passed down to the outermost file so files which
+        # are still being written (see netclient._ChangeSetDownload) can
+        # wait for it to be available
+        start = self.start + offset
+        if hasattr(self.file, '_fdRange'):
+            return self.file._fdRange(start, size)
         elif hasattr(self.file, 'fileno'):
-            fd, start, size = self.file.fileno(), self.start, self.size
-        else:
-            return (None, None, None)
+            return (self.file.fileno(), start, size)
 
-        return (fd, start, size)
+        return (None, None, None)
 
     def close(self):
         pass
@@ -2201,15 +2205,20 @@ class DeterministicGzipFile(gzip.GzipFile):
         def time():
             return 0
 
+    # serializes the patching below between threads compressing at once
+    _headerLock = threading.Lock()
+
     def _write_gzip_header(self):
         # Patch the gzip module, not time.time directly, so other threads
         # calling time.time() by other means are not affected.
+        self._headerLock.acquire()
         orig_time = gzip.time
         try:
             gzip.time = self._fake_time
             gzip.GzipFile._write_gzip_header(self)
         finally:
             gzip.time = orig_time
+            self._headerLock.release()
 
 
 # yields sorted paths and their stat bufs
@@ -22,6 +22,7 @@ import os
 import shutil
 import sys
 import tempfile
+import time
 
 #conary
 from conary import constants, files, trove, versions
@@ -58,18 +59,87 @@ class CommitChangeSetFlags(util.Flags):
         return True
 
 
+class RollbackContentStore(datastore.ShallowDataStore):
+    """
+    Pool of file contents shared by all of the rollbacks in a rollback
+    stack. Rollback changesets refer to the contents here by sha1 instead
+    of carrying copies of them.
+    """
+
+    def storeContents(self, contents, compressed):
+        """
+        Adds contents to the pool if it isn't already there.
+        @return: the sha1 of the (uncompressed) contents
+        """
+        util.mkdirChain(self.top)
+        fd, tmpName = tempfile.mkstemp(suffix = ".new", dir = self.top)
+        try:
+            sha1 = self._writeFile(contents.get(), [ fd ], compressed,
+                                   computeSha1 = True)
+        except:
+            os.unlink(tmpName)
+            raise
+
+        path = self.hashToPath(sha1)
+        if os.path.exists(path):
+            os.unlink(tmpName)
+        else:
+            self.makeDir(path)
+            os.rename(tmpName, path)
+
+        return sha1
+
+    def iterContents(self):
+        """
+        Yields (sha1, path) for every item in the pool.
+        """
+        if not os.path.isdir(self.top):
+            return
+
+        for prefix in os.listdir(self.top):
+            dirPath = self.top + '/' + prefix
+            if len(prefix) != 2 or not os.path.isdir(dirPath):
+                continue
+            for rest in os.listdir(dirPath):
+                if len(rest) == 38:
+                    yield prefix + rest, dirPath + '/' + rest
+
+    def __init__(self, topPath):
+        # the pool is created when the first contents are added to it
+        self.top = topPath
+
 class Rollback:
 
     reposName = "%s/repos.%d"
     localName = "%s/local.%d"
+    contentsName = "%s/contents.%d"
+
+    def _poolContents(self, cs):
+        # move the full contents out of the changeset and into the shared
+        # pool; writeToFile(withReferences = True) stores just the sha1
+        sha1s = set()
+        for cache in (cs.configCache, cs.fileContents):
+            for key, (contType, contents, compressed) in cache.items():
+                if contType != changeset.ChangedFileTypes.file:
+                    continue
+                sha1 = self.contentsStore.storeContents(contents, compressed)
+                cache[key] = (contType,
+                              filecontents.CompressedFromDataStore(
+                                            self.contentsStore, sha1),
+                              True)
+                sha1s.add(sha1)
+
+        return sha1s
 
     def add(self, opJournal, repos, local, rollbackScripts):
         reposName = self.reposName % (self.dir, self.count)
         localName = self.localName % (self.dir, self.count)
+        contentsName = self.contentsName % (self.dir, self.count)
         countName = "%s/count" % self.dir
 
         opJournal.create(reposName)
         opJournal.create(localName)
+        opJournal.create(contentsName)
 
         if rollbackScripts:
             # XXX We need to import rollbacks here to avoid a circular
@@ -86,8 +156,17 @@ class Rollback:
 
             rbs.save(self.dir)
 
-        repos.writeToFile(reposName, mode = 0600)
-        local.writeToFile(localName, mode = 0600)
+        sha1s = self._poolContents(repos) | self._poolContents(local)
+        # the list of pooled contents is written first; the pool is only
+        # cleaned against the lists, so anything referenced is kept
+        fd = os.open(contentsName, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0600)
+        os.write(fd, "".join("%s\n" % sha1helper.sha1ToString(x)
+                             for x in sorted(sha1s)))
+        os.close(fd)
+
+        repos.writeToFile(reposName, mode = 0600, withReferences = True)
+        local.writeToFile(localName, mode = 0600, withReferences = True)
 
         if self.count:
             self.count += 1
@@ -102,16 +181,21 @@ class Rollback:
         os.write(fd, "%d\n" % self.count)
         os.close(fd)
 
-    def _getChangeSets(self, item, repos = True, local = True):
+    def _getChangeSets(self, item, repos = True, local = True,
+                       withFiles = True):
         if repos:
             reposCs = changeset.ChangeSetFromFile(
-                                        self.reposName % (self.dir, item))
+                                        self.reposName % (self.dir, item),
+                                        contentsStore = self.contentsStore,
+                                        withFiles = withFiles)
         else:
             reposCs = False
 
         if local:
             localCs = changeset.ChangeSetFromFile(
-                                        self.localName % (self.dir, item))
+                                        self.localName % (self.dir, item),
+                                        contentsStore = self.contentsStore,
+                                        withFiles = withFiles)
         else:
             localCs = False
 
@@ -139,9 +223,29 @@ class Rollback:
         return ret
 
     def getLocalChangeset(self, i):
-        local = changeset.ChangeSetFromFile(self.localName % (self.dir, i))
+        local = changeset.ChangeSetFromFile(self.localName % (self.dir, i),
+                                            contentsStore = self.contentsStore)
         return local
 
+    def iterPooledContents(self):
+        """
+        Yields the sha1s (as hex strings) of the pooled contents this
+        rollback refers to.
+        """
+        for i in range(self.count):
+            try:
+                f = open(self.contentsName % (self.dir, i))
+            except IOError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+                # written before contents were pooled
+                continue
+
+            for line in f:
+                yield line.strip()
+
+            f.close()
+
     def isLocal(self):
         """
         Return True if every element of the rollback is locally available,
@@ -149,7 +253,8 @@ class Rollback:
         """
         for i in range(self.count):
             (reposCs, localCs) = self._getChangeSets(i, repos = True,
-                                                     local = False)
+                                                     local = False,
+                                                     withFiles = False)
             for trvCs in reposCs.iterNewTroveList():
                 if trvCs.getType() == trove.TROVE_TYPE_REDIRECT:
                     return False
@@ -161,13 +266,31 @@ class Rollback:
             return
         os.unlink(self.reposName % (self.dir, self.count - 1))
         os.unlink(self.localName % (self.dir, self.count - 1))
+        contentsName = self.contentsName % (self.dir, self.count - 1)
+        if os.path.exists(contentsName):
+            os.unlink(contentsName)
         self.count -= 1
         open("%s/count" % self.dir, "w").write("%d\n" % self.count)
 
+    def countJobs(self):
+        """
+        Returns the number of non-empty changesets in this rollback; only
+        the trove lists are read to find out.
+        """
+        count = 0
+        for i in range(self.count):
+            for cs in self._getChangeSets(i, withFiles = False):
+                if not cs.isEmpty():
+                    count += 1
+
+        return count
+
     @api.publicApi
-    def iterChangeSets(self):
+    def iterChangeSets(self, withFiles = True):
         """
         Iterate through the list of rollback changesets
+        @param withFiles: if False, the changesets only have the trove
+        changesets loaded (no file streams or contents)
         @raises errors.ConaryError: raised if there's an I/O Error opening a
         changeset file
         @raises repository.filecontainer.BadContainer: raised if the changeset
@@ -177,7 +300,7 @@ class Rollback:
         within a changeset
         """
         for i in range(self.count):
-            csList = self._getChangeSets(i)
+            csList = self._getChangeSets(i, withFiles = withFiles)
             yield csList[0]
             yield csList[1]
 
@@ -186,6 +309,8 @@ class Rollback:
 
     def __init__(self, dir, load = False):
         self.dir = dir
+        self.contentsStore = RollbackContentStore(
+                                    os.path.dirname(dir) + '/contents')
 
         if load:
             self.stored = True
@@ -299,13 +424,13 @@ class RollbackStack:
         dir = self.dir + "/" + "%d" % num
         return Rollback(dir, load = True)
 
-    def removeFirst(self):
+    def removeFirst(self, collect = True):
         name = 'r.%d' % self.first
-        self.remove(name)
+        self.remove(name, collect = collect)
 
-    def removeLast(self):
+    def removeLast(self, collect = True):
         name = 'r.%d' % self.last
-        self.remove(name)
+        self.remove(name, collect = collect)
 
     def getList(self):
         self._ensureReadableRollbackStack()
@@ -315,8 +440,10 @@ class RollbackStack:
 
         return lst
 
-    # name looks like "r.%d"
-    def remove(self, name):
+    # name looks like "r.%d"; callers removing several rollbacks should pass
+    # collect=False and call collectContents() once they are done, as each
+    # collection reads every rollback's contents list and the whole pool
+    def remove(self, name, collect = True):
         rollback = int(name[2:])
         assert(rollback == self.first or rollback == self.last)
 
@@ -333,6 +460,100 @@ class RollbackStack:
             assert(0)
 
         self.writeStatus()
+        if collect:
+            self.collectContents()
+
+    def _iterRollbackDirs(self):
+        for name in os.listdir(self.dir):
+            if name.isdigit():
+                yield self.dir + '/' + name
+
+    def collectContents(self, minAge = 3600):
+        """
+        Removes contents from the shared pool which are no longer referenced
+        by any rollback left on disk. Contents added in the last minAge
+        seconds are kept, since a rollback being written may not have
+        recorded them yet.
+        """
+        store = RollbackContentStore(self.dir + '/contents')
+        if not os.path.isdir(store.top):
+            return
+
+        inUse = set()
+        for rbDir in self._iterRollbackDirs():
+            for name in os.listdir(rbDir):
+                if not name.startswith('contents.'):
+                    continue
+                f = open(rbDir + '/' + name)
+                inUse.update(x.strip() for x in f)
+                f.close()
+
+        cutoff = time.time() - minAge
+        for sha1, path in store.iterContents():
+            if sha1 not in inUse and os.lstat(path).st_mtime <= cutoff:
+                os.unlink(path)
+
+    def _getSizes(self, rollback):
+        # returns the size of the rollback's own files and a dict of the
+        # sizes of the pooled contents it uses
+        rbDir = self.dir + "/%d" % rollback
+        dirSize = 0
+        for name in os.listdir(rbDir):
+            dirSize += os.lstat(rbDir + '/' + name).st_size
+
+        rb = Rollback(rbDir, load = True)
+        pooled = {}
+        for sha1 in rb.iterPooledContents():
+            try:
+                path = rb.contentsStore.hashToPath(sha1)
+                pooled[sha1] = os.stat(path).st_size
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+        return dirSize, pooled
+
+    def prune(self, maxCount = None, maxSize = None):
+        """
+        Removes the oldest rollbacks until at most maxCount are left and
+        they (including the pooled contents they use) take up no more than
+        maxSize bytes. The newest rollback is never removed for size alone.
+        """
+        self._ensureReadableRollbackStack()
+
+        removeCount = 0
+        if maxCount is not None:
+            removeCount = max(0, self.last - self.first + 1 - maxCount)
+
+        if maxSize is not None:
+            sizes = [ self._getSizes(x) for x in
+                            range(self.first + removeCount, self.last + 1) ]
+
+            def _totalSize(sizes):
+                pooled = {}
+                for dirSize, rbPooled in sizes:
+                    pooled.update(rbPooled)
+                return sum(x[0] for x in sizes) + sum(pooled.itervalues())
+
+            while len(sizes) > 1 and _totalSize(sizes) > maxSize:
+                sizes.pop(0)
+                removeCount += 1
+
+        if not removeCount:
+            return 0
+
+        for i in range(removeCount):
+            try:
+                shutil.rmtree(self.dir + "/%d" % self.first)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+            self.first += 1
+
+        self.writeStatus()
+        self.collectContents()
+
+        return removeCount
 
     def invalidate(self):
         """
@@ -1190,7 +1411,7 @@ class UpdateJob:
         return iter(sorted(self._capsuleTypes))
 
     def __init__(self, db, searchSource = None, lazyCache = None,
-                 closeDatabase = True):
+                 closeDatabase = True, spillDir = None):
         # 20070714: lazyCache can be None for the users of the old API (when
         # an update job was instantiated directly, instead of using the
         # client's newUpdateJob(). At some point we should deprecate that.
@@ -1201,7 +1422,8 @@ class UpdateJob:
         self.pinMapping = set()
         self.rollback = None
         self.closeDatabase = closeDatabase
-        self.troveSource = trovesource.ChangesetFilesTroveSource(db)
+        self.troveSource = trovesource.ChangesetFilesTroveSource(db,
+                                                    spillDir = spillDir)
         self.primaries = set()
         self.criticalJobs = []
         # Changesets with files - a parallel list to self.jobs
@@ -2599,6 +2821,8 @@ class Database(SqlDbRepository):
 
             shutil.rmtree(self.rollbackCache + '/' + "%d" % num)
 
+        self.rollbackStack.collectContents()
+
     def applyRollbackList(self, *args, **kwargs):
         try:
             self.commitLock(True)
@@ -2646,14 +2870,7 @@ class Database(SqlDbRepository):
         totalCount = 0
         for name in names:
             rb = self.rollbackStack.getRollback(name)
-            totalCount += 0
-
-            for i in xrange(rb.getCount()):
-                (reposCs, localCs) = rb.getLast()
-                if not reposCs.isEmpty():
-                    totalCount += 1
-                if not localCs.isEmpty():
-                    totalCount += 1
+            totalCount += rb.countJobs()
 
         itemCount = 0
         for i, name in enumerate(names):
@@ -2774,7 +2991,11 @@ class Database(SqlDbRepository):
                 lastFsJob.runPostScripts(tagScript)
 
             self.rollbackStack.restoreSystemModel()
-            self.rollbackStack.removeLast()
+            self.rollbackStack.removeLast(collect = False)
+
+        # pooled contents are collected once for all of the rollbacks
+        # applied; if one fails, the next collection picks up after it
+        self.rollbackStack.collectContents()
 
     def _getChangesetPreScripts(self, cs, updJob):
         preScripts = []
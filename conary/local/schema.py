@@ -397,6 +397,34 @@ def setupTempTables(db, cu=None, skipCommit=False):
         ) %(TABLEOPTS)s""" % db.keywords, start_transaction=False)
         db.tempTables["getFilesTbl"] = True
 
+    if "checkPathsTbl" not in db.tempTables:
+        cu.execute("""
+        CREATE TEMPORARY TABLE checkPathsTbl(
+            path %(STRING)s
+        ) %(TABLEOPTS)s""" % db.keywords, start_transaction=False)
+        db.tempTables["checkPathsTbl"] = True
+
+    # staging tables for the files and tags of a trove being added
+    if "newFilesTbl" not in db.tempTables:
+        cu.execute("""
+        CREATE TEMPORARY TABLE newFilesTbl(
+            pathId      BLOB,
+            versionId   INTEGER,
+            path        %(PATHTYPE)s,
+            fileId      BLOB,
+            stream      BLOB,
+            isPresent   INTEGER
+        ) %(TABLEOPTS)s""" % db.keywords, start_transaction=False)
+        db.tempTables["newFilesTbl"] = True
+
+    if "newFileTagsTbl" not in db.tempTables:
+        cu.execute("""
+        CREATE TEMPORARY TABLE newFileTagsTbl(
+            pathId      BLOB,
+            tag         %(STRING)s
+        ) %(TABLEOPTS)s""" % db.keywords, start_transaction=False)
+        db.tempTables["newFileTagsTbl"] = True
+
     if not skipCommit:
         db.commit()
 
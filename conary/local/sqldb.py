@@ -120,9 +120,10 @@ class DBTroveFiles:
 
         streamId = cu.lastrowid
 
-        for tag in tags:
-            cu.execute("INSERT INTO DBFileTags(streamId, tagId) VALUES (?, ?)",
-                       streamId, self.tags[tag])
+        if tags:
+            cu.executemany("INSERT INTO DBFileTags(streamId, tagId) "
+                           "VALUES (?, ?)",
+                           [ (streamId, self.tags[tag]) for tag in tags ])
 
     def iterPath(self, path):
         cu = self.db.cursor()
@@ -676,9 +677,9 @@ order by
                 empty INTEGER,
                 flavor %(STRING)s
             )""" % self.db.keywords)
-            for flavor in self.flavorsNeeded.keys():
-                cu.execute("INSERT INTO flavorsNeeded VALUES(?, ?)",
-                           None, flavor.freeze())
+            cu.executemany("INSERT INTO flavorsNeeded VALUES(?, ?)",
+                           [ (None, flavor.freeze())
+                             for flavor in self.flavorsNeeded ])
             cu.execute("""
             INSERT INTO Flavors (flavorId, flavor)
             SELECT flavorsNeeded.empty, flavorsNeeded.flavor
@@ -803,24 +804,9 @@ order by
 
         self._sanitizeTroveCollection(cu, troveInstanceId)
 
-        cu.execute("""CREATE TEMPORARY TABLE NewFiles (
-                        pathId BLOB,
-                        versionId INTEGER,
-                        path %(PATHTYPE)s,
-                        fileId BLOB,
-                        stream BLOB,
-                        isPresent INTEGER)""" % self.db.keywords)
-
-        cu.execute("""CREATE TEMPORARY TABLE NewFileTags (
-                        pathId BLOB,
-                        tag %(STRING)s)""" % self.db.keywords)
-
-        stmt = cu.compile("""
-                INSERT INTO NewFiles (pathId, versionId, path, fileId,
-                                      stream, isPresent)
-                        VALUES (?, ?, ?, ?, ?, ?)""")
-
-        return (cu, troveInstanceId, stmt, oldTroveId)
+        # rows for the files, tags, and file moves are collected by
+        # addFile() and written out together by addTroveDone()
+        return (cu, troveInstanceId, [], [], [], oldTroveId)
 
     def _sanitizeTroveCollection(self, cu, instanceId, nameHint = None):
         # examine the list of present, missing, and not inPristine troves
@@ -924,50 +910,65 @@ order by
 
     def addFile(self, troveInfo, pathId, path, fileId, fileVersion,
                 fileStream = None, isPresent = True):
-        (cu, troveInstanceId, addFileStmt, oldInstanceId) = troveInfo
+        (cu, troveInstanceId, newFiles, newTags, movedFiles,
+                                            oldInstanceId) = troveInfo
         versionId = self.getVersionId(fileVersion, self.addVersionCache)
 
         if fileStream:
-            cu.execstmt(addFileStmt, pathId, versionId, path, fileId,
-                        fileStream, isPresent)
+            newFiles.append((pathId, versionId, path, fileId,
+                             fileStream, isPresent))
 
             tags = files.frozenFileTags(fileStream)
 
             if tags:
-                cu.executemany("INSERT INTO NewFileTags VALUES (?, ?)",
-                               itertools.izip(itertools.repeat(pathId), tags))
+                newTags.extend(itertools.izip(itertools.repeat(pathId), tags))
         else:
-            cu.execute("""
-              UPDATE DBTroveFiles
-                  SET instanceId=?, isPresent=?, path=?, versionId=?
-                  WHERE pathId=? AND instanceId=?""",
-                    troveInstanceId, isPresent, path, versionId,
-                    pathId, oldInstanceId)
+            movedFiles.append((troveInstanceId, isPresent, path, versionId,
+                               pathId, oldInstanceId))
 
     def addTroveDone(self, troveInfo):
-        (cu, troveInstanceId, addFileStmt, oldInstanceId) = troveInfo
+        (cu, troveInstanceId, newFiles, newTags, movedFiles,
+                                            oldInstanceId) = troveInfo
 
-        cu.execute("""
-            INSERT INTO DBTroveFiles (pathId, versionId, path, fileId,
-                                      instanceId, isPresent, stream)
-                        SELECT pathId, versionId, path, fileId, %d,
-                               isPresent, stream FROM NewFiles"""
-               % troveInstanceId)
-        cu.execute("""
-            INSERT INTO Tags (tag) SELECT DISTINCT
-                NewFileTags.tag FROM NewFileTags
-                LEFT OUTER JOIN Tags USING (tag)
-                WHERE Tags.tag is NULL
-        """)
-        cu.execute("""
-            INSERT INTO DBFileTags (streamId, tagId)
-                SELECT streamId, tagId FROM
-                    DBTroveFiles JOIN NewFileTags USING (pathId)
-                    JOIN Tags USING (tag)
-                    WHERE instanceId = ?""", troveInstanceId)
+        if movedFiles:
+            cu.executemany("""
+              UPDATE DBTroveFiles
+                  SET instanceId=?, isPresent=?, path=?, versionId=?
+                  WHERE pathId=? AND instanceId=?""", movedFiles)
+
+        if newFiles:
+            schema.resetTable(cu, 'newFilesTbl')
+            self.db.bulkload('newFilesTbl', newFiles,
+                             [ 'pathId', 'versionId', 'path', 'fileId',
+                               'stream', 'isPresent' ],
+                             start_transaction = False)
+            cu.execute("""
+                INSERT INTO DBTroveFiles (pathId, versionId, path, fileId,
+                                          instanceId, isPresent, stream)
+                            SELECT pathId, versionId, path, fileId, %d,
+                                   isPresent, stream FROM newFilesTbl"""
+                   % troveInstanceId)
+            schema.resetTable(cu, 'newFilesTbl')
+
+        if newTags:
+            schema.resetTable(cu, 'newFileTagsTbl')
+            self.db.bulkload('newFileTagsTbl', newTags, [ 'pathId', 'tag' ],
+                             start_transaction = False)
+            cu.execute("""
+                INSERT INTO Tags (tag) SELECT DISTINCT
+                    newFileTagsTbl.tag FROM newFileTagsTbl
+                    LEFT OUTER JOIN Tags USING (tag)
+                    WHERE Tags.tag is NULL
+            """)
+            cu.execute("""
+                INSERT INTO DBFileTags (streamId, tagId)
+                    SELECT streamId, tagId FROM
+                        DBTroveFiles JOIN newFileTagsTbl USING (pathId)
+                        JOIN Tags USING (tag)
+                        WHERE instanceId = ?""", troveInstanceId)
+            schema.resetTable(cu, 'newFileTagsTbl')
 
-        cu.execute("DROP TABLE NewFiles")
-        cu.execute("DROP TABLE NewFileTags")
+        del newFiles[:], newTags[:], movedFiles[:]
 
         return troveInstanceId
 
@@ -1010,55 +1011,70 @@ order by
     def checkPathConflicts(self, instanceIdList, replaceCheck, sharedFiles):
         cu = self.db.cursor()
         cu2 = self.db.cursor()
-        cu.execute("CREATE TEMPORARY TABLE NewInstances (instanceId integer)")
-        for instanceId in instanceIdList:
-            cu.execute("INSERT INTO NewInstances (instanceId) VALUES (?)",
-                       instanceId)
 
+        # index the files being added by path
+        addedPaths = {}
+        for instanceId in instanceIdList:
+            cu.execute("""
+                SELECT path, streamId, pathId, fileId FROM DBTroveFiles
+                    WHERE instanceId = ? AND isPresent = 1""", instanceId)
+            for path, streamId, pathId, fileId in cu:
+                addedPaths.setdefault(path, []).append(
+                                    (instanceId, streamId, pathId, fileId))
+
+        if not addedPaths:
+            return {}
+
+        # look up those paths through the path index, rather than joining
+        # the added files against every file on the system. Most paths
+        # don't conflict with anything, so only the instance and file ids
+        # are read here.
+        schema.resetTable(cu, 'checkPathsTbl')
+        cu.executemany('INSERT INTO checkPathsTbl (path) VALUES (?)',
+                       ((x,) for x in addedPaths), start_transaction = False)
         cu.execute("""
-            SELECT AddedFiles.path,
-                   ExistingInstances.instanceId, ExistingFiles.pathId,
-                   ExistingFiles.stream,
-                   ExistingInstances.troveName, ExistingVersions.version,
-                   ExistingFlavors.flavor,
-                   AddedInstances.instanceId, AddedFiles.pathId,
-                   AddedFiles.stream,
-                   AddedInstances.troveName,
-                   AddedVersions.version, AddedFlavors.flavor
-
-                FROM NewInstances
-                JOIN DBTroveFiles AS AddedFiles USING (instanceId)
-                JOIN DBTroveFiles AS ExistingFiles ON
-                    AddedFiles.path = ExistingFiles.path AND
-                    AddedFiles.instanceId != ExistingFiles.instanceId
-
-                JOIN Instances AS ExistingInstances ON
-                    ExistingFiles.instanceId = ExistingInstances.instanceId
-                JOIN Versions AS ExistingVersions ON
-                    ExistingInstances.versionId = ExistingVersions.versionId
-                JOIN Flavors AS ExistingFlavors ON
-                    ExistingInstances.flavorId = ExistingFlavors.flavorId
-
-                JOIN Instances AS AddedInstances ON
-                    AddedInstances.instanceId = NewInstances.instanceId
-                JOIN Versions AS AddedVersions ON
-                    AddedInstances.versionId = AddedVersions.versionId
-                JOIN Flavors AS AddedFlavors ON
-                    AddedInstances.flavorId = AddedFlavors.flavorId
-
-                WHERE
-                    AddedFiles.isPresent = 1 AND
-                    ExistingFiles.isPresent = 1 AND
-                    AddedFiles.fileId != ExistingFiles.fileId
+            SELECT DBTroveFiles.path, instanceId, streamId, pathId, fileId
+                FROM checkPathsTbl CROSS JOIN DBTroveFiles ON
+                    DBTroveFiles.path = checkPathsTbl.path
+                WHERE isPresent = 1
         """)
 
+        candidates = []
+        for (path, existingInstanceId, existingStreamId, existingPathId,
+                existingFileId) in cu:
+            for (addedInstanceId, addedStreamId, addedPathId,
+                    addedFileId) in addedPaths[path]:
+                if (existingInstanceId != addedInstanceId and
+                            existingFileId != addedFileId):
+                    candidates.append((path,
+                            existingInstanceId, existingStreamId,
+                            existingPathId,
+                            addedInstanceId, addedStreamId, addedPathId))
+
+        instanceCache = {}
+        def _instanceInfo(instanceId):
+            info = instanceCache.get(instanceId)
+            if info is None:
+                cu.execute("""
+                    SELECT troveName, version, flavor FROM Instances
+                        JOIN Versions USING (versionId)
+                        JOIN Flavors USING (flavorId)
+                        WHERE instanceId = ?""", instanceId)
+                info = instanceCache[instanceId] = cu.next()
+
+            return info
+
+        def _stream(streamId):
+            cu.execute("SELECT stream FROM DBTroveFiles WHERE streamId = ?",
+                       streamId)
+            return cu.next()[0]
+
         conflicts = []
         replaced = {}
-        #import epdb;epdb.st()
-        for (path, existingInstanceId, existingPathId, existingStream,
-             existingTroveName, existingVersion, existingFlavor,
-             addedInstanceId, addedPathId, addedStream, addedTroveName,
-             addedVersion, addedFlavor) in cu:
+        for (path, existingInstanceId, existingStreamId, existingPathId,
+             addedInstanceId, addedStreamId, addedPathId) in candidates:
+            (existingTroveName, existingVersion,
+             existingFlavor) = _instanceInfo(existingInstanceId)
             if existingPathId in sharedFiles.get(
                        (existingTroveName,
                         versions.VersionFromString(existingVersion),
@@ -1067,8 +1083,9 @@ order by
 
             replaceExisting = False
 
-            addedFile = files.ThawFile(addedStream, addedPathId)
-            existingFile = files.ThawFile(existingStream, existingPathId)
+            addedFile = files.ThawFile(_stream(addedStreamId), addedPathId)
+            existingFile = files.ThawFile(_stream(existingStreamId),
+                                          existingPathId)
 
             if addedFile.compatibleWith(existingFile):
                 continue
@@ -1112,6 +1129,8 @@ order by
                 # generation code not to look on the disk for file contents.
                 l.append((existingPathId, None, None))
             else:
+                (addedTroveName, addedVersion,
+                 addedFlavor) = _instanceInfo(addedInstanceId)
                 conflicts.append((path,
                         (existingPathId,
                          (existingTroveName,
@@ -1122,8 +1141,6 @@ order by
                           versions.VersionFromString(addedVersion),
                           deps.deps.ThawFlavor(addedFlavor)))))
 
-        cu.execute("DROP TABLE NewInstances")
-
         if conflicts:
             raise errors.DatabasePathConflicts(conflicts)
 
@@ -2548,6 +2548,9 @@ class HandlerInfo:
             l.append(tagInfo)
 
 class TagCommand:
+    # the most tag handlers which are run at the same time
+    maxConcurrent = 4
+
     def __init__(self, callback):
         self.commandOrder = (
             ('handler', 'preremove'),
@@ -2598,10 +2601,11 @@ class TagCommand:
             # where we're running programs instead.
             f = open(tagScript, "a")
             for (updateType, updateClass) in self.commandOrder:
-                for handler in sorted(self.commands[updateType][updateClass]):
-                    # stable sort order to be able to reproduce bugs,
-                    # whether in conary or in the packaged software
-                    hi = self.commands[updateType][updateClass][handler]
+                handlers = self.commands[updateType][updateClass]
+                # scripts run their handlers one at a time, in the same
+                # order they would be started in below
+                for handler in self._orderHandlers(handlers):
+                    hi = handlers[handler]
                     tagInfoList = hi.tagToFile.keys()
                     if (len(tagInfoList) > 1):
                         # multiple tags for one tag handler
@@ -2641,152 +2645,258 @@ class TagCommand:
         # N.B. All changes in the logic for writing scripts need to
         # be paralleled by changes above in the tagScript branch,
         # where we're writing scripts instead.
-        tagHandlerOutput = self.callback.tagHandlerOutput
         for (updateType, updateClass) in self.commandOrder:
-            for handler in sorted(self.commands[updateType][updateClass]):
-                # stable sort order
-                hi = self.commands[updateType][updateClass][handler]
-                tagInfoList = hi.tagToFile.keys()
-
-                # start building the command line -- all the tag
-                # handler protocols begin the same way
-                command = [handler, updateType, updateClass]
-                if (len(tagInfoList) > 1):
-                    # multiple tags for one tag handler
-                    if self._badMultiTag(handler, tagInfoList):
+            handlers = self.commands[updateType][updateClass]
+            # handlers which are running or have output left to report, in
+            # the order they were started
+            running = []
+            try:
+                for handler in self._orderHandlers(handlers):
+                    hi = handlers[handler]
+                    tagInfoList = hi.tagToFile.keys()
+
+                    # start building the command line -- all the tag
+                    # handler protocols begin the same way
+                    command = [handler, updateType, updateClass]
+                    if (len(tagInfoList) > 1):
+                        # multiple tags for one tag handler
+                        if self._badMultiTag(handler, tagInfoList):
+                            break
+                        datasource = 'multitag'
+                    else:
+                        tagInfo = tagInfoList.pop()
+                        datasource = tagInfo.datasource
+
+                    # if the handler uses the command line argument
+                    # protocol, add all the filenames to the command line
+                    if datasource == 'args':
+                        command.extend(sorted(hi.tagToFile[tagInfo]))
+
+                    # double check that we're using a known protocol
+                    if datasource not in ('multitag', 'args', 'stdin'):
+                        self.callback.error('unknown datasource %s' %datasource)
                         break
-                    datasource = 'multitag'
-                else:
-                    tagInfo = tagInfoList.pop()
-                    datasource = tagInfo.datasource
 
-                # if the handler uses the command line argument
-                # protocol, add all the filenames to the command line
-                if datasource == 'args':
-                    command.extend(sorted(hi.tagToFile[tagInfo]))
+                    log.debug("running %s", " ".join(command))
+                    if root != '/' and uid:
+                        continue
 
-                # double check that we're using a known protocol
-                if datasource not in ('multitag', 'args', 'stdin'):
-                    self.callback.error('unknown datasource %s' %datasource)
+                    if datasource in ('args', 'stdin'):
+                        tagName = tagInfo.tag
+                    else:
+                        tagName = ' '.join(
+                            sorted(x.tag for x in hi.tagToFile.keys()))
+
+                    # handlers which may run alongside others wait only for
+                    # the ones they are declared to run after; anything else
+                    # runs on its own
+                    concurrent = len([ x for x in hi.tagToFile.keys()
+                                       if not x.concurrent ]) == 0
+                    after = set(self._handlerDeps(handlers, handler))
+                    while running and (not concurrent or
+                            len(running) >= self.maxConcurrent or
+                            [ x for x in running if x.handler in after and
+                                                    not x.done ] or
+                            [ x for x in running if not x.concurrent ]):
+                        self._pollHandlers(running)
+
+                    proc = self._startHandler(root, command, datasource,
+                                              tagInfo, hi)
+                    proc.handler = handler
+                    proc.tagName = tagName
+                    proc.concurrent = concurrent
+                    running.append(proc)
+                    self._reportHandlers(running)
+            finally:
+                while running:
+                    self._pollHandlers(running)
+
+    def _handlerDeps(self, handlers, handler):
+        # handlers in the same phase which this handler is declared to run
+        # after
+        afterTags = set()
+        for tagInfo in handlers[handler].tagToFile:
+            afterTags.update(tagInfo.after)
+
+        for otherHandler, hi in handlers.iteritems():
+            if otherHandler == handler:
+                continue
+            for tagInfo in hi.tagToFile:
+                if tagInfo.tag in afterTags:
+                    yield otherHandler
                     break
 
-                log.debug("running %s", " ".join(command))
-                if root != '/' and uid:
-                    continue
+    def _orderHandlers(self, handlers):
+        # stable sort order to be able to reproduce bugs, whether in conary
+        # or in the packaged software; handlers are moved after the ones
+        # they are declared to run after. Loops are broken by falling back
+        # to the sorted order.
+        deps = dict((x, set(self._handlerDeps(handlers, x)))
+                    for x in handlers)
+        order = []
+        left = sorted(handlers)
+        while left:
+            ready = [ x for x in left if not deps[x] - set(order) ]
+            if ready:
+                handler = ready[0]
+            else:
+                handler = left[0]
+            order.append(handler)
+            left.remove(handler)
+
+        return order
 
-                inputPipe = os.pipe()
-                inputPid = None
-
-                if datasource != 'args':
-                    # fork a separate process to feed stdin
-                    inputPid = os.fork()
-                    if inputPid == 0:
-                        try:
-                            os.close(inputPipe[0])
-                            if datasource == 'stdin':
-                                for filename in sorted(hi.tagToFile[tagInfo]):
-                                    try:
-                                        os.write(inputPipe[1], filename + "\n")
-                                    except OSError, e:
-                                        if e.errno != errno.EPIPE:
-                                            raise
-                                        self.callback.error(str(e))
-                                        break
-                            elif datasource == 'multitag':
-                                for fileName in sorted(hi.fileToTag):
-                                    try:
-                                        os.write(inputPipe[1],
-                                            "%s\n%s\n" %(" ".join(
-                                            sorted([x.tag for x in
-                                                    hi.fileToTag[fileName]])),
-                                            fileName))
-                                    except OSError, e:
-                                        if e.errno != errno.EPIPE:
-                                            raise
-                                        self.callback.error(str(e))
-                                        break
-                            os._exit(0)
-                        except Exception, err:
+    def _startHandler(self, root, command, datasource, tagInfo, hi):
+        inputPipe = os.pipe()
+        inputPid = None
+
+        if datasource != 'args':
+            # fork a separate process to feed stdin
+            inputPid = os.fork()
+            if inputPid == 0:
+                try:
+                    os.close(inputPipe[0])
+                    if datasource == 'stdin':
+                        for filename in sorted(hi.tagToFile[tagInfo]):
+                            try:
+                                os.write(inputPipe[1], filename + "\n")
+                            except OSError, e:
+                                if e.errno != errno.EPIPE:
+                                    raise
+                                self.callback.error(str(e))
+                                break
+                    elif datasource == 'multitag':
+                        for fileName in sorted(hi.fileToTag):
                             try:
-                                sys.stderr.write('%s\n' %err)
-                            finally:
-                                os._exit(1)
-                os.close(inputPipe[1])
+                                os.write(inputPipe[1],
+                                    "%s\n%s\n" %(" ".join(
+                                    sorted([x.tag for x in
+                                            hi.fileToTag[fileName]])),
+                                    fileName))
+                            except OSError, e:
+                                if e.errno != errno.EPIPE:
+                                    raise
+                                self.callback.error(str(e))
+                                break
+                    os._exit(0)
+                except Exception, err:
+                    try:
+                        sys.stderr.write('%s\n' %err)
+                    finally:
+                        os._exit(1)
+        os.close(inputPipe[1])
 
-                stdoutPipe = os.pipe()
-                stderrPipe = os.pipe()
+        stdoutPipe = os.pipe()
+        stderrPipe = os.pipe()
 
-                pid = os.fork()
+        pid = os.fork()
 
-                if not pid:
-                    try:
-                        os.dup2(inputPipe[0], 0)
-                        os.dup2(stdoutPipe[1], 1)
-                        os.dup2(stderrPipe[1], 2)
-
-                        os.close(inputPipe[0])
-                        os.close(stdoutPipe[0])
-                        os.close(stdoutPipe[1])
-                        os.close(stderrPipe[0])
-                        os.close(stderrPipe[1])
-
-                        util.massCloseFileDescriptors(3, 252)
-
-                        # CNY-1158: control the child process' environment
-                        env = { 'PATH' : "/sbin:/bin:/usr/sbin:/usr/bin" }
-                        os.chdir(root)
-                        if root != '/':
-                            assert(root[0] == '/')
-                            os.chroot(root)
-                        os.execve(command[0], command, env)
-                    except Exception, e:
-                        try:
-                            sys.stderr.write('%s\n' %e)
-                        finally:
-                            os._exit(1)
+        if not pid:
+            try:
+                os.dup2(inputPipe[0], 0)
+                os.dup2(stdoutPipe[1], 1)
+                os.dup2(stderrPipe[1], 2)
 
                 os.close(inputPipe[0])
+                os.close(stdoutPipe[0])
                 os.close(stdoutPipe[1])
+                os.close(stderrPipe[0])
                 os.close(stderrPipe[1])
 
-                stdoutReader = util.LineReader(stdoutPipe[0])
-                stderrReader = util.LineReader(stderrPipe[0])
-                poller = select.poll()
-                poller.register(stdoutPipe[0], select.POLLIN)
-                poller.register(stderrPipe[0], select.POLLIN)
+                util.massCloseFileDescriptors(3, 252)
 
-                count = 2
-                if datasource in ('args', 'stdin'):
-                    tagName = tagInfo.tag
-                else:
-                    tagName = ' '.join(
-                        sorted(x.tag for x in hi.tagToFile.keys()))
-                while count:
-                    fds = [ x[0] for x in poller.poll() ]
-                    for (fd, reader, isError) in (
-                                (stdoutPipe[0], stdoutReader, False),
-                                (stderrPipe[0], stderrReader, True) ):
-                        if fd not in fds: continue
-                        lines = reader.readlines()
-
-                        if lines == None:
-                            poller.unregister(fd)
-                            count -= 1
-                        else:
-                            for line in lines:
-                                # lines should always end with newline
-                                if line[-1] != '\n':
-                                    line += '\n'
-                                tagHandlerOutput(tagName, line,
-                                                 stderr = isError)
-
-                if inputPid is not None:
-                    os.waitpid(inputPid, 0)
-                (id, status) = os.waitpid(pid, 0)
-                if not os.WIFEXITED(status) or os.WEXITSTATUS(status):
-                    self.callback.error("%s failed", command[0])
-                os.close(stdoutPipe[0])
-                os.close(stderrPipe[0])
+                # CNY-1158: control the child process' environment
+                env = { 'PATH' : "/sbin:/bin:/usr/sbin:/usr/bin" }
+                os.chdir(root)
+                if root != '/':
+                    assert(root[0] == '/')
+                    os.chroot(root)
+                os.execve(command[0], command, env)
+            except Exception, e:
+                try:
+                    sys.stderr.write('%s\n' %e)
+                finally:
+                    os._exit(1)
+
+        os.close(inputPipe[0])
+        os.close(stdoutPipe[1])
+        os.close(stderrPipe[1])
+
+        return _TagHandlerProcess(command, pid, inputPid,
+                                  stdoutPipe[0], stderrPipe[0])
+
+    def _pollHandlers(self, running):
+        # wait for output from (or the exit of) any of the running handlers
+        fdMap = {}
+        poller = select.poll()
+        for proc in running:
+            for fd in proc.readers:
+                fdMap[fd] = proc
+                poller.register(fd, select.POLLIN)
+
+        if fdMap:
+            for fd, event in poller.poll():
+                fdMap[fd].read(fd)
+
+        for proc in running:
+            if not proc.readers and not proc.done:
+                proc.wait()
+
+        self._reportHandlers(running)
+
+    def _reportHandlers(self, running):
+        # Output is passed on in the order the handlers were started,
+        # exactly as if they had run one after another. The first handler
+        # in the list reports its output as it arrives; the others hold
+        # theirs until the ones before them are finished.
+        tagHandlerOutput = self.callback.tagHandlerOutput
+        while running:
+            proc = running[0]
+            for line, isError in proc.output:
+                # lines should always end with newline
+                if line[-1] != '\n':
+                    line += '\n'
+                tagHandlerOutput(proc.tagName, line, stderr = isError)
+            proc.output = []
+
+            if not proc.done:
+                break
+
+            if proc.failed:
+                self.callback.error("%s failed", proc.command[0])
+            del running[0]
+
+class _TagHandlerProcess:
+    """
+    A tag handler which has been started by L{TagCommand}, along with the
+    output it has written which hasn't been reported yet.
+    """
+
+    def __init__(self, command, pid, inputPid, stdoutFd, stderrFd):
+        self.command = command
+        self.pid = pid
+        self.inputPid = inputPid
+        self.readers = { stdoutFd : (util.LineReader(stdoutFd), False),
+                         stderrFd : (util.LineReader(stderrFd), True) }
+        self.output = []
+        self.done = False
+        self.failed = False
+
+    def read(self, fd):
+        reader, isError = self.readers[fd]
+        lines = reader.readlines()
+        if lines == None:
+            del self.readers[fd]
+            os.close(fd)
+        else:
+            self.output.extend((x, isError) for x in lines)
+
+    def wait(self):
+        if self.inputPid is not None:
+            os.waitpid(self.inputPid, 0)
+        (id, status) = os.waitpid(self.pid, 0)
+        self.failed = not os.WIFEXITED(status) or os.WEXITSTATUS(status)
+        self.done = True
 
 def silentlyShare(newF, oldF, contentsSufficient = False):
     # Can the file already on the disk (oldF) be shared with the new file
@@ -20,6 +20,7 @@ import errno
 import gzip
 import itertools
 import os
+import tempfile
 
 try:
     from cStringIO import StringIO as _StringIO
@@ -29,7 +30,7 @@ except ImportError:
 
 from conary import files, rpmhelper, streams, trove, versions
 from conary.lib import base85, enum, log, patch, sha1helper, util, api
-from conary.lib import cpiostream
+from conary.lib import cpiostream, threadpool
 from conary.lib import fixeddifflib
 from conary.lib.ext import pack
 from conary.repository import filecontainer, filecontents, errors
@@ -84,12 +85,84 @@ class FileInfo(streams.StreamSet):
             self.newFileId.set(newFileId)
             self.csInfo.set(csInfo)
 
+class TroveChangeSetSpill(object):
+
+    """
+    Anonymous temporary file which frozen trove changesets are written
+    to, letting a changeset keep only the keys for its troves in memory.
+    """
+
+    def __init__(self, tmpDir = None):
+        (fd, path) = tempfile.mkstemp(dir = tmpDir, suffix = '.trvcs')
+        os.unlink(path)
+        self.f = util.ExtendedFdopen(fd)
+        self.size = 0
+
+    def store(self, trvCs):
+        frz = trvCs.freeze()
+        self.f.pwrite(frz, self.size)
+        spilled = _SpilledTroveChangeSet(self, self.size, len(frz))
+        self.size += len(frz)
+        return spilled
+
+class _SpilledTroveChangeSet(object):
+
+    __slots__ = [ 'spill', 'offset', 'size' ]
+
+    def __init__(self, spill, offset, size):
+        self.spill = spill
+        self.offset = offset
+        self.size = size
+
+    def freeze(self):
+        return self.spill.f.pread(self.size, self.offset)
+
+    def thaw(self):
+        return trove.ThawTroveChangeSet(self.freeze())
+
+def _unspill(trvCs):
+    if isinstance(trvCs, _SpilledTroveChangeSet):
+        return trvCs.thaw()
+    return trvCs
+
 class ChangeSetNewTroveList(dict, streams.InfoStream):
 
+    # Entries may have been spilled to disk; they are thawed again each
+    # time they are looked up, so changes made to a trove changeset
+    # returned from a spilled list are not kept.
+
     def freeze(self, skipSet = None):
-        l = [ x[1].freeze() for x in sorted(self.items()) ]
+        l = [ x[1].freeze() for x in sorted(dict.items(self)) ]
         return pack.pack("!" + "SI" * len(l), *l)
 
+    def spill(self, spillFile):
+        for key, trvCs in dict.items(self):
+            if not isinstance(trvCs, _SpilledTroveChangeSet):
+                dict.__setitem__(self, key, spillFile.store(trvCs))
+
+    def __getitem__(self, key):
+        return _unspill(dict.__getitem__(self, key))
+
+    def get(self, key, default = None):
+        trvCs = dict.get(self, key, None)
+        if trvCs is None:
+            return default
+        return _unspill(trvCs)
+
+    def itervalues(self):
+        for trvCs in dict.itervalues(self):
+            yield _unspill(trvCs)
+
+    def iteritems(self):
+        for key, trvCs in dict.iteritems(self):
+            yield key, _unspill(trvCs)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
     def thaw(self, data):
         # this is only used to reset the list; thawFromFile is used for
         # every real thaw
@@ -251,6 +324,15 @@ class ChangeSet(streams.StreamSet):
         if (name, version, flavor) in self.primaryTroveList:
             self.primaryTroveList.remove((name, version, flavor))
 
+    def spillTroves(self, spillFile):
+        """
+        Moves the trove changesets in this change set out of memory and
+        into spillFile. They are thawed again each time they are used.
+        @param spillFile: file to write the trove changesets to
+        @type spillFile: TroveChangeSetSpill
+        """
+        self.newTroves.spill(spillFile)
+
     def oldTrove(self, name, version, flavor):
         assert(min(version.timeStamps()) > 0)
         self.oldTroves.append((name, version, flavor))
@@ -394,26 +476,30 @@ class ChangeSet(streams.StreamSet):
                 csf.addFile(hash, f, tag + contType[4:],
                             precompressed = compressed)
 
-        for hash in idList:
-            (contType, f, compressed) = contents[hash]
-            if contType != ChangedFileTypes.diff:
-                if withReferences and \
-                        isinstance(f, filecontents.CompressedFromDataStore):
-                    sha1 = sha1helper.sha1ToString(f.getSha1())
-                    realSize = os.stat(f.path()).st_size
-                    nameEntry = sha1 + ' ' + str(realSize)
-                    sizeCorrection += (realSize - len(nameEntry))
-                    if realSize >= 0x100000000:
-                        # add 4 bytes to store a 64-bit size
-                        sizeCorrection += 4
-                    csf.addFile(hash,
-                                filecontents.FromString(nameEntry,
-                                                        compressed = True),
-                                tag + ChangedFileTypes.refr[4:],
-                                precompressed = True)
-                else:
-                    csf.addFile(hash, f, tag + contType[4:],
-                                precompressed = compressed)
+        fileList = [ (hash,) + contents[hash] for hash in idList
+                        if contents[hash][0] != ChangedFileTypes.diff ]
+        if self.compressThreads != 1:
+            fileList = threadpool.imap(_precompressContents, fileList,
+                                       numThreads = self.compressThreads)
+
+        for (hash, contType, f, compressed) in fileList:
+            if withReferences and \
+                    isinstance(f, filecontents.CompressedFromDataStore):
+                sha1 = sha1helper.sha1ToString(f.getSha1())
+                realSize = os.stat(f.path()).st_size
+                nameEntry = sha1 + ' ' + str(realSize)
+                sizeCorrection += (realSize - len(nameEntry))
+                if realSize >= 0x100000000:
+                    # add 4 bytes to store a 64-bit size
+                    sizeCorrection += 4
+                csf.addFile(hash,
+                            filecontents.FromString(nameEntry,
+                                                    compressed = True),
+                            tag + ChangedFileTypes.refr[4:],
+                            precompressed = True)
+            else:
+                csf.addFile(hash, f, tag + contType[4:],
+                            precompressed = compressed)
 
         return sizeCorrection
 
@@ -1248,12 +1334,22 @@ class ChangeSet(streams.StreamSet):
                 yield x
 
 
+    def setCompressThreads(self, numThreads):
+        """
+        Sets the number of threads used to compress file contents when
+        this changeset is written out. Contents are still written in the
+        same order, and the result is identical to a serial write. None
+        uses one thread per online CPU.
+        """
+        self.compressThreads = numThreads
+
     def __init__(self, data = None):
         streams.StreamSet.__init__(self, data)
         self.configCache = {}
         self.fileContents = {}
         self.absolute = False
         self.local = 0
+        self.compressThreads = 1
 
 
 class ChangeSetFromAbsoluteChangeSet(ChangeSet):
@@ -1332,7 +1428,10 @@ class PathIdsConflictError(ChangeSetKeyConflictError):
 
 class ReadOnlyChangeSet(ChangeSet):
 
-    def thawFromFile(self, f):
+    # data store for contents written by reference
+    contentsStore = None
+
+    def thawFromFile(self, f, skipTags = ()):
         while True:
             s = f.read(5)
             if not s:
@@ -1340,9 +1439,14 @@ class ReadOnlyChangeSet(ChangeSet):
 
             tag, size = struct.unpack("!BI", s)
             size &= ~(1 << 31)
-            if tag not in self.streamDict:
-                # this implements ignoreUnknown = True
-                f.read(size)
+            if tag not in self.streamDict or tag in skipTags:
+                # this implements ignoreUnknown = True; read in pieces so
+                # large skipped streams never sit in memory
+                while size:
+                    chunk = f.read(min(size, 128 * 1024))
+                    if not chunk:
+                        raise IOError("changeset is truncated")
+                    size -= len(chunk)
                 continue
 
             obj = getattr(self, self.streamDict[tag][2])
@@ -1395,7 +1499,19 @@ class ReadOnlyChangeSet(ChangeSet):
         self.lastCsf = rc[3]
         del self.fileQueue[0]
 
-        return rc
+        return self._derefContents(rc)
+
+    def _derefContents(self, entry):
+        # contents stored as a reference (see writeContents()) are read
+        # from the contents store, if we were given one
+        (name, tagInfo, f) = entry[:3]
+        if (self.contentsStore is None or
+                tagInfo[2:] != ChangedFileTypes.refr[4:]):
+            return entry
+
+        sha1 = f.read().split(' ')[0]
+        return (name, tagInfo[:2] + ChangedFileTypes.file[4:],
+                self.contentsStore.openRawFile(sha1)) + entry[3:]
 
     def getFileContents(self, pathId, fileId, compressed = False):
         name = None
@@ -1728,6 +1844,8 @@ Cannot apply a relative changeset to an incomplete trove.  Please upgrade conary
         assert(not otherCs.lastCsf)
 
         self._mergeConfigs(otherCs)
+        if otherCs.contentsStore is not None:
+            self.contentsStore = otherCs.contentsStore
         self.fileContainers += otherCs.fileContainers
         self.csfWrappers += otherCs.csfWrappers
         for entry in otherCs.fileQueue:
@@ -1852,7 +1970,14 @@ Cannot apply a relative changeset to an incomplete trove.  Please upgrade conary
 
 class ChangeSetFromFile(ReadOnlyChangeSet):
     @api.publicApi
-    def __init__(self, fileName, skipValidate = 1):
+    def __init__(self, fileName, skipValidate = 1, contentsStore = None,
+                 withFiles = True):
+        """
+        @param contentsStore: data store used to look up file contents which
+        were written by reference (withReferences = True)
+        @param withFiles: if False, only the trove changesets are read; the
+        file streams and file contents are skipped and are not available
+        """
         self.fileName = None
         try:
             if type(fileName) is str:
@@ -1881,8 +2006,12 @@ class ChangeSetFromFile(ReadOnlyChangeSet):
 
         control.file.seek(control.start, 0)
         ReadOnlyChangeSet.__init__(self)
+        self.contentsStore = contentsStore
         start = gzip.GzipFile(None, 'r', fileobj = control)
-        self.thawFromFile(start)
+        if withFiles:
+            self.thawFromFile(start)
+        else:
+            self.thawFromFile(start, skipTags = (_STREAM_CS_FILES,))
 
         self.absolute = True
         empty = True
@@ -1902,13 +2031,16 @@ class ChangeSetFromFile(ReadOnlyChangeSet):
         if empty:
             self.absolute = False
 
+        if not withFiles:
+            self.fileContainers = []
+            return
+
         # load the diff cache
         nextFile = csf.getNextFile()
         while nextFile:
             key, tagInfo, f = nextFile
 
             (isConfig, tag) = tagInfo.split()
-            tag = 'cft-' + tag
             isConfig = isConfig == "1"
 
             # cache all config files because:
@@ -1921,6 +2053,8 @@ class ChangeSetFromFile(ReadOnlyChangeSet):
             if not isConfig:
                 break
 
+            key, tagInfo, f = self._derefContents(nextFile)
+            tag = 'cft-' + tagInfo.split()[1]
             cont = filecontents.FromFile(gzip.GzipFile(None, 'r', fileobj = f))
             self.configCache[key] = (tag, cont, False)
 
@@ -1980,8 +2114,30 @@ def fileContentsDiff(oldFile, oldCont, newFile, newCont, mirrorMode = False):
 #
 # expects a list of (trove, fileMap) tuples
 #
-def CreateFromFilesystem(troveList):
+def _precompressContents(item):
+    # compresses the contents for one writeContents() entry exactly the way
+    # FileContainer.addFile() would have; this runs from a worker thread
+    (hash, contType, f, compressed) = item
+    if compressed or isinstance(f, filecontents.CompressedFromDataStore):
+        return item
+
+    compressedFile = util.BoundedStringIO()
+    gzFile = util.DeterministicGzipFile('', "wb", 6, compressedFile)
+    util.copyfileobj(f.get(), gzFile)
+    gzFile.close()
+    compressedFile.seek(0)
+
+    return (hash, contType,
+            filecontents.FromFile(compressedFile, compressed = True), True)
+
+def CreateFromFilesystem(troveList, compressThreads = 1):
+    """
+    Creates an absolute changeset from a list of
+    (oldTrove, newTrove, fileMap) tuples, reading file contents from the
+    filesystem. compressThreads is passed to ChangeSet.setCompressThreads().
+    """
     cs = ChangeSet()
+    cs.setCompressThreads(compressThreads)
 
     for (oldTrv, trv, fileMap) in troveList:
         (troveChgSet, filesNeeded, trovesNeeded) = trv.diff(oldTrv,
@@ -2176,9 +2332,12 @@ class AbstractChangesetExploder:
                                                          fileId)
             rpmFileObj = contents.get()
             self.rpmFileObj[fileId] = rpmFileObj
+            rpmFileObj.seek(0)
+            digests = rpmhelper.getFileDigests(
+                            rpmhelper.readHeader(rpmFileObj))
             cpioFileObj = rpmhelper.UncompressedRpmPayload(rpmFileObj)
             exploder = cpiostream.CpioExploder(cpioFileObj)
-            exploder.explode(self.destDir)
+            exploder.explode(self.destDir, digests = digests)
 
         delayedRestores = {}
         for pathId, fileId, fileObj, destDir, destPath, trv in restoreList:
@@ -43,6 +43,9 @@ class QuerySet(object):
                  'searchKey']
 
     useFilter = False
+    # whether later entries of the search queues may be sent along with
+    # the current ones, saving a round trip per entry when they are needed
+    speculative = False
 
     def __init__(self, troveSpec, searchKey):
         self.troveSpec = troveSpec
@@ -124,6 +127,32 @@ class QuerySet(object):
         self._searchIdx += 1
         return searches
 
+    def remainingSearchLists(self):
+        """
+            Return all of the queries left in the active search queues.
+            Results for them have to be handled in the order they are
+            returned, which is the order nextSearchList() would return
+            them in, round by round.
+
+            The returned result is of the form:
+            [(round, queueIdx, list of queries), ...]
+        """
+        searches = []
+        for queueIdx, searchQueue in enumerate(self._searchQueues):
+            if not self._activeByQueue[queueIdx]:
+                continue
+            for searchIdx in range(self._searchIdx, len(searchQueue)):
+                searches.append((searchIdx - self._searchIdx, queueIdx,
+                                 searchQueue[searchIdx]))
+        if not searches:
+            return []
+        self._searchIdx = max([ self._searchIdx ] +
+                              [ len(x) for x in self._searchQueues ])
+        return searches
+
+    def isActive(self, queueIdx):
+        return self._activeByQueue[queueIdx]
+
     def foundResults(self, queueIdx, resultList):
         self.success = True
         self.results.extend(resultList)
@@ -378,38 +407,132 @@ class TroveFinder(object):
             in each individual query.
         """
         method = getattr(queryOptions.troveSource, methodName)
+        if queryClass.speculative and not queryOptions.requireLatest:
+            # requireLatest looks at every result returned, so it
+            # can't search speculatively
+            self._findSpeculatively(method, queryClass, queryList,
+                                    queryOptions)
+            return
+
         while True:
-            queueIds = []
-            searchSpecs = []
+            searches = []
             for query in queryList:
                 searchList = query.nextSearchList()
                 if not searchList:
                     continue
-                for queueIdx, querySearchSpecs in searchList:
-                    queueIds.extend((query, queueIdx) for x in querySearchSpecs)
-                    searchSpecs.extend(querySearchSpecs)
-            if not searchSpecs:
+                searches.extend((0, query, queueIdx, specs)
+                                for (queueIdx, specs) in searchList)
+            if not searches:
                 return
-            elif queryClass.useFilter or queryOptions.exactFlavors or \
-                    queryOptions.requireLatest:
-                newSearchSpecs = [ (x[0], x[1], None) for x in searchSpecs ]
-                kw = dict(bestFlavor=False, troveTypes=queryOptions.troveTypes)
-                results, errorList = method(newSearchSpecs, **kw)
-                results, errorList = \
-                        self._filterQueryResults( \
-                        queueIds, searchSpecs, results, queryOptions)
-            else:
-                kw = dict(bestFlavor=queryOptions.bestFlavor,
-                          troveTypes=queryOptions.troveTypes)
-                results, errorList = method(searchSpecs, **kw)
+            self._search(method, queryClass, queryOptions, searches)
 
-            allInfo = itertools.izip(results, errorList, queueIds)
+    def _findSpeculatively(self, method, queryClass, queryList,
+                           queryOptions):
+        """
+            Sends the remaining entries of the search queues in as
+            few rounds as possible; results of entries past the first
+            successful one are discarded.
+
+            Entries past the first one left in a queue are only sent
+            along with it if their repository has already answered
+            (or is the one the first entries go to), so a repository
+            which can't be reached is only asked once the search
+            actually gets to it.
+        """
+        troveSource = queryOptions.troveSource
+        pending = []
+        for query in queryList:
+            pending.extend((searchRound, query, queueIdx, specs)
+                           for (searchRound, queueIdx, specs)
+                                in query.remainingSearchLists())
+
+        speculate = True
+        while True:
+            pending = [ x for x in pending if x[1].isActive(x[2]) ]
+            if not pending:
+                return
 
-            for (troveList, errorList, (query, queueIdx)) in allInfo:
-                if troveList:
-                    query.foundResults(queueIdx, troveList)
+            # rounds are sorted so each queue's entries stay in order
+            pending.sort(key = lambda x: x[0])
+            firstHosts = set()
+            firsts = []
+            extras = []
+            later = []
+            deferred = []
+            # queue -> whether its entries are still being sent
+            sending = {}
+            for search in pending:
+                key = search[1], search[2]
+                if key not in sending:
+                    sending[key] = True
+                    firsts.append(search)
+                    firstHosts.update(x[1].getHost() for x in search[3])
+                else:
+                    later.append(search)
+            for search in later:
+                key = search[1], search[2]
+                if (speculate and sending[key] and
+                        not [ x for x in search[3]
+                              if x[1].getHost() not in firstHosts and
+                                 not troveSource.isReachable(x[1]) ]):
+                    extras.append(search)
                 else:
-                    query.noResultsFound(queueIdx, errorList)
+                    sending[key] = False
+                    deferred.append(search)
+
+            searches = sorted(firsts + extras, key = lambda x: x[0])
+            try:
+                self._search(method, queryClass, queryOptions, searches)
+            except errors.ConaryError:
+                if not extras:
+                    raise
+                # one of the repositories asked speculatively failed;
+                # stop speculating and let the search get to it in order
+                speculate = False
+                self._search(method, queryClass, queryOptions, firsts)
+                deferred.extend(extras)
+            pending = deferred
+
+    def _search(self, method, queryClass, queryOptions, searches):
+        """
+            Sends the given (round, query, queueIdx, searchSpecs) searches
+            to the repository in one call and records the results in the
+            queries.
+        """
+        queueIds = []
+        searchSpecs = []
+        for searchRound, query, queueIdx, querySearchSpecs in searches:
+            queueIds.extend((query, queueIdx) for x in querySearchSpecs)
+            searchSpecs.extend(querySearchSpecs)
+
+        if queryClass.useFilter or queryOptions.exactFlavors or \
+                queryOptions.requireLatest:
+            newSearchSpecs = [ (x[0], x[1], None) for x in searchSpecs ]
+            kw = dict(bestFlavor=False, troveTypes=queryOptions.troveTypes)
+            results, errorList = method(newSearchSpecs, **kw)
+            results, errorList = \
+                    self._filterQueryResults( \
+                    queueIds, searchSpecs, results, queryOptions)
+        else:
+            kw = dict(bestFlavor=queryOptions.bestFlavor,
+                      troveTypes=queryOptions.troveTypes)
+            results, errorList = method(searchSpecs, **kw)
+
+        rounds = itertools.chain(*[ [ x[0] ] * len(x[3]) for x in searches ])
+        allInfo = itertools.izip(results, errorList, queueIds, rounds)
+
+        # round each queue was satisfied in
+        foundIn = {}
+        for (troveList, errorList, (query, queueIdx), searchRound) in allInfo:
+            if foundIn.get((query, queueIdx), searchRound) < searchRound:
+                # only searched for speculatively; an earlier search
+                # already has the answer
+                continue
+            if troveList:
+                query.foundResults(queueIdx, troveList)
+                foundIn[query, queueIdx] = searchRound
+            else:
+                query.noResultsFound(queueIdx, errorList)
 
 
     def _filterQueryResults(self, queryList, searchSpecs, troveLists,
@@ -595,6 +718,8 @@ class QueryByLabelPathSet(QuerySet):
         Set of queries by searchKey.
     """
 
+    speculative = True
+
     def getQueryFunction(self, queryOptions):
         if queryOptions.getLeaves:
             return 'getTroveLatestByLabel'
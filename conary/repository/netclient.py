@@ -20,6 +20,8 @@ import errno
 import gzip
 import itertools
 import os
+import sys
+import threading
 import time
 import urllib
 import xml
@@ -35,6 +37,7 @@ from conary import versions
 from conary.lib import util, api
 from conary.lib import httputils
 from conary.lib import log
+from conary.lib import threadpool
 from conary.lib.http import proxy_map, request as req_mod
 from conary.repository import calllog
 from conary.repository import changeset
@@ -42,6 +45,7 @@ from conary.repository import errors
 from conary.repository import filecontainer
 from conary.repository import filecontents
 from conary.repository import findtrove
+from conary.repository import querycache
 from conary.repository import repository
 from conary.repository import transport
 from conary.repository import trovesource
@@ -57,7 +61,10 @@ PermissionAlreadyExists = errors.PermissionAlreadyExists
 shims = xmlshims.NetworkConvertors()
 
 # end of range or last protocol version + 1
-CLIENT_VERSIONS = range(36, 73 + 1)
+CLIENT_VERSIONS = range(36, 74 + 1)
+
+# maximum number of repositories a single query round talks to at once
+MAX_QUERY_THREADS = 8
 
 from conary.repository.trovesource import TROVE_QUERY_ALL, TROVE_QUERY_PRESENT, TROVE_QUERY_NORMAL
 
@@ -65,6 +72,67 @@ from conary.repository.trovesource import TROVE_QUERY_ALL, TROVE_QUERY_PRESENT,
 # including / (which is normally considered "safe" by urllib.quote)
 quote = lambda s: urllib.quote(s, safe='')
 
+class _ChangeSetDownload(object):
+
+    """
+    Copies a changeset container into a local file from a background
+    thread. Reads made through this object wait until the bytes they need
+    have arrived, so the changesets in the container can be read (and
+    applied) while the rest of it is still downloading.
+    """
+
+    def __init__(self, outFile, copy):
+        self.outFile = outFile
+        self.written = outFile.tell()
+        self.done = False
+        self.error = None
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target = self._copy, args = (copy,))
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def _copy(self, copy):
+        try:
+            copy(self)
+        except:
+            self.error = sys.exc_info()
+
+        self.cond.acquire()
+        self.done = True
+        self.cond.notifyAll()
+        self.cond.release()
+
+    def write(self, buf):
+        self.outFile.write(buf)
+        self.cond.acquire()
+        self.written += len(buf)
+        self.cond.notifyAll()
+        self.cond.release()
+
+    def wait(self, end = None):
+        """
+        Waits until everything before offset end has been written, or
+        until the download is complete if end is None. Errors from the
+        download are raised if they keep the data from being available.
+        """
+        self.cond.acquire()
+        try:
+            while not self.done and (end is None or self.written < end):
+                self.cond.wait()
+        finally:
+            self.cond.release()
+
+        if self.error and (end is None or self.written < end):
+            raise self.error[0], self.error[1], self.error[2]
+
+    def pread(self, bytes, offset):
+        self.wait(offset + bytes)
+        return self.outFile.pread(bytes, offset)
+
+    def _fdRange(self, start, size):
+        self.wait(start + size)
+        return (self.outFile.fileno(), start, size)
+
 class PartialResultsError(Exception):
 
     # this is expected to be handled by the caller!
@@ -106,6 +174,9 @@ class ServerProxy(util.ServerProxy):
 
     _requestFilter = xmlshims.RequestArgs
     _responseFilter = xmlshims.ResponseArgs
+    # each proxy has its own transport, so calls to different proxies can
+    # be made from different threads
+    _concurrentCalls = True
 
     def _createMethod(self, name):
         return ServerProxyMethod(self._request, name)
@@ -113,6 +184,14 @@ class ServerProxy(util.ServerProxy):
     def usedProxy(self):
         return self._transport.usedProxy
 
+    def getQueryCacheKey(self):
+        """
+        Returns a string identifying the repository and the credentials
+        used for it, which keys query results cached for this server, or
+        None if results should not be cached.
+        """
+        return '%s %s' % (self._url, sorted(self._transport.getEntitlements()))
+
     def setAbortCheck(self, check):
         self._transport.setAbortCheck(check)
 
@@ -260,6 +339,19 @@ class ServerCache(object):
     def keys(self):
         return self.cache.keys()
 
+    def isConnected(self, item):
+        """
+        Returns True if the repository for item has been connected to
+        already, or is reached without going over the network.
+        """
+        try:
+            serverName = self._getServerName(item)
+        except errors.OpenError:
+            return False
+        return (serverName in self.cache or
+                isinstance(self.map.get(serverName, None),
+                           repository.AbstractTroveDatabase))
+
     def singleServer(self, *items):
         foundServer = None
         for item in items:
@@ -403,6 +495,13 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
         self.uploadRateLimit = cfg.uploadRateLimit
         self.c = ServerCache(cfg, pwPrompt)
         self.localRep = localRepository
+        # changesets from the last streaming createChangeSet call which may
+        # still be downloading
+        self._downloads = []
+        if cfg.queryCache:
+            self.queryCache = querycache.QueryCache(cfg.queryCache)
+        else:
+            self.queryCache = None
 
         trovesource.SearchableTroveSource.__init__(self, searchableByType=True)
         self.searchAsRepository()
@@ -904,6 +1003,136 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
 
         return resultD
 
+    def isReachable(self, label):
+        return self.c.isConnected(label)
+
+    def _callServers(self, method, requests):
+        """
+        Calls method on each server of a list of (serverIdent, args)
+        requests, returning the responses in the same order. Requests to
+        different network repositories are sent in parallel.
+        """
+        calls = [ (self.c[serverIdent], args)
+                  for serverIdent, args in requests ]
+        servers = [ x[0] for x in calls ]
+        numThreads = 1
+        if (len(set(id(x) for x in servers)) == len(servers) and
+                not [ x for x in servers
+                      if not getattr(x, '_concurrentCalls', False) ]):
+            numThreads = min(len(calls), MAX_QUERY_THREADS)
+
+        def _call((server, args)):
+            return getattr(server, method)(*args)
+
+        return threadpool.imap(_call, calls, numThreads = numThreads)
+
+    def _getQueryCacheKey(self, serverIdent, minProtocol = 74):
+        """
+        Returns the key query results from serverIdent are cached under,
+        or None if they can't be cached. Results which depend on label
+        change marks need protocol version 74.
+        """
+        if self.queryCache is None:
+            return None
+        server = self.c[serverIdent]
+        if (not hasattr(server, 'getQueryCacheKey') or
+                server.getProtocolVersion() < minProtocol):
+            return None
+        return server.getQueryCacheKey()
+
+    def _getLabelChangeMarks(self, labelsByHost):
+        """
+        Returns a dict mapping (host, labelStr) to the current change
+        mark of that label for each of the labels in labelsByHost, which
+        maps hosts to collections of labels (as strings).
+        """
+        hosts = sorted(labelsByHost)
+        labelLists = [ sorted(labelsByHost[x]) for x in hosts ]
+        responses = self._callServers('getLabelChangeMarks',
+                [ (host, (labelList,))
+                  for host, labelList in itertools.izip(hosts, labelLists) ])
+
+        marks = {}
+        for host, labelList, markList in itertools.izip(hosts, labelLists,
+                                                         responses):
+            marks.update(((host, x), y)
+                         for x, y in itertools.izip(labelList, markList))
+        return marks
+
+    def _callLabelQuery(self, method, requests, bestFlavor, troveTypes):
+        """
+        Calls a by-label query method for each (host, requestD) in
+        requests, where requestD maps names to dicts keyed by frozen
+        labels, and returns the responses. Results for each name and
+        label are kept in the query cache when one is configured, and
+        reused while the label's change mark stays the same.
+        """
+        cacheKeys = {}
+        labelsByHost = {}
+        for host, requestD in requests:
+            cacheKey = self._getQueryCacheKey(host)
+            if cacheKey is None:
+                continue
+            cacheKeys[host] = cacheKey
+            labelsByHost[host] = set(itertools.chain(*requestD.itervalues()))
+
+        marks = {}
+        if labelsByHost:
+            marks = self._getLabelChangeMarks(labelsByHost)
+
+        responses = []
+        misses = []
+        calls = []
+        for host, requestD in requests:
+            if host not in cacheKeys:
+                calls.append((host, requestD))
+                continue
+
+            missD = {}
+            for name, labelD in requestD.iteritems():
+                for labelStr in labelD:
+                    key = (cacheKeys[host], method, name, labelStr,
+                           bool(bestFlavor), troveTypes)
+                    mark = marks[host, labelStr]
+                    respD = None
+                    if mark:
+                        respD = self.queryCache.get(key, mark)
+                    if respD is None:
+                        missD.setdefault(name, {})[labelStr] = ''
+                        misses.append((len(calls), name, labelStr, key,
+                                       mark))
+                    else:
+                        responses.append(respD)
+            if missD:
+                calls.append((host, missD))
+
+        callResponses = list(self._callServers(method,
+                [ (host, self._setTroveTypeArgs(host, requestD, bestFlavor,
+                                                troveTypes = troveTypes))
+                  for host, requestD in calls ]))
+        responses.extend(callResponses)
+
+        # split what came back by name and label for the cache
+        for callIdx, name, labelStr, key, mark in misses:
+            if not mark:
+                continue
+            respD = callResponses[callIdx]
+            if name:
+                names = [ name ]
+            else:
+                names = respD.keys()
+            entry = {}
+            for troveName in names:
+                versionD = dict(x for x in
+                                respD.get(troveName, {}).iteritems()
+                                if self.thawVersion(x[0]).trailingLabel()
+                                                .asString() == labelStr)
+                if versionD:
+                    entry[troveName] = versionD
+            self.queryCache.set(key, mark, entry)
+
+        return responses
+
     def _setTroveTypeArgs(self, serverIdent, *args, **kwargs):
         if self.c[serverIdent].getProtocolVersion() >= 38:
             return args + ( kwargs.get('troveTypes', TROVE_QUERY_PRESENT), )
@@ -1040,11 +1269,16 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
             flavorDict[verStr] = ''
 
         result = {}
-        for host, requestD in d.iteritems():
-            respD = self.c[host].__getattr__(method)(
-                            *self._setTroveTypeArgs(host, requestD,
-                                                    bestFlavor,
-                                                    troveTypes = troveTypes))
+        if labels:
+            responses = self._callLabelQuery(method, d.items(), bestFlavor,
+                                             troveTypes)
+        else:
+            requests = [ (host, self._setTroveTypeArgs(host, requestD,
+                                                bestFlavor,
+                                                troveTypes = troveTypes))
+                         for host, requestD in d.iteritems() ]
+            responses = self._callServers(method, requests)
+        for respD in responses:
             self._mergeTroveQuery(result, respD)
 
 
@@ -1347,8 +1581,13 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
     def createChangeSet(self, jobList, withFiles = True,
                         withFileContents = True,
                         excludeAutoSource = False, recurse = True,
-                        primaryTroveList = None, callback = None):
+                        primaryTroveList = None, callback = None,
+                        streaming = False):
         """
+        @param streaming: If True, the changeset is returned as soon as
+        the trove information in it has been downloaded, and its file
+        contents become available as they arrive.
+        @type streaming: bool
         @raise RepositoryError: if a repository error occurred.
         """
         allJobs = [ (jobList, False) ]
@@ -1364,7 +1603,8 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
                                         recurse = recurse,
                                         primaryTroveList = primaryTroveList,
                                         callback = callback,
-                                        forceLocalGeneration = forceLocal)
+                                        forceLocalGeneration = forceLocal,
+                                        streaming = streaming)
 
                 if mergeTarget is None:
                     return cs
@@ -1429,7 +1669,8 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
                       withFileContents = True, target = None,
                       excludeAutoSource = False, primaryTroveList = None,
                       callback = None, forceLocalGeneration = False,
-                      changesetVersion = None, mirrorMode = False):
+                      changesetVersion = None, mirrorMode = False,
+                      streaming = False):
         # This is a bit complicated due to servers not wanting to talk
         # to other servers. To make this work, we do this:
         #
@@ -1451,6 +1692,10 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
         #
         #   5. Download any extra files (and create any extra diffs)
         #   which step 2 couldn't do for us.
+        #
+        # When streaming, the changeset containers from step 2 are copied
+        # into outFile by background threads; anything else which needs to
+        # write to outFile waits for those copies to finish first.
 
         def _separateJobList(jobList, removedList, forceLocalGeneration,
                              mirrorMode):
@@ -1528,6 +1773,7 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
                 args += (changesetVersion, )
 
             # seek to the end of the file
+            _waitForDownloads()
             outFile.seek(0, 2)
             start = resume = outFile.tell()
             attempts = max(1, self.cfg.downloadAttempts)
@@ -1561,11 +1807,19 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
             filesNeeded.update(self.toFilesNeeded(extraFileList))
             removedList += self.toJobList(removedTroveList)
 
+            if streaming:
+                csFile = downloads[-1]
+            else:
+                csFile = outFile
+
             for size in sizes:
-                f = util.SeekableNestedFile(outFile, size, start)
+                f = util.SeekableNestedFile(csFile, size, start)
                 try:
                     newCs = changeset.ChangeSetFromFile(f)
                 except IOError, err:
+                    if streaming and csFile.error and csFile.error[1] is err:
+                        # the download itself failed
+                        raise
                     assert False, 'IOError in changeset (%s); args = %r' % (
                             str(err), args,)
                 if not cs:
@@ -1625,6 +1879,20 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
                 except transport.TransportError, e:
                     raise errors.RepositoryError(str(e))
 
+            resumeOffset = kwargs.get('resumeOffset') or 0
+            if streaming:
+                # interrupted downloads can't be resumed once the caller
+                # has started reading the changeset; the error is raised
+                # to the reader instead
+                downloads.append(_ChangeSetDownload(outFile,
+                        lambda outF: _copyCs(inF, outF, sizes, 0)))
+            else:
+                _copyCs(inF, outFile, sizes, resumeOffset)
+
+            return (sizes, extraTroveList, extraFileList, removedTroveList,
+                    extra)
+
+        def _copyCs(inF, outFile, sizes, resumeOffset):
             if callback:
                 wrapper = callbacks.CallbackRateWrapper(
                     callback, callback.downloadingChangeSet,
@@ -1635,7 +1903,6 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
                 copyCallback = None
                 abortCheck = None
 
-            resumeOffset = kwargs.get('resumeOffset') or 0
             # Start the total at resumeOffset so that progress callbacks
             # continue where they left off.
             copied = util.copyfileobj(inF, outFile, callback=copyCallback,
@@ -1653,8 +1920,9 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
                 raise errors.TruncatedResponseError(sum(sizes), totalSize)
             inF.close()
 
-            return (sizes, extraTroveList, extraFileList, removedTroveList,
-                    extra)
+        def _waitForDownloads():
+            for download in downloads:
+                download.wait()
 
         def _getCsFromShim(target, cs, server, job, recurse, withFiles,
                            withFileContents, excludeAutoSource,
@@ -1682,6 +1950,16 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
         filesNeeded = set()
         removedList = []
 
+        # streaming writes the changeset file while it is being read, which
+        # doesn't work for target files (they get rewritten at the end)
+        streaming = streaming and not target
+        downloads = []
+        if streaming:
+            # only one changeset streams in at a time
+            for download in self._downloads:
+                download.thread.join()
+            self._downloads = downloads
+
         if target:
             try:
                 outFile = util.ExtendedFile(target, "w+", buffering = False)
@@ -1907,6 +2185,7 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
                         needItems.append( (pathId, newFileId, newFileObj) )
                         fileJob.extend([ needItems ])
 
+            _waitForDownloads()
             contentList = self.getFileContents(contentsNeeded,
                                                tmpFile = outFile,
                                                lookInLocal = True,
@@ -2630,32 +2909,75 @@ class NetworkRepositoryClient(xmlshims.NetworkConvertors,
 
         results = [ None ] * len(troveList)
         partialOnly = False
-        for host, l in byServer.iteritems():
+        for host in byServer.keys():
             if self.c[host].getProtocolVersion() < 70:
                 partialOnly = True
-                continue
-
-            tl = [ (x[1][0], self.fromVersion(x[1][1]),
-                             self.fromFlavor(x[1][2]))
-                   for x in l ]
-            result = self.c[host].getDepsForTroveList(tl, provides = provides,
-                                                      requires = requires)
-
-            provSet = None
-            reqSet = None
-            for ((idx, troveTup), (prov, req)) in itertools.izip(l, result):
-                if provides:
-                    provSet = self.toDepSet(prov)
-                if requires:
-                    reqSet = self.toDepSet(req)
-
-                results[idx] = (provSet, reqSet)
+                del byServer[host]
+
+        # the dependencies of a trove never change, so cached ones are
+        # good for as long as they are kept
+        cacheKeys = {}
+        for host in byServer:
+            cacheKey = self._getQueryCacheKey(host, minProtocol = 70)
+            if cacheKey is not None:
+                cacheKeys[host] = cacheKey
+
+        frozen = {}
+        for host, l in byServer.items():
+            uncached = []
+            for idx, troveTup in l:
+                frzTup = (troveTup[0], self.fromVersion(troveTup[1]),
+                          self.fromFlavor(troveTup[2]))
+                frozen[idx] = frzTup
+                if host in cacheKeys:
+                    frzDeps = self.queryCache.get(
+                            self._depsCacheKey(cacheKeys[host], frzTup,
+                                               provides, requires),
+                            querycache.PERMANENT)
+                    if frzDeps is not None:
+                        results[idx] = self._thawDeps(frzDeps, provides,
+                                                      requires)
+                        continue
+                uncached.append((idx, troveTup))
+            if uncached:
+                byServer[host] = uncached
+            else:
+                del byServer[host]
+
+        hosts = byServer.keys()
+        responses = self._callServers('getDepsForTroveList',
+                [ (host, ([ frozen[x[0]] for x in byServer[host] ],
+                          provides, requires))
+                  for host in hosts ])
+        for host, result in itertools.izip(hosts, responses):
+            for ((idx, troveTup), frzDeps) in itertools.izip(byServer[host],
+                                                              result):
+                results[idx] = self._thawDeps(frzDeps, provides, requires)
+                if host in cacheKeys:
+                    self.queryCache.set(
+                        self._depsCacheKey(cacheKeys[host], frozen[idx],
+                                           provides, requires),
+                        querycache.PERMANENT, tuple(frzDeps))
 
         if partialOnly:
             raise PartialResultsError(results)
 
         return results
 
+    @staticmethod
+    def _depsCacheKey(cacheKey, frzTroveTup, provides, requires):
+        return (cacheKey, 'getDepsForTroveList') + frzTroveTup + (
+                bool(provides), bool(requires))
+
+    def _thawDeps(self, (prov, req), provides, requires):
+        provSet = None
+        reqSet = None
+        if provides:
+            provSet = self.toDepSet(prov)
+        if requires:
+            reqSet = self.toDepSet(req)
+        return (provSet, reqSet)
+
     def getTroveInfo(self, infoType, troveList):
         # first, we need to know about this infoType
         if infoType not in trv_mod.TroveInfo.streamDict.keys():
@@ -36,6 +36,7 @@ from conary.lib.cfgtypes import (CfgInt, CfgString, CfgPath, CfgBool, CfgList,
 from conary.repository import changeset, errors, xmlshims
 from conary.repository.netrepos import fsrepos, instances, trovestore
 from conary.repository.netrepos import accessmap, deptable, fingerprints
+from conary.repository.netrepos import versionops
 from conary.lib.openpgpfile import KeyNotFound
 from conary.repository.netrepos.netauth import NetworkAuthorization
 from conary.repository.netclient import TROVE_QUERY_ALL, TROVE_QUERY_PRESENT, \
@@ -52,7 +53,7 @@ from conary.errors import InvalidRegex
 # one in the list is the lowest protocol version we support and th
 # last one is the current server protocol version. Remember that range stops
 # at MAX - 1
-SERVER_VERSIONS = range(36, 73 + 1)
+SERVER_VERSIONS = range(36, 74 + 1)
 
 # We need to provide transitions from VALUE to KEY, we cache them as we go
 
@@ -3313,6 +3314,32 @@ class NetworkRepositoryServer(xmlshims.NetworkConvertors):
         # dedup.
         return list(set(labelList))
 
+    @accessReadOnly
+    @requireClientProtocol(74)
+    def getLabelChangeMarks(self, authToken, clientVersion, labelList):
+        """
+        Returns a mark for each label in labelList which changes whenever
+        the troves on that label which the user can see change. Marks are
+        opaque strings; clients compare them to the marks returned earlier
+        to tell whether results they cached for a label are still current.
+        An empty mark means results for that label must not be cached.
+        """
+        self.log(2, labelList)
+        cu = self.db.cursor()
+        roleIds = self.auth.getAuthRoles(cu, authToken)
+        counts = None
+        if roleIds:
+            counts = versionops.LabelChanges(self.db).getCounts(cu, labelList)
+        if counts is None:
+            # an empty mark tells the client not to cache
+            return [ '' for x in labelList ]
+
+        # the counters move whenever troves on the label change or acls
+        # change what roles can see; the roles cover the user being
+        # moved between roles
+        roles = ",".join("%d" % x for x in sorted(roleIds))
+        return [ '%s:%d' % (roles, x) for x in counts ]
+
     @accessReadOnly
     def getTroveDescendants(self, authToken, clientVersion, troveList):
         """
@@ -18,6 +18,7 @@
 from conary import versions
 from conary.dbstore import idtable
 from conary.dbstore import sqlerrors
+from conary.dbstore import sqllib
 from conary.repository import trovesource
 from conary.repository.errors import DuplicateBranch, InvalidSourceNameError
 from conary.repository.netrepos import items
@@ -87,10 +88,69 @@ class LabelTable(idtable.IdTable):
     def iteritems(self):
         raise NotImplementedError
 
+# class and methods for handling LabelChanges operations. Every change to
+# what LatestCache holds for a branch bumps the counters of its labels, so
+# clients can tell whether a label changed with one lookup per label.
+class LabelChanges:
+    def __init__(self, db):
+        self.db = db
+
+    def _enabled(self):
+        # the LabelChanges table was added in schema 18.2
+        return self.db.version >= sqllib.DBversion(18, 2)
+
+    def _touch(self, cu, labelIds = None):
+        where = and_ = ""
+        if labelIds is not None:
+            cond = "labelId in (%s)" % (",".join("%d" % x for x in labelIds),)
+            where = "where " + cond
+            and_ = "and Labels." + cond
+        cu.execute("""
+        update LabelChanges set changeCount = changeCount + 1 %s""" % (where,))
+        cu.execute("""
+        insert into LabelChanges (labelId, changeCount)
+        select labelId, 1 from Labels
+        where not exists (
+            select 1 from LabelChanges as lc
+            where lc.labelId = Labels.labelId ) %s""" % (and_,))
+
+    def touchBranches(self, cu, branchIds):
+        if not branchIds or not self._enabled():
+            return
+        cu.execute("select distinct labelId from LabelMap "
+                   "where branchId in (%s)" % (
+                       ",".join("%d" % x for x in branchIds),))
+        labelIds = [ x[0] for x in cu.fetchall() ]
+        if labelIds:
+            self._touch(cu, labelIds)
+
+    def touchAll(self, cu):
+        if self._enabled():
+            self._touch(cu)
+
+    def getCounts(self, cu, labelList):
+        """
+        Returns the change counter for each label string in labelList, or
+        None if this repository doesn't keep them. Labels which have never
+        changed have a counter of 0.
+        """
+        if not self._enabled():
+            return None
+        counts = []
+        for label in labelList:
+            cu.execute("""
+            select changeCount from LabelChanges
+            join Labels on LabelChanges.labelId = Labels.labelId
+            where Labels.label = ?""", label)
+            row = cu.fetchone()
+            counts.append(row and row[0] or 0)
+        return counts
+
 # class and methods for handling LatestCache operations
 class LatestTable:
     def __init__(self, db):
         self.db = db
+        self.labelChanges = LabelChanges(db)
     def rebuild(self, cu = None):
         if cu is None:
             cu = self.db.cursor()
@@ -121,6 +181,7 @@ class LatestTable:
         _insertView(cu, LATEST_TYPE_PRESENT)
         _insertView(cu, LATEST_TYPE_NORMAL)
         self.db.analyze("LatestCache")
+        self.labelChanges.touchAll(cu)
         return
 
     def update(self, cu, itemId, branchId, flavorId, roleId = None):
@@ -141,6 +202,7 @@ class LatestTable:
         from LatestView
         where itemId = ? and branchId = ? and flavorId = ? %s""" % (cond,),
                    args)
+        self.labelChanges.touchBranches(cu, [ branchId ])
 
     def updateInstanceId(self, cu, instanceId):
         cu.execute("""
@@ -179,6 +241,7 @@ class LatestTable:
             select
                 latestType, userGroupId, itemId, branchId, flavorId, versionId
                 from LatestView where userGroupId = ? """, roleId)
+            self.labelChanges.touchAll(cu)
             return
         # we need to be more discriminate since we know what
         # instanceIds are new (they are provided in tmpInstances table)
@@ -203,8 +266,9 @@ class LatestTable:
         # Investigate that.
         cu = self.db.cursor()
         cu.execute("SELECT itemId, branchId, flavorId FROM %s" % table)
+        rows = cu.fetchall()
         pieces = ['(itemId = %d AND branchId = %d AND flavorId = %d)'
-                % tuple(x) for x in cu]
+                % tuple(x) for x in rows]
         count = 1000
         while pieces:
             query = ' OR '.join(pieces[-count:])
@@ -216,6 +280,7 @@ class LatestTable:
                 SELECT DISTINCT v.latestType, v.userGroupId, v.itemId, v.branchId,
                         v.flavorId, v.versionId
                 FROM LatestView v WHERE """ + query)
+        self.labelChanges.touchBranches(cu, set(x[1] for x in rows))
 
 
 class LabelMap(idtable.IdPairSet):
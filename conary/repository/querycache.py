@@ -0,0 +1,84 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import cPickle
+import os
+
+from conary.lib import log, sha1helper, util
+
+# mark for entries which stay valid whatever happens to their label
+PERMANENT = 'permanent'
+
+
+class QueryCache(object):
+    """
+        Remembers the results of repository queries between runs. Each
+        entry is stored along with the change mark of the label it came
+        from (see getLabelChangeMarks on the server), and is only returned
+        while the label still has that mark.
+
+        Entries are stored one per file in a directory, named by a digest
+        of the key. Keys are tuples of strings and numbers, and should
+        include something identifying the repository and the user, as
+        different users may see different results.
+
+        Results which never go stale, like the dependencies of a trove,
+        are stored with the PERMANENT mark instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.writable = True
+
+    def _entryPath(self, key):
+        digest = sha1helper.sha1ToString(sha1helper.sha1String(repr(key)))
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def get(self, key, mark):
+        """
+            Returns the value stored for key if it was stored with mark,
+            and None otherwise.
+        """
+        try:
+            f = open(self._entryPath(key))
+            try:
+                storedMark, value = cPickle.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError, EOFError, ValueError, TypeError,
+                cPickle.UnpicklingError):
+            return None
+
+        if storedMark != mark:
+            return None
+
+        return value
+
+    def set(self, key, mark, value):
+        if not self.writable:
+            return
+
+        path = self._entryPath(key)
+        try:
+            util.mkdirChain(os.path.dirname(path))
+            f = util.AtomicFile(path, chmod = 0600)
+            cPickle.dump((mark, value), f, 2)
+            f.commit()
+        except (IOError, OSError), e:
+            # one warning is enough; a run may store thousands of entries
+            log.warning('unable to save query results: %s' % e)
+            self.writable = False
@@ -434,10 +434,8 @@ class DepResolutionByTroveListFast(DepResolutionMethod):
     def resolveDependencies(self):
         if self.matcher is None:
             self._cacheDeps()
-        sugg = {}
-        for depSet in self.depList:
-            sugg[depSet] = self.matcher.find(depSet)
-        return sugg
+        return dict(itertools.izip(self.depList,
+                                   self.matcher.findAll(self.depList)))
 
 
 class ResolutionStack(DepResolutionMethod):
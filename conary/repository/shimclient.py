@@ -16,7 +16,8 @@
 
 
 from conary.lib import util
-from conary.repository import calllog, changeset, filecontents, netclient
+from conary.repository import calllog, changeset, errors, filecontents
+from conary.repository import netclient
 from conary.repository.netrepos import netserver
 
 import gzip
@@ -40,6 +41,15 @@ class FakeServerCache(netclient.ServerCache):
         # otherwise get a real repository client
         return netclient.ServerCache.__getitem__(self, item)
 
+    def isConnected(self, item):
+        try:
+            serverName = self._getServerName(item)
+        except errors.OpenError:
+            return False
+        if serverName in self._server._server.serverNameList:
+            return True
+        return netclient.ServerCache.isConnected(self, item)
+
 class NetworkRepositoryServer(netserver.NetworkRepositoryServer):
     @netserver.accessReadOnly
     def getFileContents(self, *args, **kwargs):
@@ -213,6 +223,10 @@ class ShimNetClient(netclient.NetworkRepositoryClient):
 
 class ShimServerProxy(netclient.ServerProxy):
 
+    # calls go straight to the server, whose database connection belongs
+    # to this thread
+    _concurrentCalls = False
+
     def __init__(self, server, protocol, port, authToken, systemId=None):
         self._authToken = authToken
         self._server = server
@@ -239,6 +253,9 @@ class ShimServerProxy(netclient.ServerProxy):
     def usedProxy(self, *args):
         return False
 
+    def getQueryCacheKey(self):
+        return None
+
     def _request(self, method, args, kwargs):
         args = [self._protocolVersion] + list(args)
         start = time.time()
@@ -74,6 +74,13 @@ class AbstractTroveSource:
     def searchableByType(self):
         return self._searchableByType
 
+    def isReachable(self, label):
+        """
+        Returns True if queries for troves on label can be made without
+        first finding out whether the repository for it can be reached.
+        """
+        return True
+
     def getTroveInfo(self, infoType, troveTupleList):
         raise NotImplementedError
 
@@ -859,7 +866,8 @@ class SearchableTroveSource(AbstractTroveSource):
             scores = ((x[0].score(flavorQuery), x[1]) \
                                         for x in toCalc)
         else:
-            scores = ((flavorQuery.score(x), x) for x in flavorList)
+            scores = itertools.izip(deps.scoreFlavors(flavorQuery, toCalc),
+                                    toCalc)
 
         scoreCache.update(((flavorQuery, x[1]),x[0]) for x in scores)
 
@@ -1046,7 +1054,7 @@ class ChangesetFilesTroveSource(SearchableTroveSource):
     # it's likely this should all be indexed by troveName instead of
     # full tuples
 
-    def __init__(self, db, storeDeps=False):
+    def __init__(self, db, storeDeps=False, spillDir=None):
         SearchableTroveSource.__init__(self)
         self.db = db
         self.troveCsMap = {}
@@ -1063,6 +1071,12 @@ class ChangesetFilesTroveSource(SearchableTroveSource):
         # Format is (filename, includesFileContents)
         self.csFileNameList = []
 
+        # When spillDir is set, the trove changesets from changesets
+        # without file contents (the ones used while planning an update)
+        # are written to a temporary file there and thawed on demand.
+        self.spillDir = spillDir
+        self.spillFile = None
+
         if storeDeps:
             self.depDb = deptable.DependencyDatabase()
 
@@ -1129,6 +1143,11 @@ class ChangesetFilesTroveSource(SearchableTroveSource):
                 self.troveCsMap[info] = cs
                 self.jobMap[jobMapKey] = (cs, includesFileContents)
 
+        if self.spillDir and not includesFileContents:
+            if self.spillFile is None:
+                self.spillFile = changeset.TroveChangeSetSpill(self.spillDir)
+            cs.spillTroves(self.spillFile)
+
         self.csList.append(cs)
         # Save file name too
         fileName = None
@@ -1730,6 +1749,12 @@ class TroveSourceStack(SourceStack, SearchableTroveSource):
                 return True
         return False
 
+    def isReachable(self, label):
+        for source in self.iterSources():
+            if not source.isReachable(label):
+                return False
+        return True
+
     def insertSource(self, source, idx=0):
         if source is not None and source not in self:
             self.sources.insert(idx, source)
@@ -74,7 +74,7 @@ class NetworkConvertors(object):
         assert(f is not None)
         if f is 0:
             return None
-        return deps.deps.ThawFlavor(f)
+        return deps.deps.ThawSharedFlavor(f)
 
     def fromFlavor(self, f):
         if f is None:
@@ -108,13 +108,13 @@ class NetworkConvertors(object):
         return l.asString()
 
     def toLabel(self, l):
-        return versions.Label(l)
+        return versions.LabelFromString(l)
 
     def fromDepSet(self, ds):
         return ds.freeze()
 
     def toDepSet(self, ds):
-        return deps.deps.ThawDependencySet(ds)
+        return deps.deps.ThawSharedDependencySet(ds)
 
     def fromEntitlement(self, ent):
         return base64.encodestring(ent)
@@ -94,6 +94,7 @@ FLINKPKGID = 1167
 FLINKHDRID = 1168
 FLINKNEVRA = 1169
 TRIGGERPREIN = 1170
+FILEDIGESTALGO = 5011
 
 SIG_BASE = 256
 SIG_SHA1 = 269
@@ -146,6 +147,15 @@ RPMSENSE_TRIGGERUN = (1 << 17)
 RPMSENSE_TRIGGERPOSTUN = (1 << 18)
 RPMSENSE_TRIGGERPREIN = (1 << 25)
 
+# FILEDIGESTALGO values (PGPHASHALGO_*) which can be checked
+_fileDigestClasses = {
+    1 : digestlib.md5,
+    2 : digestlib.sha1,
+    8 : digestlib.sha256,
+    9 : digestlib.sha384,
+    10 : digestlib.sha512,
+}
+
 
 def seekToData(f):
     """
@@ -166,6 +176,8 @@ class _RpmHeader(object):
         DIRNAMES, BASENAMES, DIRINDEXES, FILEUSERNAME, FILEGROUPNAME,
         FILESIZES, FILEMODES, FILERDEVS, FILELINKTOS, FILEFLAGS,
         FILEVERIFYFLAGS, FILEDIGESTS, FILEMTIMES])
+    # struct format and item size for the integer data types
+    _intFormats = { 2 : ('B', 1), 3 : ('H', 2), 4 : ('I', 4) }
 
     class _Stat(object):
         """
@@ -399,13 +411,9 @@ class _RpmHeader(object):
     def __getitem__(self, tag):
         if tag == OLDFILENAMES and tag not in self.entries:
             # mimic OLDFILENAMES using DIRNAMES and BASENAMES
-            dirs = dict(enumerate(self[DIRNAMES]))
-            paths = []
-            for dirIndex, baseName in itertools.izip(self[DIRINDEXES],
-                                                     self[BASENAMES]):
-                paths.append(dirs[dirIndex] + baseName)
-
-            return paths
+            dirs = self[DIRNAMES]
+            return [ dirs[dirIndex] + baseName for dirIndex, baseName in
+                     itertools.izip(self[DIRINDEXES], self[BASENAMES]) ]
 
         if tag in self._tagListValues and tag not in self.entries:
             # Lists that are not present are empty
@@ -417,36 +425,27 @@ class _RpmHeader(object):
             # RPM_CHAR_TYPE, RPM_BIN_TYPE
             return self.data[offset:offset + count]
 
-        items = []
-        while count:
-            if dataType == 2:
-                # RPM_INT8_TYPE
-                items.append(struct.unpack("B", self.data[offset])[0])
-                offset += 1
-            elif dataType == 3:
-                # RPM_INT16_TYPE
-                items.append(struct.unpack("!H", self.data[offset:offset+2])[0])
-                offset += 2
-            elif dataType == 4:
-                # RPM_INT32_TYPE
-                items.append(struct.unpack("!I", self.data[offset:offset+4])[0])
-                offset += 4
-            elif dataType in (6, 8, 9):
-                # RPM_STRING_TYPE, RPM_STRING_ARRAY_TYPE, RPM_I18NSTRING_TYPE
-                s = ""
-                while self.data[offset] != '\0':
-                    s += self.data[offset]
-                    offset += 1
-                items.append(s)
-                offset += 1
-
-            count -= 1
-
-        if (count == 1 or count == 0) and dataType == 6:
-            # count isn't set for RPM_STRING_TYPE
-            return items[0]
-
-        return items
+        if dataType in self._intFormats:
+            # RPM_INT8_TYPE, RPM_INT16_TYPE, RPM_INT32_TYPE; the whole array
+            # is unpacked in one go
+            fmt, size = self._intFormats[dataType]
+            return list(struct.unpack('!%d%s' % (count, fmt),
+                        self.data[offset:offset + count * size]))
+
+        if dataType == 6:
+            # RPM_STRING_TYPE; count isn't set
+            return self.data[offset:self.data.index('\0', offset)]
+
+        if dataType in (8, 9):
+            # RPM_STRING_ARRAY_TYPE, RPM_I18NSTRING_TYPE
+            if not count:
+                return []
+            end = offset
+            for i in xrange(count):
+                end = self.data.index('\0', end) + 1
+            return self.data[offset:end - 1].split('\0')
+
+        return []
 
     def __hasitem__(self, tag):
         return tag in self.entries
@@ -475,11 +474,9 @@ class _RpmHeader(object):
             if computedSha1 != sha1:
                 raise IOError, "bad header sha1"
 
-        for i in range(entries):
-            (tag, dataType, offset, count) = struct.unpack("!iiii",
-                                            entryTable[i * 16: i * 16 + 16])
-
-            self.entries[tag] = (dataType, offset, count)
+        entryData = struct.unpack("!%di" % (entries * 4), entryTable)
+        for i in xrange(0, entries * 4, 4):
+            self.entries[entryData[i]] = entryData[i + 1:i + 4]
 
         if sigBlock:
             # We need to align to an 8-byte boundary.
@@ -694,6 +691,26 @@ def extractRpmPayload(fileIn, fileOut):
             break
         fileOut.write(buf)
 
+def getFileDigests(header):
+    """
+    Returns the digests of the regular files in an RPM, in the form
+    cpiostream.CpioExploder.explode() expects: a dict mapping each path to
+    a (digest class, hex digest) tuple. Returns an empty dict if the
+    header uses a digest algorithm which isn't known here.
+    """
+    algo = header.get(FILEDIGESTALGO, [1])
+    digestClass = _fileDigestClasses.get(algo[0])
+    if digestClass is None:
+        return {}
+
+    digests = {}
+    for path, mode, digest in itertools.izip(header.paths(),
+                                             header[FILEMODES],
+                                             header[FILEDIGESTS]):
+        if digest and mode & 0170000 == 0100000:
+            digests[path] = (digestClass, digest)
+    return digests
+
 def _normpath(path):
     return util.normpath(path).lstrip('/')
 
@@ -798,9 +815,11 @@ class NEVRA(namedtuple('NEVRA', 'name epoch version release arch')):
 
     @classmethod
     def fromHeader(cls, header):
+        # rpmlib headers build a fresh list for each keys() call
+        keys = set(header.keys())
         args = []
         for tag in [NAME, EPOCH, VERSION, RELEASE, ARCH]:
-            if tag in header.keys():
+            if tag in keys:
                 args.append(header[tag])
             else:
                 args.append(None)
@@ -781,7 +781,7 @@ class MigrateTo_17(SchemaMigration):
         return True
 
 class MigrateTo_18(SchemaMigration):
-    Version = 18
+    Version = (18, 2)
     def migrate(self):
         cu = self.db.cursor()
         cu.execute("alter table instances add column "
@@ -807,6 +807,11 @@ class MigrateTo_18(SchemaMigration):
             cu.execute("DROP TABLE CheckTroveCache")
         return True
 
+    # migrate to 18.2
+    def migrate2(self):
+        schema.createLabelChanges(self.db)
+        return True
+
 def _getMigration(major):
     try:
         ret = sys.modules[__name__].__dict__['MigrateTo_' + str(major)]
@@ -348,6 +348,28 @@ def createLatest(db, withIndexes = True):
         db.loadSchema()
 
 
+# a counter per label, bumped whenever the troves on the label (or who
+# can see them) change; getLabelChangeMarks hands these out
+def createLabelChanges(db):
+    cu = db.cursor()
+    commit = False
+    if "LabelChanges" not in db.tables:
+        cu.execute("""
+        CREATE TABLE LabelChanges(
+            labelId         INTEGER NOT NULL,
+            changeCount     INTEGER NOT NULL DEFAULT 0,
+            CONSTRAINT LabelChanges_labelId_fk
+                FOREIGN KEY (labelId) REFERENCES Labels(labelId)
+                ON DELETE CASCADE ON UPDATE CASCADE
+        ) %(TABLEOPTS)s""" % db.keywords)
+        db.tables["LabelChanges"] = []
+        commit = True
+    db.createIndex("LabelChanges", "LabelChangesLabelIdx", "labelId",
+                   unique = True)
+    if commit:
+        db.loadSchema()
+
+
 def createUsers(db):
     cu = db.cursor()
     commit = False
@@ -1321,6 +1343,7 @@ def createSchema(db, commit=True):
 
     createChangeLog(db)
     createLatest(db)
+    createLabelChanges(db)
 
     createTroves(db)
 
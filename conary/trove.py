@@ -19,6 +19,7 @@
 Implements troves (packages, components, etc.) for the repository
 """
 
+import array
 import itertools, os
 import re
 import struct
@@ -538,25 +539,37 @@ class TroveSignatures(streams.StreamSet):
                                         freezeKnown = freezeKnown,
                                         freezeUnknown = freezeUnknown)
 
+    @staticmethod
+    def digest(sigVersion, message):
+        """
+        Returns the digest of message used for signatures of the given
+        version.
+        """
+        if sigVersion == _TROVESIG_VER_CLASSIC:
+            return sha1helper.sha1String(message)
+        elif sigVersion in (_TROVESIG_VER_NEW, _TROVESIG_VER_NEW2):
+            return sha1helper.nonstandardSha256String(message)
+
+        raise NotImplementedError
+
     def computeDigest(self, sigVersion, message):
+        self.setDigest(sigVersion, self.digest(sigVersion, message))
+
+    def setDigest(self, sigVersion, digest):
         if sigVersion == _TROVESIG_VER_CLASSIC:
-            self.sha1.compute(message)
+            self.sha1.set(digest)
             return
-
-        if sigVersion in (_TROVESIG_VER_NEW, _TROVESIG_VER_NEW2):
-            digest = streams.NonStandardSha256Stream()
-            digest.compute(message)
-        else:
+        elif sigVersion not in (_TROVESIG_VER_NEW, _TROVESIG_VER_NEW2):
             raise NotImplementedError
 
         for versionedBlock in self.vSigs:
             if versionedBlock.version() != sigVersion:
                 continue
 
-            versionedBlock.digest.set(digest())
+            versionedBlock.digest.set(digest)
             return
 
-        self.vSigs.addDigest(digest(), version = sigVersion)
+        self.vSigs.addDigest(digest, version = sigVersion)
 
     def sign(self, keyId):
         """
@@ -1376,8 +1389,41 @@ class TroveRefsTrovesStream(dict, streams.InfoStream):
     It can be frozen (to allow signatures to be calculated), but the other
     stream methods are not provided. The frozen form is intended to be
     easily extended if that becomes necessary at some later point.
+
+    The frozen form is kept until the dict is changed, as troves are
+    frozen once for each signature version and again to verify them.
     """
 
+    _frozen = None
+
+    def __setitem__(self, key, byDefault):
+        self._frozen = None
+        dict.__setitem__(self, key, byDefault)
+
+    def __delitem__(self, key):
+        self._frozen = None
+        dict.__delitem__(self, key)
+
+    def clear(self):
+        self._frozen = None
+        dict.clear(self)
+
+    def pop(self, *args):
+        self._frozen = None
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._frozen = None
+        return dict.popitem(self)
+
+    def setdefault(self, key, default = None):
+        self._frozen = None
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self._frozen = None
+        dict.update(self, *args, **kwargs)
+
     def freeze(self, skipSet = {}):
         """
         Frozen form is a sequence of:
@@ -1393,6 +1439,9 @@ class TroveRefsTrovesStream(dict, streams.InfoStream):
         This whole thing is sorted by the string value of each entry. Sorting
         this way is a bit odd, but it's simple and well-defined.
         """
+        if self._frozen is not None:
+            return self._frozen
+
         l = []
         for ((name, version, flavor), byDefault) in self.iteritems():
             v = version.asString()
@@ -1405,7 +1454,8 @@ class TroveRefsTrovesStream(dict, streams.InfoStream):
 
         l.sort()
 
-        return "".join(l)
+        self._frozen = "".join(l)
+        return self._frozen
 
     def copy(self):
         new = TroveRefsTrovesStream()
@@ -1414,11 +1464,21 @@ class TroveRefsTrovesStream(dict, streams.InfoStream):
 
         return new
 
-class TroveRefsFilesStream(dict, streams.InfoStream):
+_NOT_PENDING = object()
+
+class TroveRefsFilesStream(streams.InfoStream):
 
     """
-    Defines a dict which represents the files referenced by a trove. Each
-    entry maps a pathId to a (path, fileId, version) tuple.
+    Defines a mapping which represents the files referenced by a trove. Each
+    entry maps a pathId to a (dirName, baseName, fileId, version) tuple.
+
+    Troves can reference a very large number of files, so entries are kept
+    packed rather than in a dict. PathIds and fileIds are stored back to
+    back in strings sorted by pathId, base names are concatenated into a
+    single string, and directory names and versions are stored once and
+    referenced by index. Additions, changes and removals are recorded in a
+    small dict which is merged into the packed entries as it grows. Only
+    the mapping methods the trove code needs are provided.
 
     It can be frozen (to allow signatures to be calculated), but the other
     stream methods are not provided. The frozen form is slightly more
@@ -1428,6 +1488,238 @@ class TroveRefsFilesStream(dict, streams.InfoStream):
     easily computable).
     """
 
+    __slots__ = ( '_pathIds', '_fileIds', '_dirIdx', '_dirNames',
+                  '_baseNames', '_baseOffsets', '_verIdx', '_versions',
+                  '_pending', '_count', '_packAt', '_frozen' )
+
+    # merge pending changes once there are more of them than this plus
+    # the number of packed entries
+    _PACK_MIN = 128
+
+    def __init__(self):
+        self._pathIds = ''
+        self._fileIds = ''
+        self._dirIdx = array.array('i')
+        self._dirNames = []
+        self._baseNames = ''
+        self._baseOffsets = array.array('i', [ 0 ])
+        self._verIdx = array.array('i')
+        self._versions = []
+        # pathId -> entry, or None for packed entries which were removed
+        self._pending = {}
+        self._count = 0
+        self._packAt = self._PACK_MIN
+        # frozen form, kept until the next change
+        self._frozen = None
+
+    def _find(self, pathId):
+        """
+        Returns the index of pathId in the packed entries, or -1.
+        """
+        pathIds = self._pathIds
+        lo = 0
+        hi = len(pathIds) / 16
+        while lo < hi:
+            mid = (lo + hi) / 2
+            cur = pathIds[mid * 16:mid * 16 + 16]
+            if cur < pathId:
+                lo = mid + 1
+            elif cur > pathId:
+                hi = mid
+            else:
+                return mid
+
+        return -1
+
+    def _entry(self, idx):
+        baseOffsets = self._baseOffsets
+        return (self._dirNames[self._dirIdx[idx]],
+                self._baseNames[baseOffsets[idx]:baseOffsets[idx + 1]],
+                self._fileIds[idx * 20:idx * 20 + 20],
+                self._versions[self._verIdx[idx]])
+
+    def _pack(self):
+        """
+        Merges the pending changes into the packed entries. Entries which
+        can't be packed (missing fileIds, or paths which aren't plain
+        strings) stay pending.
+        """
+        pending = self._pending
+        pathIds = self._pathIds
+        entries = []
+        for idx in xrange(len(pathIds) / 16):
+            pathId = pathIds[idx * 16:idx * 16 + 16]
+            if pathId not in pending:
+                entries.append((pathId, self._entry(idx)))
+
+        unpacked = {}
+        for pathId, entry in pending.iteritems():
+            if entry is None:
+                continue
+            dirName, baseName, fileId, version = entry
+            if (type(dirName) is not str or type(baseName) is not str or
+                        type(fileId) is not str or len(fileId) != 20):
+                unpacked[pathId] = entry
+            else:
+                entries.append((pathId, entry))
+
+        entries.sort(key = lambda x: x[0])
+
+        newPathIds = []
+        newFileIds = []
+        baseNames = []
+        dirIdx = array.array('i')
+        baseOffsets = array.array('i', [ 0 ])
+        verIdx = array.array('i')
+        dirNames = []
+        dirMap = {}
+        versionList = []
+        # versions are matched by identity; equal versions can still differ
+        # in their timestamps
+        versionMap = {}
+        offset = 0
+        for pathId, (dirName, baseName, fileId, version) in entries:
+            newPathIds.append(pathId)
+            newFileIds.append(fileId)
+
+            idx = dirMap.get(dirName)
+            if idx is None:
+                idx = dirMap[dirName] = len(dirNames)
+                dirNames.append(intern(dirName))
+            dirIdx.append(idx)
+
+            baseNames.append(baseName)
+            offset += len(baseName)
+            baseOffsets.append(offset)
+
+            idx = versionMap.get(id(version))
+            if idx is None:
+                idx = versionMap[id(version)] = len(versionList)
+                versionList.append(version)
+            verIdx.append(idx)
+
+        self._pathIds = "".join(newPathIds)
+        self._fileIds = "".join(newFileIds)
+        self._dirIdx = dirIdx
+        self._dirNames = dirNames
+        self._baseNames = "".join(baseNames)
+        self._baseOffsets = baseOffsets
+        self._verIdx = verIdx
+        self._versions = versionList
+        self._pending = unpacked
+        self._packAt = self._PACK_MIN + len(entries) + len(unpacked)
+
+    def __getitem__(self, pathId):
+        entry = self._pending.get(pathId, _NOT_PENDING)
+        if entry is _NOT_PENDING:
+            idx = self._find(pathId)
+            if idx != -1:
+                return self._entry(idx)
+        elif entry is not None:
+            return entry
+
+        raise KeyError(pathId)
+
+    def __setitem__(self, pathId, entry):
+        old = self._pending.get(pathId, _NOT_PENDING)
+        if old is None or (old is _NOT_PENDING and self._find(pathId) == -1):
+            self._count += 1
+
+        self._frozen = None
+        self._pending[pathId] = entry
+        if len(self._pending) > self._packAt:
+            self._pack()
+
+    def __delitem__(self, pathId):
+        old = self._pending.get(pathId, _NOT_PENDING)
+        if old is None:
+            raise KeyError(pathId)
+
+        self._frozen = None
+        packed = (self._find(pathId) != -1)
+        if packed:
+            self._pending[pathId] = None
+        elif old is _NOT_PENDING:
+            raise KeyError(pathId)
+        else:
+            del self._pending[pathId]
+
+        self._count -= 1
+
+    def __contains__(self, pathId):
+        entry = self._pending.get(pathId, _NOT_PENDING)
+        if entry is _NOT_PENDING:
+            return self._find(pathId) != -1
+
+        return entry is not None
+
+    has_key = __contains__
+
+    def __len__(self):
+        return self._count
+
+    def __eq__(self, other, skipSet = None):
+        if other is None or len(self) != len(other):
+            return False
+
+        for pathId, entry in self.iteritems():
+            if pathId not in other or other[pathId] != entry:
+                return False
+
+        return True
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def get(self, pathId, default = None):
+        try:
+            return self[pathId]
+        except KeyError:
+            return default
+
+    def iteritems(self):
+        # iterate over a snapshot so the map can be changed while this is
+        # in progress, as with dict.items()
+        if self._pending:
+            self._pack()
+
+        pathIds = self._pathIds
+        fileIds = self._fileIds
+        dirIdx = self._dirIdx
+        dirNames = self._dirNames
+        baseNames = self._baseNames
+        baseOffsets = self._baseOffsets
+        verIdx = self._verIdx
+        versionList = self._versions
+        unpacked = self._pending.items()
+
+        for idx in xrange(len(pathIds) / 16):
+            yield (pathIds[idx * 16:idx * 16 + 16],
+                   (dirNames[dirIdx[idx]],
+                    baseNames[baseOffsets[idx]:baseOffsets[idx + 1]],
+                    fileIds[idx * 20:idx * 20 + 20],
+                    versionList[verIdx[idx]]))
+
+        for item in unpacked:
+            yield item
+
+    def iterkeys(self):
+        return ( x[0] for x in self.iteritems() )
+
+    __iter__ = iterkeys
+
+    def itervalues(self):
+        return ( x[1] for x in self.iteritems() )
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
     def freeze(self, skipSet = {}):
         """
         Frozen form is a sequence of:
@@ -1442,6 +1734,9 @@ class TroveRefsFilesStream(dict, streams.InfoStream):
         This whole thing is sorted by the string value of each entry. Sorting
         this way is a bit odd, but it's simple and well-defined.
         """
+        if self._frozen is not None:
+            return self._frozen
+
         l = []
         for (pathId, (dirName, baseName, fileId, version)) in self.iteritems():
             v = version.asString()
@@ -1451,15 +1746,22 @@ class TroveRefsFilesStream(dict, streams.InfoStream):
 
         l.sort()
 
-        return pack.pack("!" + "SH" * len(l), *( x[1] for x in l))
+        self._frozen = pack.pack("!" + "SH" * len(l), *( x[1] for x in l))
+        return self._frozen
 
     def copy(self):
+        # the packed entries are never modified in place, so they can be
+        # shared
         new = TroveRefsFilesStream()
-        for key, val in self.iteritems():
-            new[key] = val
+        for attr in self.__slots__:
+            setattr(new, attr, getattr(self, attr))
+        new._pending = self._pending.copy()
 
         return new
 
+    def __deepcopy__(self, memo):
+        return self.copy()
+
 _STREAM_TRV_NAME            = 0
 _STREAM_TRV_VERSION         = 1
 _STREAM_TRV_FLAVOR          = 2
@@ -1541,7 +1843,7 @@ class Trove(streams.StreamSet):
     # of the stream
     __slots__ = [ "name", "version", "flavor", "provides", "requires",
                   "changeLog", "troveInfo", "strongTroves", "weakTroves",
-                  "idMap", "type", "redirects" ]
+                  "idMap", "type", "redirects", "_sigDigests" ]
     __developer_api__ = True
 
     def __repr__(self):
@@ -1557,6 +1859,56 @@ class Trove(streams.StreamSet):
                                             freezeUnknown = True)
         raise NotImplementedError
 
+    def _sigKey(self, version):
+        """
+        Returns the frozen streams which _sigString(version) is built from,
+        including unknown streams when that version signs them. The file
+        and trove lists keep their frozen forms until they change, so
+        comparing keys is cheap when those are unchanged.
+        """
+        if version == _TROVESIG_VER_CLASSIC:
+            skipSet, freezeUnknown = self.v0SkipSet, False
+        elif version in (_TROVESIG_VER_NEW, _TROVESIG_VER_NEW2):
+            skipSet, freezeUnknown = self.v1SkipSet, True
+        else:
+            raise NotImplementedError
+
+        key = []
+        for tag, (size, streamType, name) in sorted(self.streamDict.items()):
+            if name in skipSet:
+                continue
+
+            stream = getattr(self, name)
+            if isinstance(stream, streams.StreamSet):
+                key.append(stream.freeze(skipSet, True, freezeUnknown))
+            else:
+                key.append(stream.freeze(skipSet))
+
+        if freezeUnknown:
+            # streams of the trove itself this version of conary doesn't
+            # know about are signed as well
+            key.append(streams.StreamSet.freeze(self, skipSet,
+                                                freezeKnown = False,
+                                                freezeUnknown = True))
+
+        return tuple(key)
+
+    def _sigDigest(self, version):
+        """
+        Returns the digest of _sigString(version). The last digest computed
+        for each version is remembered along with its key, so changing parts
+        of the trove which aren't signed (like the signatures themselves)
+        doesn't mean hashing the whole trove again.
+        """
+        key = self._sigKey(version)
+        cached = self._sigDigests.get(version)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        digest = TroveSignatures.digest(version, self._sigString(version))
+        self._sigDigests[version] = (key, digest)
+        return digest
+
     def addDigitalSignature(self, keyId, skipIntegrityChecks = False):
         """
         Signs all of the available digests for this trove and stores those
@@ -1746,8 +2098,8 @@ class Trove(streams.StreamSet):
         self.troveInfo.metadata.computeDigests()
 
         for sigVersion in sigVersions:
-            s = self._sigString(version = sigVersion)
-            self.troveInfo.sigs.computeDigest(sigVersion, s)
+            self.troveInfo.sigs.setDigest(sigVersion,
+                                          self._sigDigest(sigVersion))
 
     def verifyDigests(self):
         """
@@ -1772,8 +2124,7 @@ class Trove(streams.StreamSet):
             else:
                 lastDigest = sigDigest()
                 lastSigVersion = sigVersion
-                s = self._sigString(sigVersion)
-                if not sigDigest.verify(s):
+                if lastDigest != self._sigDigest(sigVersion):
                     return False
 
         self.troveInfo.metadata.verifyDigests()
@@ -3280,6 +3631,8 @@ class Trove(streams.StreamSet):
                  type = TROVE_TYPE_NORMAL, skipIntegrityChecks = False,
                  setVersion = True):
         streams.StreamSet.__init__(self)
+        # sigVersion -> (sigKey, digest); see _sigDigest()
+        self._sigDigests = {}
 
         if isinstance(name, AbstractTroveChangeSet):
             trvCs = name
@@ -4084,8 +4437,9 @@ class FlavorScoreCache(object):
             if oldFlavor.isEmpty() and newFlavor.isEmpty():
                 myMax = self.POS_INF
             else:
-                scores = (self.NEG_INF, newFlavor.score(oldFlavor),
-                          oldFlavor.score(newFlavor))
+                scores = (self.NEG_INF,
+                          deps.scoreFlavors(newFlavor, [ oldFlavor ])[0],
+                          deps.scoreFlavors(oldFlavor, [ newFlavor ])[0])
                 myMax = max(x for x in scores if x is not False)
             self.cache[oldFlavor, newFlavor] = myMax
             self.cache[newFlavor, oldFlavor] = myMax
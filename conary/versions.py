@@ -473,6 +473,8 @@ class Label(AbstractLabel):
         return self.branch
 
     def __eq__(self, version):
+        if self is version:
+            return 1
         if (isinstance(version, Label)
              and self.host == version.host
              and self.namespace == version.namespace
@@ -487,6 +489,14 @@ class Label(AbstractLabel):
     def __repr__(self):
         return "Label('%s')" % self.asString()
 
+    # labels are never modified once they are created, so copies can
+    # share the original (which keeps labels from LabelFromString shared)
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, mem):
+        return self
+
     def __str__(self):
         return self.asString()
 
@@ -1206,6 +1216,17 @@ class Version(VersionSequence):
 
         @rtype: Version
         """
+        if len(self.versions) == 2:
+            # branches which are just a label hold nothing mutable, so
+            # every version on that label can share the same one
+            label = self.versions[0]
+            b = branchCache.get(label, None)
+            if b is None:
+                b = Branch(self.versions[:-1])
+                b.cached = True
+                branchCache[label] = b
+            return b
+
         return Branch(self.versions[:-1])
 
     def isAfter(self, other):
@@ -1455,6 +1476,27 @@ def VersionFromString(ver, defaultBranch = None, timeStamps = []):
     v.cached = True
     return v
 
+def LabelFromString(label):
+    """
+    Returns a Label object for a fully qualified label string. Labels
+    are immutable, so equal label strings share a single Label object
+    for as long as someone holds a reference to it.
+
+    @param label: string representation of a label
+    @type label: str
+    @rtype: Label
+    """
+    l = labelCache.get(label, None)
+    if l is None:
+        staticLabelClass = staticLabelTable.get(label, None)
+        if staticLabelClass is not None:
+            l = staticLabelClass()
+        else:
+            l = Label(label)
+        labelCache[label] = l
+
+    return l
+
 def _VersionFromString(ver, defaultBranch = None, frozen = False,
                        timeStamps = []):
 
@@ -1486,14 +1528,10 @@ def _VersionFromString(ver, defaultBranch = None, frozen = False,
 
     for part in parts:
         if expectLabel:
-            lastBranch = Label(part, template = lastBranch)
-
-            staticLabelClass = staticLabelTable.get(lastBranch.asString(),
-                                                    None)
-            if staticLabelClass is not None:
-                vList.append(staticLabelClass())
-            else:
-                vList.append(lastBranch)
+            if '@' not in part:
+                part = Label(part, template = lastBranch).asString()
+            lastBranch = LabelFromString(part)
+            vList.append(lastBranch)
             expectLabel = False
 
             if justShadowed:
@@ -1556,3 +1594,5 @@ def strToFrozen(verStr, timeStamps):
 
 thawedVersionCache = weakref.WeakValueDictionary()
 stringVersionCache = weakref.WeakValueDictionary()
+labelCache = weakref.WeakValueDictionary()
+branchCache = weakref.WeakValueDictionary()
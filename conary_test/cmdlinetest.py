@@ -1166,6 +1166,13 @@ class CmdLineTest(rephelp.RepositoryHelper):
                              'signatureKey' : 'ffff'},
                   groupOptions=cook.GroupCookOptions(True, True, False))
 
+        self.checkCvc(
+                  'cook test.recipe --parallel-flavors',
+                  'conary.build.cook.cookCommand',
+                  [None, ['test.recipe'], False, None],
+                  ignoreKeywords=True,
+                  parallelFlavors=True)
+
         self.checkCvc(
                   'cook test.recipe --macro "foo bar" --no-deps --prep --allow-flavor-change --config "ShortenGroupFlavors True"',
                   'conary.build.cook.cookCommand',
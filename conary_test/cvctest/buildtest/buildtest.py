@@ -1883,8 +1883,9 @@ class ActionSuggests(PackageRecipe):
         self.assertEquals(reportedBuildReqs, set())
 
     def testActionSuggestsBuildReqs2(self):
-        # First, add a trove that provides tar and gz
-        fakeTroves = ['tar', 'gzip']
+        # First, add a trove that provides tar and xz; gzip compressed
+        # tarballs are unpacked without running any external tools
+        fakeTroves = ['tar', 'xz']
         for comp in fakeTroves:
             self.addComponent("fake%s:runtime" % comp, "1",
                 fileContents = [ ("/bin/%s" % comp, "%scontent" % comp)])
@@ -1899,19 +1900,19 @@ class ActionSuggests(PackageRecipe):
     clearBuildReqs()
     placeholder = 1
     def setup(r):
-        r.addArchive("foo-1.0.tar.gz", dir="/usr/share/foo/")
+        r.addArchive("foo.tar.xz", dir="/usr/share/foo/")
 """
         reportedBuildReqs = set()
         self.mock(packagepolicy.reportMissingBuildRequires, 'updateArgs',
                   lambda *args:
                     mockedUpdateArgs(args[0], reportedBuildReqs, *args[1:]))
         self.build(recipestr, 'ActionSuggests')
-        self.assertEquals(reportedBuildReqs, set(['fakegzip:runtime',
+        self.assertEquals(reportedBuildReqs, set(['fakexz:runtime',
                                                   'faketar:runtime']))
 
         # Same deal, with buildRequires added
         recipestr2 = recipestr.replace("placeholder = 1",
-                   "buildRequires = ['fakegzip:runtime', 'faketar:runtime']")
+                   "buildRequires = ['fakexz:runtime', 'faketar:runtime']")
 
         reportedBuildReqs.clear()
         self.build(recipestr2, 'ActionSuggests')
@@ -143,6 +143,70 @@ class EmptyPackage(PackageRecipe):
         troveTups = db.findTrove(None, ('testcase', None, None))
         assert(len(troveTups) == 1)
 
+    def testParallelFlavors(self):
+        d = tempfile.mkdtemp(dir=self.workDir)
+
+        origDir = os.getcwd()
+        os.chdir(d)
+        try:
+            self.newpkg('bash')
+            os.chdir('bash')
+            self.writeFile('bash.recipe', recipes.bashRecipe)
+            self.addfile('bash.recipe')
+            self.commit()
+            self.discardOutput(cook.cookCommand, self.cfg,
+                               [ 'bash[ssl]', 'bash[!ssl]' ],
+                               prep=False, macros={},
+                               cookIds=(os.getuid(), os.getgid()),
+                               parallelFlavors=True)
+        finally:
+            os.chdir(origDir)
+            shutil.rmtree(d)
+
+        repos = self.openRepository()
+        troveTups = repos.findTrove(self.cfg.buildLabel,
+                                    ('bash:runtime', None, None),
+                                    getLeaves = False, bestFlavor = False)
+        self.assertEqual(len(troveTups), 2)
+        # both flavors were committed together with the same version
+        self.assertEqual(len(set(x[1] for x in troveTups)), 1)
+        self.assertEqual(sorted(str(x[2]) for x in troveTups),
+                         [ '!ssl', 'ssl' ])
+
+    def testParallelFlavorsRecipeFile(self):
+        # 'foo-extra' sorts before 'foo:runtime'; the changeset is still
+        # named after the recipe
+        recipe = """
+class FooRecipe(PackageRecipe):
+    name = 'foo'
+    version = '1.0'
+    clearBuildReqs()
+
+    def setup(r):
+        if Use.ssl:
+            pass
+        r.Create('/usr/share/foo/a')
+        r.Create('/usr/share/foo-extra/b')
+        r.PackageSpec('foo-extra', '/usr/share/foo-extra/')
+"""
+        d = tempfile.mkdtemp(dir=self.workDir)
+
+        origDir = os.getcwd()
+        os.chdir(d)
+        try:
+            self.writeFile('foo.recipe', recipe)
+            self.discardOutput(cook.cookCommand, self.cfg,
+                               [ 'foo.recipe[ssl]', 'foo.recipe[!ssl]' ],
+                               prep=False, macros={},
+                               cookIds=(os.getuid(), os.getgid()),
+                               parallelFlavors=True)
+            self.assertEqual(sorted(x for x in os.listdir(d)
+                                    if x.endswith('.ccs')),
+                             [ 'foo-1.0.ccs' ])
+        finally:
+            os.chdir(origDir)
+            shutil.rmtree(d)
+
     def testCookLog(self):
         d = tempfile.mkdtemp(dir=self.workDir)
 
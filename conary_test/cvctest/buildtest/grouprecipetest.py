@@ -18,8 +18,12 @@
 import os
 import shutil
 import tempfile
+import threading
 
-from conary.build import loadrecipe, use
+from conary import trove
+from conary import versions
+from conary.build import grouprecipe, loadrecipe, use
+from conary.deps import deps
 
 
 
@@ -78,3 +82,64 @@ class GroupRecipeTest(rephelp.RepositoryHelper):
             recipeObj.groups['group-test2'].checkPathConflicts)
         self.assertEqual(True,
             recipeObj.groups['group-test3'].checkPathConflicts)
+
+    def testPrefetchTroveData(self):
+        class FakeServer(object):
+            _concurrentCalls = False
+
+        class FakeSource(object):
+            def __init__(self):
+                self.calls = []
+                self.threads = set()
+                self.c = { 'a.example.com' : FakeServer(),
+                           'b.example.com' : FakeServer() }
+
+            def getDepsForTroveList(self, troveList, provides = True,
+                                    requires = True):
+                self.threads.add(threading.currentThread())
+                self.calls.append(('deps', sorted(troveList)))
+                return [ (deps.parseDep('trove: %s' % x[0]),
+                          deps.DependencySet()) for x in troveList ]
+
+            def getTroveInfo(self, infoType, troveList):
+                self.threads.add(threading.currentThread())
+                self.calls.append((infoType, sorted(troveList)))
+                if infoType == trove._TROVEINFO_TAG_SIZE:
+                    return [ trove.TroveInfo.streamDict[infoType][1](
+                                len(x[0])) for x in troveList ]
+                return [ None for x in troveList ]
+
+        def _tup(name, host):
+            return (name, versions.VersionFromString(
+                            '/%s@rpl:linux/1.0-1-1' % host), deps.Flavor())
+
+        tups = [ _tup('foo:runtime', 'a.example.com'),
+                 _tup('foo:lib', 'a.example.com'),
+                 _tup('bar:runtime', 'b.example.com'),
+                 _tup('bar', 'b.example.com') ]
+
+        source = FakeSource()
+        cache = grouprecipe.TroveCache(source)
+        cache.prefetchTroveData(tups, getPathHashes = False, numThreads = 2)
+
+        # one call per server per kind of information; packages are skipped
+        self.assertEqual(sorted(source.calls), sorted([
+            ('deps', sorted(tups[0:2])),
+            ('deps', [ tups[2] ]),
+            (trove._TROVEINFO_TAG_SIZE, sorted(tups[0:2])),
+            (trove._TROVEINFO_TAG_SIZE, [ tups[2] ]) ]))
+
+        # the servers can't be called concurrently, so nothing was
+        # called from a worker thread
+        self.assertEqual(source.threads, set([ threading.currentThread() ]))
+
+        self.assertEqual(cache.getSizes(tups[0:3]),
+                         [ len('foo:runtime'), len('foo:lib'),
+                           len('bar:runtime') ])
+        self.assertEqual(cache.getDepsForTroveList(tups[0:1])[0][0],
+                         deps.parseDep('trove: foo:runtime'))
+
+        # everything is cached now, so there's nothing left to ask for
+        del source.calls[:]
+        cache.prefetchTroveData(tups, getPathHashes = False)
+        self.assertEqual(source.calls, [])
@@ -1020,6 +1020,63 @@ test:runtime
 
 
 
+    def testGroupResultCache(self):
+        depCheckRecipe = """
+class DepCheckRecipe(GroupRecipe):
+    name = 'group-test'
+    version = '1.0'
+    depCheck = True
+    imageGroup = False
+    clearBuildRequires()
+
+    def setup(self):
+        self.add('test:runtime')
+        self.add('other:runtime')
+"""
+        self.addComponent('test:runtime', '1.0-1-1',
+                 fileContents = [ ( 'file', 'contents', None,
+                                    deps.parseDep('trove: other:runtime') ) ] )
+        self.addComponent('other:runtime', '1.0-1-1')
+        self.cfg.groupResultCache = os.path.join(self.workDir, 'groupcache')
+
+        # results of cooks which never get committed aren't recorded
+        def commitChangeSet(*args, **kw):
+            raise RuntimeError('commit failed')
+        self.mock(netclient.NetworkRepositoryClient, 'commitChangeSet',
+                  commitChangeSet)
+        self.assertRaises(RuntimeError, self.build, depCheckRecipe,
+                          'DepCheckRecipe')
+        self.unmock()
+        self.failIf(os.path.exists(self.cfg.groupResultCache))
+
+        checked = []
+        realCheckGroupDependencies = grouprecipe.checkGroupDependencies
+        def checkGroupDependencies(group, *args, **kw):
+            checked.append(group.name)
+            return realCheckGroupDependencies(group, *args, **kw)
+        self.mock(grouprecipe, 'checkGroupDependencies',
+                  checkGroupDependencies)
+
+        trv1 = self.build(depCheckRecipe, 'DepCheckRecipe')
+        self.assertEqual(checked, [ 'group-test' ])
+
+        # nothing changed; the previous results get used
+        trv2 = self.build(depCheckRecipe, 'DepCheckRecipe')
+        self.assertEqual(checked, [ 'group-test' ])
+        self.assertNotEqual(trv1.getVersion(), trv2.getVersion())
+        self.assertEqual(sorted(trv1.iterTroveListInfo()),
+                         sorted(trv2.iterTroveListInfo()))
+        self.assertEqual(trv1.getSize(), trv2.getSize())
+
+        # a new version of one of the troves changes the inputs
+        self.addComponent('other:runtime', '1.0-1-2')
+        trv3 = self.build(depCheckRecipe, 'DepCheckRecipe')
+        self.assertEqual(checked, [ 'group-test', 'group-test' ])
+        self.assertEqual(
+            [ x[1].trailingRevision().asString()
+              for x in trv3.iterTroveList(strongRefs = True)
+              if x[0] == 'other:runtime' ], [ '1.0-1-2' ])
+
     def testAutoResolve(self):
         autoResolveRecipe = """
 class AutoResolveRecipe(GroupRecipe):
@@ -16,10 +16,13 @@
 
 
 import copy
+import imp
 import pickle
 import unittest
 
 from conary import errors
+from conary.lib.ext import dep_freeze
+from conary.deps import deps
 from conary.deps.deps import (
         getMinimalCompatibleChanges,
         parseDep,
@@ -47,6 +50,10 @@ from conary.deps.deps import (
         FileDependencies,
         SonameDependencies,
         ThawFlavor,
+        ThawSharedDependencySet,
+        ThawSharedFlavor,
+        scoreFlavors,
+        sharedDepSetCache,
         filterFlavor,
         Dependency,
         DependencySet,
@@ -693,6 +700,37 @@ class DepsTest(unittest.TestCase):
 
 
 
+    def testScoreFlavorsBatch(self):
+        flavors = [ parseFlavor(x) for x in (
+                    '', 'ssl', '!ssl', '~ssl', '~!ssl', '~!ssl,~!foo',
+                    'ssl,~foo is: x86', 'is: x86(i486,~i686)',
+                    'is: x86(!mmx) x86_64', 'is: x86(~!mmx) x86_64',
+                    'is: x86_64', '~!krb is: x86(i486,i586,i686,~sse)',
+                    'target: x86', 'is: x86 target: x86_64') ]
+        flavors.append(parseDep('trove: foo(a) trove: bar(a)'))
+        flavors.append(parseDep('trove: foo(a b)'))
+        for system in flavors:
+            assert(scoreFlavors(system, flavors) ==
+                   [ system.score(x) for x in flavors ])
+
+        # changing a flavor after it has been scored is noticed
+        system = parseFlavor('is: x86')
+        flavor = parseFlavor('ssl is: x86')
+        assert(scoreFlavors(system, [ flavor ]) == [ False ])
+        system.union(parseFlavor('ssl'))
+        assert(scoreFlavors(system, [ flavor ]) == [ 3 ])
+
+        # the tables are reset between calls once they get big
+        maxBits = deps.MAX_FLAG_BITS
+        deps.MAX_FLAG_BITS = 4
+        try:
+            for system in flavors:
+                assert(scoreFlavors(system, flavors) ==
+                       [ system.score(x) for x in flavors ])
+                assert(len(deps.compiledFlavorCache) <= len(flavors))
+        finally:
+            deps.MAX_FLAG_BITS = maxBits
+
     def testParseDependencies(self):
         def _test(s, result=None):
             if result is None:
@@ -896,6 +934,47 @@ class DepsTest(unittest.TestCase):
         del b
         assert(not dependencyCache)
 
+    def testSharedCache(self):
+        sharedDepSetCache.clear()
+
+        frz = parseFlavor("is: x86(mmx)").freeze()
+        a = ThawSharedFlavor(frz)
+        b = ThawSharedFlavor(unicode(frz))
+        assert(a is b)
+        assert(isinstance(a, Flavor))
+        assert(a == ThawFlavor(frz))
+        assert(hash(a) == hash(ThawFlavor(frz)))
+        # the flavor and the dependency set don't get mixed up
+        c = ThawSharedDependencySet(frz)
+        assert(c is not a)
+        assert(isinstance(c, DependencySet) and not isinstance(c, Flavor))
+        assert(c is ThawSharedDependencySet(frz))
+        assert(len(sharedDepSetCache) == 2)
+
+        # shared objects can't be changed, but their copies can
+        self.assertRaises(TypeError, a.union, parseFlavor('ssl'))
+        self.assertRaises(TypeError, c.addDep, InstructionSetDependency,
+                          Dependency('x86_64'))
+        self.assertRaises(TypeError, a.thaw, '')
+        for shared, cls in ((a, Flavor), (c, DependencySet)):
+            for new in (shared.copy(), copy.deepcopy(shared),
+                        pickle.loads(pickle.dumps(shared, 2))):
+                assert(new.__class__ == cls)
+                assert(new == shared)
+                new.union(parseFlavor('ssl'))
+                assert(new != shared)
+        assert((a - parseFlavor('is: x86')).__class__ == Flavor)
+        assert((a & a).__class__ == Flavor)
+        assert(a.toStrongFlavor().__class__ == Flavor)
+        f = parseFlavor('ssl')
+        f.union(a)
+        d = DependencySet()
+        d.union(c)
+        assert(d == c)
+        assert(a == ThawSharedFlavor(frz))
+        del a, b, c, shared, new
+        assert(not sharedDepSetCache)
+
     def testGetShortFlavorDescriptors(self):
         def _test(flavorList, resultingList, ordered=True):
             flavorList = [parseFlavor(x) for x in flavorList]
@@ -968,3 +1047,24 @@ class DepsTest(unittest.TestCase):
         s.union(parseDep('python: spam(nope)'))
         e.union(parseDep('python: spam(nope)'))
         self.assertEqual(m.check(s), e)
+
+        # bulk queries, which report deps in sorted order even for sets
+        # which have been thawed
+        s = parseDep('python: spam(lib) python: ham java: ham')
+        self.assertEqual(m.findAll([ s, parseDep('python: pork') ]),
+                [ [ ['foobar'], ['hamspam32', 'hamspam64'], ['hamspam32'] ],
+                  [ [] ] ])
+        self.assertEqual(m.checkAll([ s, e ]), [ None, e ])
+
+        # the python implementation of the matching agrees with the
+        # compiled one
+        pyFreeze = imp.load_source('pyFreeze',
+                    dep_freeze.__file__.rsplit('.', 1)[0] + '.py')
+        for depSet in (s, e, parseDep('python: ham(lib64 2.6)')):
+            self.assertEqual(pyFreeze.depSetMatch(m.depMap, depSet.freeze()),
+                             m.find(depSet))
+            self.assertEqual(
+                pyFreeze.depSetUnmatched(m.depMap, depSet.freeze(),
+                                         m.ignoreDepClasses),
+                dep_freeze.depSetUnmatched(m.depMap, depSet.freeze(),
+                                           m.ignoreDepClasses))
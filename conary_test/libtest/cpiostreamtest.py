@@ -136,3 +136,34 @@ class CpioStreamTest(testcase.TestCaseWithWorkDir):
         assert(os.path.isdir(target + '/dir'))
         sha1sum = digestlib.sha1(file(target + '/normal').read()).hexdigest()
         self.assertEquals(sha1sum, '5662cdf7d378e7505362c59239f73107b6edf1d3')
+
+    def testExpansionDigests(self):
+        rpmName = 'perl-Archive-Tar-1.46-68.fc11.x86_64.rpm'
+        cpioPath = self._createCpio(rpmName)
+        header = rpmhelper.readHeader(
+                            file(os.path.join(self.archiveDir, rpmName)))
+        digests = rpmhelper.getFileDigests(header)
+        # this package uses sha256 file digests
+        self.assertEquals(digests['/usr/lib/perl5/5.10.0/Archive/Tar.pm'][0],
+                          digestlib.sha256)
+
+        target = self.workDir + '/root'
+        expander = cpiostream.CpioExploder(file(cpioPath))
+        # write the larger files from the reading thread
+        expander.maxBufferedSize = 4096
+        expander.explode(target, digests = digests, numThreads = 4)
+        for path in digests:
+            assert(os.path.isfile(target + path))
+        sha1sum = digestlib.sha1(file(
+            target + '/usr/lib/perl5/5.10.0/Archive/Tar.pm').read()).hexdigest()
+        self.assertEquals(sha1sum, 'cbe78d8a0d26a86436e4fc56f8581ffd3db4bd83')
+
+        for size in (4096, 1024 * 1024):
+            shutil.rmtree(target)
+            digests['/usr/lib/perl5/5.10.0/Archive/Tar.pm'] = (
+                                            digestlib.sha256, '0' * 64)
+            expander = cpiostream.CpioExploder(file(cpioPath))
+            expander.maxBufferedSize = size
+            self.assertRaises(cpiostream.DigestMismatchError,
+                              expander.explode, target, digests = digests,
+                              numThreads = 4)
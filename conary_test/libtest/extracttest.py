@@ -0,0 +1,248 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from testrunner import testcase
+import bz2
+import gzip
+import os
+import stat
+import StringIO
+import tarfile
+import zipfile
+
+from conary.lib import digestlib, extract
+from conary_test import resources
+
+
+class ExtractTest(testcase.TestCaseWithWorkDir):
+    testDirName = 'conarytest-'
+
+    def setUp(self):
+        testcase.TestCaseWithWorkDir.setUp(self)
+        self.archiveDir = resources.get_archive()
+
+    def _checkDigests(self, destDir, extractor):
+        for relPath, (ino, size, ctime, sha1) in extractor.digests.items():
+            path = os.path.join(destDir, relPath)
+            self.assertEqual(digestlib.sha1(open(path).read()).digest(), sha1)
+            self.assertEqual(os.lstat(path).st_size, size)
+
+    def testSniffCompression(self):
+        self.assertEqual(extract.sniffCompression(
+            os.path.join(self.archiveDir, 'asdf.tar.gz')), 'gzip')
+        self.assertEqual(extract.sniffCompression(
+            os.path.join(self.archiveDir, 'distcc-2.9.tar.bz2')), 'bzip2')
+        self.assertEqual(extract.sniffCompression(
+            os.path.join(self.archiveDir, 'foo.tar.xz')), 'xz')
+        self.assertEqual(extract.sniffCompression(
+            os.path.join(self.archiveDir, 'allperms.tar')), None)
+        self.assertEqual(extract.openArchive(
+            os.path.join(self.archiveDir, 'foo.tar.xz')), None)
+
+    def testExtractTar(self):
+        destDir = os.path.join(self.workDir, 'tar')
+        extractor = extract.ArchiveExtractor(destDir, preserveModes = True,
+                                             computeDigests = True)
+        fileObj = extract.openArchive(
+                    os.path.join(self.archiveDir, 'allperms.tar'))
+        extractor.extractTar(fileObj)
+        fileObj.close()
+
+        sb = os.lstat(destDir + '/allperms/setuid')
+        self.assertEqual(stat.S_IMODE(sb.st_mode), 04755)
+        sb = os.lstat(destDir + '/allperms/permsdir')
+        self.assertEqual(stat.S_IMODE(sb.st_mode), 0700)
+        owners = dict((x[0], x[1:]) for x in extractor.owners)
+        self.assertEqual(owners['allperms/owneddir/ownedfile'],
+                         ('nobody', 'nobody'))
+        self.assertEqual(sorted(extractor.digests),
+                [ 'allperms/normaldir/normalfile', 'allperms/owneddir/ownedfile',
+                  'allperms/permsdir/notempty', 'allperms/setgid',
+                  'allperms/setuid' ])
+        self._checkDigests(destDir, extractor)
+
+    def testExtractCompressedTar(self):
+        for name in ('asdf.tar.gz', 'distcc-2.9.tar.bz2'):
+            destDir = os.path.join(self.workDir, name)
+            extractor = extract.ArchiveExtractor(destDir,
+                                                 computeDigests = True)
+            fileObj = extract.openArchive(os.path.join(self.archiveDir, name))
+            assert(isinstance(fileObj, extract.ReadAheadDecompressor))
+            extractor.extractTar(fileObj)
+            fileObj.close()
+
+            expected = [ x.name for x in
+                tarfile.open(os.path.join(self.archiveDir, name)) ]
+            self.assertEqual([ x[0] for x in extractor.owners ],
+                             [ os.path.normpath(x) for x in expected ])
+            self._checkDigests(destDir, extractor)
+
+    def testMultiMemberGzip(self):
+        # pigz and friends write concatenated gzip streams
+        tarData = StringIO.StringIO()
+        tar = tarfile.open(fileobj = tarData, mode = 'w')
+        contents = {}
+        for i in range(20):
+            info = tarfile.TarInfo('dir/file%d' % i)
+            contents[info.name] = str(i) * 10000 * i
+            info.size = len(contents[info.name])
+            tar.addfile(info, StringIO.StringIO(contents[info.name]))
+        tar.close()
+        tarData = tarData.getvalue()
+
+        archivePath = os.path.join(self.workDir, 'multi.tar.gz')
+        f = open(archivePath, 'w')
+        for i in range(0, len(tarData), 100000):
+            gz = gzip.GzipFile(fileobj = f, mode = 'w')
+            gz.write(tarData[i:i + 100000])
+            gz.close()
+        # trailing garbage is ignored
+        f.write('\0' * 512)
+        f.close()
+
+        destDir = os.path.join(self.workDir, 'multi')
+        extractor = extract.ArchiveExtractor(destDir)
+        fileObj = extract.openArchive(archivePath)
+        extractor.extractTar(fileObj)
+        fileObj.close()
+        for name, data in contents.items():
+            self.assertEqual(open(os.path.join(destDir, name)).read(), data)
+        self.assertEqual(extractor.digests, {})
+
+    class ChunkedFile(object):
+        def __init__(self, chunks):
+            self.chunks = chunks
+            self.closed = False
+
+        def read(self, size):
+            if not self.chunks:
+                return ''
+            return self.chunks.pop(0)
+
+        def close(self):
+            self.closed = True
+
+    @staticmethod
+    def _gzip(data):
+        f = StringIO.StringIO()
+        gz = gzip.GzipFile(fileobj = f, mode = 'w')
+        gz.write(data)
+        gz.close()
+        return f.getvalue()
+
+    def testMagicSplitAcrossReads(self):
+        # the magic of the next stream can be split across two reads
+        for compression, compress, split in (
+                ('gzip', self._gzip, 1), ('bzip2', bz2.compress, 2)):
+            first = compress('first\n')
+            second = compress('second\n')
+            fileObj = self.ChunkedFile([ first + second[:split],
+                                         second[split:] ])
+            decomp = extract.ReadAheadDecompressor(fileObj, compression)
+            self.assertEqual(decomp.read(), 'first\nsecond\n')
+            decomp.close()
+            # closing the decompressor closes what it reads from
+            assert(fileObj.closed)
+
+    def testTruncatedStream(self):
+        data = os.urandom(1000) * 100
+        for compression, compress in (('gzip', self._gzip),
+                                      ('bzip2', bz2.compress)):
+            compressed = compress(data)
+            for end in (len(compressed) - 3, len(compressed) / 2):
+                # the first stream or a later one can be cut short
+                for chunks in ([ compressed[:end] ],
+                               [ compressed, compressed[:end] ]):
+                    decomp = extract.ReadAheadDecompressor(
+                                    self.ChunkedFile(chunks), compression)
+                    self.assertRaises(extract.ExtractError, decomp.read)
+                    decomp.close()
+
+    def testSymlinkedParent(self):
+        outside = os.path.join(self.workDir, 'outside')
+        os.mkdir(outside)
+
+        tarData = StringIO.StringIO()
+        tar = tarfile.open(fileobj = tarData, mode = 'w')
+        info = tarfile.TarInfo('a')
+        info.type = tarfile.SYMTYPE
+        info.linkname = outside
+        tar.addfile(info)
+        for name in ('a/passwd', 'b/file', 'b'):
+            info = tarfile.TarInfo(name)
+            info.size = len(name)
+            tar.addfile(info, StringIO.StringIO(name))
+        tar.close()
+        tarData.seek(0)
+
+        destDir = os.path.join(self.workDir, 'symlinked')
+        extractor = extract.ArchiveExtractor(destDir)
+        extractor.extractTar(tarData)
+        # nothing is written through symlinks from the archive
+        self.assertEqual(os.listdir(outside), [])
+        self.assertEqual(os.readlink(destDir + '/a'), outside)
+        # a file replaces the directory which was there before
+        self.assertEqual(open(destDir + '/b').read(), 'b')
+        self.assertEqual([ x[0] for x in extractor.owners ],
+                         [ 'a', 'b/file', 'b' ])
+
+    def testExtractCpio(self):
+        destDir = os.path.join(self.workDir, 'cpio')
+        extractor = extract.ArchiveExtractor(destDir, computeDigests = True)
+        fileObj = extract.openArchive(
+                    os.path.join(self.archiveDir, 'hardlinks.cpio.gz'))
+        extractor.extractCpio(fileObj)
+        fileObj.close()
+
+        linked = [ os.lstat(destDir + x) for x in
+                    ('/a/regular-linked-a', '/b/regular-linked-b',
+                     '/b/regular-linked-c') ]
+        self.assertEqual(len(set((x.st_ino for x in linked))), 1)
+        self.assertEqual(linked[0].st_nlink, 3)
+        # hardlinked empty files have no entry carrying contents
+        self.assertEqual(os.lstat(destDir + '/a/empty').st_ino,
+                         os.lstat(destDir + '/b/empty').st_ino)
+        self._checkDigests(destDir, extractor)
+
+    def testExtractZip(self):
+        archivePath = os.path.join(self.workDir, 'test.zip')
+        z = zipfile.ZipFile(archivePath, 'w', zipfile.ZIP_DEFLATED)
+        for i in range(10):
+            z.writestr('sub%d/file' % (i % 3), 'contents %d\n' % i)
+        z.writestr('top', 'top\n')
+        z.close()
+
+        destDir = os.path.join(self.workDir, 'zip')
+        extractor = extract.ArchiveExtractor(destDir, computeDigests = True,
+                                             numThreads = 4)
+        extractor.extractZip(archivePath)
+        self.assertEqual(open(destDir + '/top').read(), 'top\n')
+        # later members win, like unzip -o
+        self.assertEqual(open(destDir + '/sub0/file').read(), 'contents 9\n')
+        self._checkDigests(destDir, extractor)
+
+    def testNotAnArchive(self):
+        destDir = os.path.join(self.workDir, 'bad')
+        path = os.path.join(self.workDir, 'notarchive')
+        open(path, 'w').write('this is not an archive\n' * 100)
+        extractor = extract.ArchiveExtractor(destDir)
+        self.assertRaises(extract.ExtractError, extractor.extractTar,
+                          open(path))
+        self.assertRaises(extract.ExtractError, extractor.extractCpio,
+                          open(path))
+        self.assertRaises(extract.ExtractError, extractor.extractZip, path)
+        self.assertFalse(os.path.exists(destDir))
@@ -438,6 +438,79 @@ class OpenPGPTest(BaseTestHelper):
         self.mock(getpass, 'getpass', mockGetpass2)
         self.discardOutput(kc.getPrivateKey, '91E3E6C5')
 
+    def testSignatureCache(self):
+        fingerprint = 'F7440D78FE813C882212C2BF8AC2828190B1E477'
+        # the directory holding the file is created when it is needed
+        sigCachePath = os.path.join(self.workDir, 'cache', 'sigcache')
+
+        class CountingKey(object):
+            def __init__(self, cryptoKey):
+                self.cryptoKey = cryptoKey
+                self.calls = 0
+
+            def verify(self, *args):
+                self.calls += 1
+                return self.cryptoKey.verify(*args)
+
+        def _getKey():
+            kc = openpgpkey.OpenPGPKeyFileCache()
+            kc.setPublicPath(self.getPublicFile())
+            kc.setPrivatePath(self.getPrivateFile())
+            kc.setSignatureCachePath(sigCachePath)
+            pubKey = kc.getPublicKey(fingerprint)
+            pubKey.cryptoKey = CountingKey(pubKey.cryptoKey)
+            return kc, pubKey
+
+        kc, pubKey = _getKey()
+        sig = kc.getPrivateKey(fingerprint, '111111').signString('data')
+        self.assertEqual(pubKey.verifyString('data', sig),
+                         pubKey.getTrustLevel())
+        self.assertEqual(pubKey.verifyString('other', sig), -1)
+        self.assertEqual(pubKey.cryptoKey.calls, 2)
+        # only the good signature is remembered
+        self.assertEqual(os.stat(sigCachePath).st_size, 20)
+
+        # later runs find it in the file
+        kc, pubKey = _getKey()
+        self.assertEqual(pubKey.verifyString('data', sig),
+                         pubKey.getTrustLevel())
+        self.assertEqual(pubKey.cryptoKey.calls, 0)
+
+        # revoking the key means checking again
+        pubKey.revoked = True
+        self.assertEqual(pubKey.verifyString('data', sig),
+                         pubKey.getTrustLevel())
+        self.assertEqual(pubKey.cryptoKey.calls, 1)
+
+    def testVerifyWithKey(self):
+        from conary.lib.ext import bignum
+        if bignum.powm is None:
+            raise testhelp.SkipTestException('libgmp is not available')
+        fingerprint = 'F7440D78FE813C882212C2BF8AC2828190B1E477'
+        kc = openpgpkey.OpenPGPKeyFileCache()
+        kc.setPublicPath(self.getPublicFile())
+        kc.setPrivatePath(self.getPrivateFile())
+        pubKey = kc.getPublicKey(fingerprint)
+        sig = kc.getPrivateKey(fingerprint, '111111').signString('data')
+
+        # pretend pycrypto has no gmp support so libgmp gets used directly
+        self.mock(openpgpfile, '_fastmath', None)
+        self.assertEqual(pubKey.verifyString('data', sig),
+                         pubKey.getTrustLevel())
+        self.assertEqual(pubKey.verifyString('other', sig), -1)
+        for x in (2, 255, 2 ** 1023 + 1):
+            self.assertEqual(bignum.powm(x, 65537, 2 ** 1024 - 105),
+                             pow(x, 65537, 2 ** 1024 - 105))
+
+        # self signatures on the keyring go through the same path
+        msg = PGP_Message(self.getPublicFile())
+        for pk in msg.iterMainKeys():
+            if pk.getKeyFingerprint() == fingerprint:
+                pk.verifySelfSignatures()
+                break
+        else:
+            self.fail('key %s not found' % fingerprint)
+
     def testKeyringKeyCache(self):
         keyring = os.path.join(self.workDir, "temp-keyring")
         keyringf = open(keyring, "w+")
@@ -0,0 +1,86 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from testrunner import testhelp
+
+import threading
+import time
+
+from conary.lib import threadpool
+
+
+class ThreadPoolTest(testhelp.TestCase):
+
+    def testMapOrder(self):
+        def slow(x):
+            # make later items finish first
+            time.sleep((10 - x) * 0.01)
+            return x * 2
+
+        self.assertEqual(threadpool.map(slow, range(10), numThreads = 4),
+                         [ x * 2 for x in range(10) ])
+        self.assertEqual(threadpool.map(slow, [], numThreads = 4), [])
+
+    def testSerial(self):
+        seen = set()
+        def f(x):
+            seen.add(threading.currentThread())
+            return x + 1
+
+        self.assertEqual(list(threadpool.imap(f, range(5), numThreads = 1)),
+                         [ 1, 2, 3, 4, 5 ])
+        self.assertEqual(seen, set([ threading.currentThread() ]))
+
+    def testWindow(self):
+        lock = threading.Lock()
+        state = { 'pending' : 0, 'max' : 0 }
+        def f(x):
+            lock.acquire()
+            state['pending'] += 1
+            state['max'] = max(state['max'], state['pending'])
+            lock.release()
+            return x
+
+        consumed = []
+        for x in threadpool.imap(f, range(50), numThreads = 4, window = 3):
+            lock.acquire()
+            state['pending'] -= 1
+            lock.release()
+            consumed.append(x)
+
+        self.assertEqual(consumed, range(50))
+        assert(state['max'] <= 3)
+
+    def testException(self):
+        def f(x):
+            if x in (3, 7):
+                raise ValueError(x)
+            return x
+
+        results = []
+        try:
+            for x in threadpool.imap(f, range(10), numThreads = 3):
+                results.append(x)
+        except ValueError, e:
+            # the first failure in submission order is reported
+            self.assertEqual(e.args, (3,))
+        else:
+            self.fail('expected ValueError')
+        self.assertEqual(results, [ 0, 1, 2 ])
+
+    def testCpuCount(self):
+        assert(threadpool.cpuCount() >= 1)
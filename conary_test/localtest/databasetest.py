@@ -208,6 +208,98 @@ class Database(testhelp.TestCase):
         finally:
             shutil.rmtree(d)
 
+    def testRollbackContentPool(self):
+        from conary.local.journal import NoopJobJournal
+        from conary.repository import changeset, filecontents
+        d = tempfile.mkdtemp()
+        try:
+            stack = database.RollbackStack(d + '/rollbacks', d, None, None)
+            contents = 'contents\n' * 100
+
+            for i in range(2):
+                local = changeset.ChangeSet()
+                local.addFileContents(self.id1, '1' * 20,
+                                      changeset.ChangedFileTypes.file,
+                                      filecontents.FromString(contents),
+                                      False)
+                local.addFileContents(self.id2, '2' * 20,
+                                      changeset.ChangedFileTypes.file,
+                                      filecontents.FromString('config %d\n' % i),
+                                      True)
+                stack.new().add(NoopJobJournal(), changeset.ChangeSet(),
+                                local, None)
+
+            store = database.RollbackContentStore(d + '/rollbacks/contents')
+            # both rollbacks share one copy of the same contents
+            self.assertEqual(len(list(store.iterContents())), 3)
+
+            localCs = stack.getRollback('r.0').getLast()[1]
+            self.assertEqual(localCs.getFileContents(self.id2, '2' * 20)[1].
+                             get().read(), 'config 0\n')
+            self.assertEqual(localCs.getFileContents(self.id1, '1' * 20)[1].
+                             get().read(), contents)
+
+            self.assertEqual(stack.prune(maxCount = 1), 1)
+            self.assertEqual(stack.getList(), [ 'r.1' ])
+            stack.collectContents(minAge = 0)
+            self.assertEqual(len(list(store.iterContents())), 2)
+            localCs = stack.getRollback('r.1').getLast()[1]
+            self.assertEqual(localCs.getFileContents(self.id1, '1' * 20)[1].
+                             get().read(), contents)
+
+            # batch removals leave collecting to the caller
+            collect = stack.collectContents
+            collected = []
+            stack.collectContents = lambda *args: collected.append(args)
+            stack.removeLast(collect = False)
+            self.assertEqual(collected, [])
+            self.assertEqual(stack.getList(), [])
+            collect(minAge = 0)
+            self.assertEqual(len(list(store.iterContents())), 0)
+        finally:
+            shutil.rmtree(d)
+
+    def testRollbackTroveListsOnly(self):
+        from conary.local.journal import NoopJobJournal
+        from conary.repository import changeset, filecontents
+        d = tempfile.mkdtemp()
+        try:
+            stack = database.RollbackStack(d + '/rollbacks', d, None, None)
+            v10 = ThawVersion("/conary.rpath.com@test:trunk/10:1.2-10-1")
+            f1 = files.FileFromFilesystem("/etc/passwd", self.id1)
+            trv = trove.Trove("testcomp", v10, deps.Flavor(), None)
+            trv.addFile(self.id1, "/bin/1", v10, f1.fileId())
+
+            reposCs = changeset.ChangeSet()
+            reposCs.newTrove(trv.diff(None, absolute = True)[0])
+            reposCs.addFile(None, f1.fileId(), f1.freeze())
+            reposCs.addFileContents(self.id1, f1.fileId(),
+                                    changeset.ChangedFileTypes.file,
+                                    filecontents.FromString('contents'),
+                                    False)
+            rb = stack.new()
+            rb.add(NoopJobJournal(), reposCs, changeset.ChangeSet(), None)
+            rb.add(NoopJobJournal(), changeset.ChangeSet(),
+                   changeset.ChangeSet(), None)
+
+            rb = stack.getRollback('r.0')
+            self.assertEqual(rb.countJobs(), 1)
+
+            csList = list(rb.iterChangeSets(withFiles = False))
+            self.assertEqual(len(csList), 4)
+            self.assertEqual([ x.getName() for x in
+                                    csList[0].iterNewTroveList() ],
+                             [ 'testcomp' ])
+            self.assertEqual(csList[0].files, {})
+            self.assertRaises(KeyError, csList[0].getFileContents,
+                              self.id1, f1.fileId())
+
+            reposCs = list(rb.iterChangeSets())[0]
+            self.assertEqual(reposCs.getFileContents(self.id1, f1.fileId())[1].
+                             get().read(), 'contents')
+        finally:
+            shutil.rmtree(d)
+
     def testGetCapsulesTroveList(self):
         # make sure that getCapsulesTroveList is at least not removed...
         from conary.lib import util
@@ -0,0 +1,60 @@
+#
+# Copyright (c) SAS Institute Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os
+import shutil
+import tempfile
+
+from testrunner import testhelp
+from conary.local import journal
+
+
+class JobJournalTest(testhelp.TestCase):
+    def setUp(self):
+        testhelp.TestCase.setUp(self)
+        self.root = tempfile.mkdtemp()
+        self.path = self.root + '/journal'
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        testhelp.TestCase.tearDown(self)
+
+    def testRevert(self):
+        open(self.root + '/old', 'w').write('old')
+        j = journal.JobJournal(self.path, self.root, create = True)
+        j.backup(self.root + '/old')
+        # the backup is a hardlink, so replace the file the way restore does
+        open(self.root + '/tmp', 'w').write('replaced')
+        os.rename(self.root + '/tmp', self.root + '/old')
+        open(self.root + '/new', 'w').write('new')
+        j.create(self.root + '/new')
+
+        j.revert()
+        self.assertEqual(open(self.root + '/old').read(), 'old')
+        self.failIf(os.path.exists(self.root + '/new'))
+
+    def testRevertUnclosed(self):
+        # a process killed mid-update never closes its journal; the files
+        # it created must still be recorded so revert can remove them
+        j = journal.JobJournal(self.path, self.root, create = True)
+        j.mkdir(self.root + '/dir')
+        os.mkdir(self.root + '/dir')
+        j.create(self.root + '/dir/new')
+        open(self.root + '/dir/new', 'w').write('new')
+
+        journal.JobJournal(self.path, self.root).revert()
+        self.failIf(os.path.exists(self.root + '/dir'))
@@ -27,7 +27,7 @@ from conary.local import sqldb
 from conary.versions import ThawVersion
 from conary.versions import VersionFromString
 from conary import files
-from conary import trove
+from conary import errors, trove
 from conary.lib.sha1helper import md5FromString, sha1FromString, md5String
 from conary_test import resources
 
@@ -483,6 +483,95 @@ class SqlDB(rephelp.RepositoryHelper):
         assert([ x for x in db.iterVersionByName('testcomp', True) ] == 
                                     [ (self.v10, flavor1), (self.v10, flavor2) ])
 
+    def testCheckPathConflicts(self):
+        db = sqldb.Database(':memory:')
+
+        f1 = files.FileFromFilesystem("/etc/passwd", self.id1)
+        f2 = files.FileFromFilesystem("/etc/services", self.id2)
+        f3 = files.FileFromFilesystem("/etc/group", self.id3)
+        f4 = files.FileFromFilesystem("/etc/group", self.id4)
+
+        def _add(name, fileList):
+            trv = trove.Trove(name, self.v10, self.emptyFlavor, None)
+            ti = db.addTrove(trv)
+            for path, f in fileList:
+                db.addFile(ti, f.pathId(), path, f.fileId(), self.v10,
+                           fileStream = f.freeze())
+            return db.addTroveDone(ti)
+
+        _add("first", [ ("/bin/1", f1), ("/bin/3", f3) ])
+        # /bin/3 is the same file in both troves, which is fine; /bin/2
+        # is new
+        second = _add("second", [ ("/bin/2", f2), ("/bin/3", f4) ])
+        self.assertEqual(db.checkPathConflicts([ second ], lambda x: False,
+                                               {}), {})
+
+        third = _add("third", [ ("/bin/1", f2) ])
+        try:
+            db.checkPathConflicts([ third ], lambda x: False, {})
+        except errors.DatabasePathConflicts, e:
+            self.assertEqual(e.getConflicts(),
+                [ ("/bin/1",
+                   (self.id1, ("first", self.v10, self.emptyFlavor)),
+                   (self.id2, ("third", self.v10, self.emptyFlavor))) ])
+        else:
+            self.fail("expected DatabasePathConflicts")
+
+        # files the trove shares with others aren't conflicts
+        sharedFiles = { ("first", self.v10, self.emptyFlavor) :
+                                set([ self.id1 ]) }
+        self.assertEqual(db.checkPathConflicts([ third ], lambda x: False,
+                                               sharedFiles), {})
+
+        # replacing the file marks the old one as not present
+        self.assertEqual(db.checkPathConflicts([ third ], lambda x: True, {}),
+                         { ("first", self.v10, self.emptyFlavor) :
+                                [ (self.id1, None, None) ] })
+        self.assertEqual(db.checkPathConflicts([ third ], lambda x: False,
+                                               {}), {})
+
+    def testAddFilesBatched(self):
+        db = sqldb.Database(':memory:')
+
+        f1 = files.FileFromFilesystem("/etc/passwd", self.id1)
+        f1.tags.set("tag1")
+        f2 = files.FileFromFilesystem("/etc/services", self.id2)
+        f2.tags.set("tag1")
+        f2.tags.set("tag2")
+        f3 = files.FileFromFilesystem("/etc/group", self.id3)
+
+        trv = trove.Trove("first", self.v10, self.emptyFlavor, None)
+        ti = db.addTrove(trv)
+        db.addFile(ti, f1.pathId(), "/bin/1", f1.fileId(), self.v10,
+                   fileStream = f1.freeze())
+        db.addFile(ti, f3.pathId(), "/bin/3", f3.fileId(), self.v10,
+                   fileStream = f3.freeze())
+        # nothing is written until the trove is done
+        self.assertEqual(list(db.iterFilesWithTag("tag1")), [])
+        db.addTroveDone(ti)
+        self.assertEqual(list(db.iterFilesWithTag("tag1")), [ "/bin/1" ])
+
+        # the update moves /bin/1 over from the old instance and adds a
+        # new tagged file
+        trv = trove.Trove("first", self.v20, self.emptyFlavor, None)
+        ti = db.addTrove(trv, oldTroveSpec = ("first", self.v10,
+                                              self.emptyFlavor))
+        db.addFile(ti, f1.pathId(), "/bin/one", f1.fileId(), self.v20)
+        db.addFile(ti, f2.pathId(), "/bin/2", f2.fileId(), self.v20,
+                   fileStream = f2.freeze())
+        db.addTroveDone(ti)
+
+        self.assertEqual(sorted(x[1] for x in
+                    db.iterFilesInTrove("first", self.v20, self.emptyFlavor)),
+                    [ "/bin/2", "/bin/one" ])
+        self.assertEqual(
+                [ x[1] for x in
+                    db.iterFilesInTrove("first", self.v10, self.emptyFlavor) ],
+                [ "/bin/3" ])
+        self.assertEqual(list(db.iterFilesWithTag("tag1")),
+                         [ "/bin/2", "/bin/one" ])
+        self.assertEqual(list(db.iterFilesWithTag("tag2")), [ "/bin/2" ])
+
     def testGroupMissingComponent(self):
         flavor1 = deps.parseFlavor('is:x86(cmov)')
         db = sqldb.Database(':memory:')
@@ -23,7 +23,7 @@ import os
 import signal
 import shutil
 
-from conary import conaryclient, errors, trove, versions
+from conary import callbacks, conaryclient, errors, trove, versions
 from conary.build import tags
 from conary.conaryclient import filetypes
 from conary.deps import deps
@@ -1686,3 +1686,71 @@ foo:*:1234:1234::/:/sbin/nologin
         self.updatePkg('usrmove:runtime=1.0', raiseError=True)
         self.updatePkg('usrmove:runtime=2.0', raiseError=True)
         self.assertEqual(open(os.path.join(self.rootDir, 'usr/sbin/usrmove')).read(), '2.0')
+
+    def testConcurrentTagHandlers(self):
+        d = self.workDir + '/taghandlers'
+        os.makedirs(d + '/tags')
+        # a waits for ax to run, which only works when both run at once;
+        # it gives up after ten seconds so running them one at a time
+        # fails instead of hanging
+        handlers = {
+            'a' : ('concurrent True',
+                   'i=0\n'
+                   'while [ ! -e %(d)s/ax.done ] && [ $i -lt 100 ]; do\n'
+                   '    sleep 0.1; i=$((i + 1))\n'
+                   'done\n'
+                   '[ -e %(d)s/ax.done ] && echo a saw ax\n'
+                   'touch %(d)s/a.done\n'),
+            'b' : ('concurrent True\nafter a',
+                   '[ -e %(d)s/a.done ] && echo b after a\n'
+                   'touch %(d)s/b.done\n'),
+            # sorts before b, but has to wait for it
+            'aa' : ('concurrent True\nafter b',
+                   '[ -e %(d)s/b.done ] && echo aa after b\n'),
+            'ax' : ('concurrent True',
+                   'touch %(d)s/ax.done\necho ax\n'),
+            'y' : ('',
+                   'echo y failed >&2\nexit 1\n'),
+        }
+        tagSet = {}
+        for tag, (desc, script) in handlers.items():
+            self.writeFile('%s/%s.handler' % (d, tag),
+                           '#!/bin/sh\n' + script % dict(d = d))
+            os.chmod('%s/%s.handler' % (d, tag), 0755)
+            self.writeFile('%s/tags/%s' % (d, tag),
+                           'file %s/%s.handler\n'
+                           'implements files update\n%s\n' % (d, tag, desc))
+            tagSet[tag] = tags.TagFile('%s/tags/%s' % (d, tag))
+
+        class Callback(callbacks.UpdateCallback):
+            def tagHandlerOutput(cb, tag, msg, stderr = False):
+                output.append((tag, msg, stderr))
+            def error(cb, msg, *args):
+                output.append(('error', msg % args, True))
+
+        output = []
+        tagCommands = update.TagCommand(callback = Callback())
+        for tag in sorted(handlers):
+            tagCommands.addCommand(tagSet[tag], 'files', 'update',
+                                   [ '/' + tag ])
+
+        # tag scripts list the handlers in the order they would run in
+        tagScript = d + '/tagscript'
+        tagCommands.run(tagScript, '/')
+        self.assertEqual([ os.path.basename(x.split()[0]) for x in
+                           open(tagScript) ],
+                         [ 'a.handler', 'ax.handler', 'b.handler',
+                           'aa.handler', 'y.handler' ])
+
+        tagCommands.run(None, '/')
+
+        # b is held back until a is done and aa until b is, y runs on its
+        # own, and the output is reported in the same order as running
+        # them one at a time
+        self.assertEqual(output, [
+            ('a', 'a saw ax\n', False),
+            ('ax', 'ax\n', False),
+            ('b', 'b after a\n', False),
+            ('aa', 'aa after b\n', False),
+            ('y', 'y failed\n', True),
+            ('error', '%s/y.handler failed' % d, True) ])
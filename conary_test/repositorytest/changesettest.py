@@ -16,6 +16,7 @@
 
 
 import os
+import struct
 
 import gzip
 from StringIO import StringIO
@@ -49,6 +50,12 @@ class ChangesetTest(rephelp.RepositoryHelper):
             assert(0)
         os.chmod(csFile, 0666)
 
+    def testTruncatedSkippedStream(self):
+        # skipping a stream which runs past the end of the file has to
+        # fail rather than wait for more data forever
+        cs = changeset.ReadOnlyChangeSet()
+        self.assertRaises(IOError, cs.thawFromFile,
+                          StringIO(struct.pack('!BI', 255, 10) + 'abc'))
 
     def testChangeSetFromFile(self):
         # ensure that absolute changesets that are read from disk
@@ -188,6 +195,35 @@ class ChangesetTest(rephelp.RepositoryHelper):
         fobj = testOne('0123456789' * 20000)
         self.assertEqual(fobj.getBackendType(), 'file')
 
+    def testCompressThreads(self):
+        # writing with a pool of compression threads must give the exact
+        # same changeset as writing serially
+        os.chdir(self.workDir)
+        def _makeCs(compressThreads):
+            cs = changeset.ChangeSet()
+            cs.setCompressThreads(compressThreads)
+            for i in range(20):
+                pathId = '%016d' % i
+                fileId = '%020d' % i
+                cs.addFileContents(pathId, fileId,
+                        changeset.ChangedFileTypes.file,
+                        filecontents.FromString(str(i) * 1000 * i), False)
+            cs.addFileContents('c' * 16, 'c' * 20,
+                               changeset.ChangedFileTypes.file,
+                               filecontents.FromString('config\n'), True)
+            return cs
+
+        size1 = _makeCs(1).writeToFile('serial.ccs')
+        size2 = _makeCs(4).writeToFile('threaded.ccs')
+        self.assertEqual(size1, size2)
+        self.assertEqual(open('serial.ccs').read(),
+                         open('threaded.ccs').read())
+
+        cs = changeset.ChangeSetFromFile('threaded.ccs')
+        for i in range(20):
+            contType, cont = cs.getFileContents('%016d' % i, '%020d' % i)
+            self.assertEqual(cont.get().read(), str(i) * 1000 * i)
+
     def testChangeSetMerge(self):
         os.chdir(self.workDir)
 
@@ -291,3 +327,46 @@ class ChangesetTest(rephelp.RepositoryHelper):
             fc.reset()
             actual = ''.join(fc.dumpIter(addfile, ('dummy',), offset))
             self.assertEqual(actual, expected[offset:])
+
+    def testSpillTroves(self):
+        flavor = deps.parseFlavor('')
+        cs = changeset.ChangeSet()
+        trvCsList = []
+        for i in range(3):
+            v = versions.VersionFromString(
+                '/localhost@rpl:devel/1.0-1-%d' % (i + 1),
+                timeStamps = [1.000 + i])
+            t = trove.Trove('test%d' % i, v, flavor, None)
+            t.addFile(sha1helper.md5FromString('%032d' % i),
+                      '/contents%d' % i, v, sha1helper.sha1String(str(i)))
+            trvCs = t.diff(None, absolute = 1)[0]
+            cs.newTrove(trvCs)
+            trvCsList.append(trvCs)
+        frozen = cs.newTroves.freeze()
+
+        spillDir = self.workDir + '/spill'
+        util.mkdirChain(spillDir)
+        spill = changeset.TroveChangeSetSpill(spillDir)
+        cs.spillTroves(spill)
+        # nothing but the keys stay in memory, and the spill file was
+        # unlinked as soon as it was created
+        assert(not [ x for x in dict.itervalues(cs.newTroves)
+                     if isinstance(x, trove.TroveChangeSet) ])
+        self.assertEqual(os.listdir(spillDir), [])
+
+        self.assertEqual(cs.newTroves.freeze(), frozen)
+        for trvCs in trvCsList:
+            spilled = cs.getNewTroveVersion(*trvCs.getNewNameVersionFlavor())
+            self.assertEqual(spilled.freeze(), trvCs.freeze())
+            self.assertEqual(spilled.getNewFileList(),
+                             trvCs.getNewFileList())
+        self.assertEqual(sorted(x.freeze() for x in cs.iterNewTroveList()),
+                         sorted(x.freeze() for x in trvCsList))
+        self.assertEqual(cs.newTroves.get(('missing', v, flavor)), None)
+
+        # spilled troves survive merging and writing the changeset out
+        cs2 = changeset.ReadOnlyChangeSet()
+        cs2.merge(cs)
+        cs2.writeToFile(self.workDir + '/spilled.ccs')
+        cs3 = changeset.ChangeSetFromFile(self.workDir + '/spilled.ccs')
+        self.assertEqual(cs3.newTroves.freeze(), frozen)
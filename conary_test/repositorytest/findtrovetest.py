@@ -487,6 +487,37 @@ class FindTroveTest(rephelp.RepositoryHelper):
                                ' localhost@rpl:2, localhost@rpl:3,'
                                ' localhost@rpl:4')
 
+    def testLabelPathUnreachableLabel(self):
+        # labels past the one the trove is found on are searched along
+        # with it; one which can't be reached must not break the search
+        repos = self.openRepository()
+        self.addComponent('foo:run', '1')
+        self.addComponent('bar:run', ':branch/1')
+        repos.c.map['unreachable.host'] = 'http://localhost:1/conary/'
+        connect = repos.c._connect
+        tried = []
+        def _connect(serverName, *args, **kw):
+            tried.append(repos.c._getServerName(serverName))
+            return connect(serverName, *args, **kw)
+        repos.c._connect = _connect
+        installLabelPath = conarycfg.CfgLabelList(
+                [ versions.Label('localhost@rpl:linux'),
+                  versions.Label('localhost@rpl:branch'),
+                  versions.Label('unreachable.host@rpl:linux') ])
+        result = repos.findTroves(installLabelPath,
+                                  [('foo:run', None, None),
+                                   ('bar:run', None, None)],
+                                  self.cfg.flavor)
+        assert(str(result[('foo:run', None, None)][0][1].trailingLabel())
+               == 'localhost@rpl:linux')
+        assert(str(result[('bar:run', None, None)][0][1].trailingLabel())
+               == 'localhost@rpl:branch')
+        # the repository is only asked once the search gets to it
+        assert('unreachable.host' not in tried)
+        self.assertRaises(errors.OpenError, repos.findTroves,
+                          installLabelPath, [('baz:run', None, None)],
+                          self.cfg.flavor)
+
     def testFindTroveFlavorPathAndLabelPath(self):
         self.addComponent('foo:run', '1', 'is:x86')
         self.addComponent('foo:run', '1', 'is:x86_64')
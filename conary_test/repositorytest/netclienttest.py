@@ -22,6 +22,7 @@ import itertools
 import os
 import shutil
 import tempfile
+import threading
 import time
 import SimpleHTTPServer
 
@@ -827,6 +828,72 @@ class NetclientTest(rephelp.RepositoryHelper):
         assert did_truncate[0]
         self.assertEqual(open(clean).read(), open(retry).read())
 
+    def testStreamingChangeSet(self):
+        repos = self.openRepository()
+        trv = self.addComponent('foo:runtime', '1',
+                                fileContents = [ ('/foo', 'foo\n'),
+                                                 ('/bar', 'bar\n') ])
+        job = [trv.getNameVersionFlavor().asJob()]
+        host = trv.getVersion().getHost()
+
+        clean = os.path.join(self.workDir, 'clean.ccs')
+        repos.createChangeSetFile(job, clean)
+        cs = repos.createChangeSet(job, streaming = True)
+        streamed = os.path.join(self.workDir, 'streamed.ccs')
+        cs.writeToFile(streamed)
+        self.assertEqual(open(clean).read(), open(streamed).read())
+
+        # a truncated download can't be retried once the changeset is
+        # being read; the error is raised to the reader instead
+        sp = repos.c[host]
+        orig_cs = sp.getChangeSet
+        def getChangeSet(*args, **kwargs):
+            rc = orig_cs(*args, **kwargs)
+            spool = tempfile.TemporaryFile(dir=self.workDir)
+            size = util.copyfileobj(rc[0], spool)
+            spool.seek(size // 2)
+            spool.truncate()
+            spool.seek(0)
+            return [spool] + rc[1:]
+
+        def stream():
+            cs = repos.createChangeSet(job, streaming = True)
+            cs.writeToFile(os.path.join(self.workDir, 'truncated.ccs'))
+
+        sp.getChangeSet = getChangeSet
+        self.cfg.downloadAttempts = 2
+        self.assertRaises(errors.TruncatedResponseError, stream)
+
+    def testChangeSetDownload(self):
+        (fd, name) = tempfile.mkstemp(dir = self.workDir)
+        outFile = util.ExtendedFile(name, "w+", buffering = False)
+        os.close(fd)
+        os.unlink(name)
+
+        allowed = threading.Semaphore(0)
+        def copy(outF):
+            for chunk in [ '0123', '4567', '89' ]:
+                allowed.acquire()
+                outF.write(chunk)
+            raise errors.TruncatedResponseError(12, 10)
+
+        download = netclient._ChangeSetDownload(outFile, copy)
+        f = util.SeekableNestedFile(download, 8, 2)
+        allowed.release()
+        # reads wait for the data they need
+        allowed.release()
+        self.assertEqual(f.read(4), '2345')
+        allowed.release()
+        self.assertEqual(f._fdInfo(), (outFile.fileno(), 2, 8))
+        # the data which did arrive is still readable; past it, the
+        # download error is raised
+        self.assertEqual(f.read(4), '6789')
+        f.seek(0)
+        self.assertEqual(f.read(8), '23456789')
+        self.assertRaises(errors.TruncatedResponseError,
+                          util.SeekableNestedFile(download, 4, 8).read)
+        self.assertRaises(errors.TruncatedResponseError, download.wait)
+
 
 class ServerProxyTest(rephelp.RepositoryHelper):
     def testBadProtocol(self):
@@ -1228,6 +1295,70 @@ class ServerProxyTest(rephelp.RepositoryHelper):
 
 
 
+    def testQueryCache(self):
+        foo1 = self.addComponent('foo:run', '1', provides='trove: foo(1)')
+        self.addComponent('bar:run', '/localhost@rpl:branch/1-1-1')
+        label = versions.Label('localhost@rpl:linux')
+        query = { 'foo:run' : { label : None },
+                  None : { versions.Label('localhost@rpl:branch') : None } }
+        missingQuery = { 'baz:run' : { label : None } }
+
+        def _fail(*args, **kw):
+            raise AssertionError('query should have been cached')
+
+        self.cfg.queryCache = os.path.join(self.workDir, 'querycache')
+        try:
+            repos = self.getRepositoryClient()
+            result = repos.getTroveLeavesByLabel(query)
+            assert(sorted(result) == [ 'bar:run', 'foo:run' ])
+            depList = repos.getDepsForTroveList(
+                            [ foo1.getNameVersionFlavor() ])
+            assert(str(depList[0][0]) == 'trove: foo(1)')
+            assert(repos.getTroveLeavesByLabel(missingQuery) == {})
+
+            # nothing changed, so nothing is asked for; empty results
+            # are kept as well
+            repos = self.getRepositoryClient()
+            repos.c['localhost'].getTroveLeavesByLabel = _fail
+            repos.c['localhost'].getDepsForTroveList = _fail
+            assert(repos.getTroveLeavesByLabel(query) == result)
+            assert(repos.getTroveLeavesByLabel(missingQuery) == {})
+            assert(repos.getDepsForTroveList(
+                            [ foo1.getNameVersionFlavor() ]) == depList)
+
+            # a new trove on the label makes the results stale
+            foo2 = self.addComponent('foo:run', '2')
+
+            # but not the dependencies of troves, which never change;
+            # they don't need the label to be checked at all
+            repos = self.getRepositoryClient()
+            repos.c['localhost'].getLabelChangeMarks = _fail
+            repos.c['localhost'].getDepsForTroveList = _fail
+            assert(repos.getDepsForTroveList(
+                            [ foo1.getNameVersionFlavor() ]) == depList)
+
+            repos = self.getRepositoryClient()
+            result = repos.getTroveLeavesByLabel(query)
+            assert(result['foo:run'].keys() == [ foo2.getVersion() ])
+            assert([ x.asString() for x in result['bar:run'] ] ==
+                   [ '/localhost@rpl:branch/1-1-1' ])
+
+            # only the label which changed is asked for again
+            repos = self.getRepositoryClient()
+            repos.c['localhost'].getTroveLeavesByLabel = _fail
+            branchQuery = { None :
+                            { versions.Label('localhost@rpl:branch') : None } }
+            assert(repos.getTroveLeavesByLabel(branchQuery).keys() ==
+                   [ 'bar:run' ])
+
+            # removing a trove changes the label as well
+            self.markRemoved('foo:run=2')
+            repos = self.getRepositoryClient()
+            result = repos.getTroveLeavesByLabel(query)
+            assert(result['foo:run'].keys() == [ foo1.getVersion() ])
+        finally:
+            self.cfg.queryCache = None
+
     def testGetLabelsForHost(self):
         try:
             self.openRepository(0, serverName=['localhost', 'localhost1'])
@@ -20,6 +20,7 @@ from testrunner import testhelp
 import gzip
 import os
 import StringIO
+import struct
 
 from conary import rpmhelper
 from conary.lib import util
@@ -111,6 +112,34 @@ class RPMHelperTest(testhelp.TestCase):
         self.assertEqual(header[rpmhelper.NAME], 'tmpwatch')
         self.assertEqual(header[rpmhelper.SIG_SIZE][0], 18624)
 
+    def testHeaderFromBlob(self):
+        # build a bare header holding one tag of each data type
+        tags = [
+            (rpmhelper.NAME, 6, 1, 'foo\0'),
+            (rpmhelper.BASENAMES, 8, 3, 'a\0\0bc\0'),
+            (rpmhelper.SUMMARY, 9, 1, 'sum\0'),
+            (rpmhelper.FILECOLORS, 2, 3, '\x01\x02\xff'),
+            (rpmhelper.FILEMODES, 3, 2, struct.pack('!2H', 0100644, 040755)),
+            (rpmhelper.FILESIZES, 4, 2, struct.pack('!2I', 10, 0xffffffff)),
+            (rpmhelper.SIG_SHA1, 7, 4, 'abcd'),
+            ]
+        entries = data = ''
+        for tag, dataType, count, value in tags:
+            entries += struct.pack('!iiii', tag, dataType, len(data), count)
+            data += value
+        blob = struct.pack('!ii', len(tags), len(data)) + entries + data
+        header = rpmhelper.headerFromBlob(blob)
+        self.assertEqual(header[rpmhelper.NAME], 'foo')
+        self.assertEqual(header[rpmhelper.BASENAMES], ['a', '', 'bc'])
+        self.assertEqual(header[rpmhelper.SUMMARY], ['sum'])
+        self.assertEqual(header[rpmhelper.FILECOLORS], [1, 2, 255])
+        self.assertEqual(header[rpmhelper.FILEMODES], [0100644, 040755])
+        self.assertEqual(header[rpmhelper.FILESIZES], [10, 0xffffffff])
+        self.assertEqual(header[rpmhelper.SIG_SHA1], 'abcd')
+        self.assertEqual(header[rpmhelper.FILEUSERNAME], [])
+        self.assertEqual(header.getNevra(),
+                rpmhelper.NEVRA('foo', None, None, None, None))
+
     def testRpmDeps(self):
         rpmName = 'depstest-0.1-1.x86_64.rpm'
         rpmPath = os.path.join(self.archiveDir, rpmName)
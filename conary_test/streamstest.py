@@ -823,3 +823,90 @@ class StreamsTest(testhelp.TestCase):
         b.blah.set('blah')
         frz = b.freeze()
         self.assertEqual(Blah2.find(1, frz)(), 'blah')
+
+    def testLazyStreamSet(self):
+        thawed = []
+
+        class CountingStream(StringStream):
+            def thaw(self, frz):
+                thawed.append(frz)
+                return StringStream.thaw(self, frz)
+
+        class Inner(StreamSet):
+            lazyThaw = True
+            streamDict = { 1 : ( SMALL, CountingStream, "a" ),
+                           2 : ( SMALL, CountingStream, "b" ) }
+
+        class Lazy(StreamSet):
+            lazyThaw = True
+            ignoreUnknown = PRESERVE_UNKNOWN
+            streamDict = { 1 : ( SMALL, CountingStream, "name" ),
+                           2 : ( SMALL, CountingStream, "other" ),
+                           3 : ( DYNAMIC, Inner, "inner" ),
+                           4 : ( SMALL, IntStream, "number" ) }
+
+        class Eager(StreamSet):
+            ignoreUnknown = PRESERVE_UNKNOWN
+            streamDict = Lazy.streamDict
+
+        e = Eager()
+        e.name.set('name')
+        e.other.set('other')
+        e.inner.a.set('a')
+        e.inner.b.set('b')
+        # an unknown tag
+        frz = e.freeze() + '\x10\x00\x03xyz'
+        del thawed[:]
+
+        # nothing is thawed until it's used, and untouched streams refreeze
+        # to their original data
+        l = Lazy(frz)
+        self.assertEqual(thawed, [])
+        self.assertEqual(l.freeze(), frz)
+        self.assertEqual(l.name(), 'name')
+        self.assertEqual(thawed, [ 'name' ])
+        self.assertEqual(l.inner.b(), 'b')
+        self.assertEqual(thawed, [ 'name', 'b' ])
+        self.assertEqual(l.number(), None)
+        self.assertEqual(l.freeze(), frz)
+        self.assertEqual(l.freeze(freezeUnknown = False),
+                         Eager(frz).freeze(freezeUnknown = False))
+        self.assertEqual(l.freeze(skipSet = { 'a' : True }),
+                         Eager(frz).freeze(skipSet = { 'a' : True }))
+
+        # changes made to thawed and replaced streams are kept
+        l = Lazy(frz)
+        l.other.set('changed')
+        l.name = CountingStream('replaced')
+        l.number.set(10)
+        e = Eager(frz)
+        e.other.set('changed')
+        e.name.set('replaced')
+        e.number.set(10)
+        self.assertEqual(l.freeze(), e.freeze())
+
+        # comparisons, diffs and merges work on the thawed values
+        l = Lazy(frz)
+        e = Eager(frz)
+        self.assertEqual(l.freeze(), e.freeze())
+        self.assertEqual(l, Lazy(frz))
+        self.assertEqual(hash(l), hash(Lazy(frz)))
+        other = Lazy(frz)
+        other.other.set('different')
+        self.assertNotEqual(l, other)
+        diff = other.diff(l, ignoreUnknown = True)
+        l.twm(diff, l)
+        self.assertEqual(l.other(), 'different')
+
+        # thawing again behaves like it does for eagerly thawed sets
+        l = Lazy(frz)
+        l.thaw('\x02\x00\x03new')
+        e = Eager(frz)
+        e.thaw('\x02\x00\x03new')
+        self.assertEqual(l.freeze(), e.freeze())
+        l = Lazy()
+        self.assertEqual(l.freeze(), '')
+        l.thaw(frz)
+        self.assertEqual(l.freeze(), frz)
+        l = Lazy(frz + '\x01\x00\x05again')
+        self.assertEqual(l.name(), 'again')
@@ -1423,6 +1423,79 @@ Some changes just are.
         t.troveInfo.sigs.vSigs.addDigest(nonstandardSha256String('blah'), 1)
         self.assertEqual(t.verifyDigests(), False)
 
+    def testDigestCache(self):
+        v = ThawVersion("/conary.rpath.com@test:trunk/10:1.2-3")
+        f = parseFlavor('is:x86')
+        t = Trove('foo', v, f)
+        t.addFile(self.id1, "/path1", v, self.fid1)
+        t.addTrove('bar:runtime', v, f)
+
+        def check():
+            # the remembered digests have to match what hashing the
+            # signature strings from scratch gives
+            t.computeDigests()
+            sigs = [ (x[0], x[1]()) for x in t.troveInfo.sigs ]
+            self.assertEqual(sigs,
+                [ (0, sha1String(t._sigString(0))),
+                  (1, nonstandardSha256String(t._sigString(1))) ])
+            self.assertTrue(t.verifyDigests())
+            return sigs
+
+        orig = check()
+        # unsigned troveinfo doesn't change the digests
+        t.troveInfo.installTime.set(1234)
+        self.assertEqual(check(), orig)
+
+        # but changing the file list or trove list does
+        t.addFile(self.id2, "/path2", v, self.fid2)
+        new = check()
+        self.assertNotEqual(new, orig)
+        t.removeFile(self.id2)
+        self.assertEqual(check(), orig)
+        t.updateFile(self.id1, "/path3", v, self.fid1)
+        self.assertNotEqual(check(), orig)
+        t.updateFile(self.id1, "/path1", v, self.fid1)
+        self.assertEqual(check(), orig)
+
+        t.strongTroves[('bar:runtime', v, f)] = False
+        self.assertNotEqual(check(), orig)
+        t.strongTroves.update({ ('bar:runtime', v, f) : True })
+        self.assertEqual(check(), orig)
+        t.weakTroves.setdefault(('baz:runtime', v, f), True)
+        self.assertNotEqual(check(), orig)
+        t.weakTroves.clear()
+        self.assertEqual(check(), orig)
+
+        # changes made behind computeDigests() are still caught
+        t.troveInfo.sourceName.set('foo:source')
+        self.assertFalse(t.verifyDigests())
+
+        # unknown streams of the trove itself are signed by version 1
+        class ExtraTrove(trove.Trove):
+            streamDict = dict(trove.Trove.streamDict)
+            streamDict[254] = (streams.LARGE, streams.StringStream, 'unknown')
+
+        class PreservingTrove(trove.Trove):
+            ignoreUnknown = streams.PRESERVE_UNKNOWN
+
+        frozen = []
+        for value in ('one', 'two'):
+            extra = ExtraTrove('foo', v, f)
+            extra.unknown.set(value)
+            frozen.append(streams.StreamSet.freeze(extra))
+
+        t = PreservingTrove('foo', v, f)
+        streams.StreamSet.thaw(t, frozen[0])
+        t.computeDigests()
+        orig = [ (x[0], x[1]()) for x in t.troveInfo.sigs ]
+        streams.StreamSet.thaw(t, frozen[1])
+        t.computeDigests()
+        new = [ (x[0], x[1]()) for x in t.troveInfo.sigs ]
+        self.assertEqual(new[0], orig[0])
+        self.assertEqual(new[1],
+                         (1, nonstandardSha256String(t._sigString(1))))
+        self.assertNotEqual(new[1], orig[1])
+
     def testTroveInfoSize(self):
         # troveinfo elements added after BUILD_FLAVOR must be DYNAMIC
         for tag in trove.TroveInfo.streamDict.keys():
@@ -1442,6 +1515,55 @@ Some changes just are.
         p.removeAllFiles()
         assert(len(p.idMap) == 0)
 
+    def testTroveRefsFilesStream(self):
+        old = ThawVersion("/conary.rpath.com@test:trunk/10:1.2-3")
+        new = ThawVersion("/conary.rpath.com@test:trunk/20:1.2-4")
+        refs = trove.TroveRefsFilesStream()
+        expected = {}
+        # enough entries to be packed a few times
+        for i in range(1000):
+            pathId = md5String(str(i))
+            entry = ('/dir%d' % (i % 10), 'file%d' % i, sha1String(str(i)),
+                     (i % 2) and old or new)
+            refs[pathId] = entry
+            expected[pathId] = entry
+
+        # entries without a fileId can't be packed
+        pathId = md5String('nofileid')
+        refs[pathId] = expected[pathId] = ('/dir', 'nofileid', None, old)
+
+        for i in range(0, 1000, 3):
+            pathId = md5String(str(i))
+            del refs[pathId]
+            del expected[pathId]
+        for i in range(1, 1000, 3):
+            pathId = md5String(str(i))
+            refs[pathId] = expected[pathId] = ('/changed', 'file%d' % i,
+                                               sha1String('x'), new)
+
+        self.assertEqual(len(refs), len(expected))
+        self.assertEqual(sorted(refs.items()), sorted(expected.items()))
+        self.assertEqual(sorted(refs.keys()), sorted(expected))
+        for pathId, entry in expected.iteritems():
+            self.assertEqual(refs[pathId], entry)
+            # the version objects themselves are kept
+            assert(refs[pathId][3] is entry[3])
+        assert(md5String('0') not in refs)
+        self.assertRaises(KeyError, refs.__getitem__, md5String('0'))
+        self.assertRaises(KeyError, refs.__delitem__, md5String('0'))
+        self.assertEqual(refs.get(md5String('0')), None)
+
+        other = refs.copy()
+        self.assertEqual(other, refs)
+        del other[md5String('1')]
+        assert(md5String('1') in refs)
+        self.assertNotEqual(other, refs)
+
+        # changing entries while iterating works like it does for dicts
+        for pathId, entry in refs.iteritems():
+            refs[pathId] = entry[0:3] + (old,)
+        self.assertEqual(set(x[3] for x in refs.itervalues()), set([old]))
+
 from conary_test import rephelp
 class TroveTest2(rephelp.RepositoryHelper):
 
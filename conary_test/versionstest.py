@@ -427,6 +427,37 @@ class VersionsTest(unittest.TestCase):
         assert(id(v1) == id(v3))
         assert(id(v3) == id(v4))
 
+    def testLabelCache(self):
+        versions.labelCache.clear()
+        versions.branchCache.clear()
+
+        l1 = versions.LabelFromString('foo.com@spc:bar')
+        l2 = versions.LabelFromString('foo.com@spc:bar')
+        assert(l1 is l2)
+        assert(l1 == Label('foo.com@spc:bar'))
+        assert(versions.LabelFromString(LocalLabel.name).__class__ ==
+               LocalLabel)
+        self.assertRaises(ParseError, versions.LabelFromString, 'bar')
+
+        # versions parsed from strings use the same labels, including
+        # labels which are relative to the one before them
+        v1 = ThawVersion('/foo.com@spc:bar/1:1.2-3')
+        v2 = VersionFromString('/foo.com@spc:bar/1.2-4/baz/1.2-4')
+        assert(v1.trailingLabel() is l1)
+        assert(v2.versions[0] is l1)
+        assert(v2.trailingLabel() is
+               versions.LabelFromString('foo.com@spc:baz'))
+        assert(v1.copy().trailingLabel() is l1)
+
+        # branches which are just a label are shared too
+        v3 = VersionFromString('/foo.com@spc:bar/2-1')
+        assert(v1.branch() is v3.branch())
+        assert(v1.branch() == VersionFromString('/foo.com@spc:bar'))
+        assert(v2.branch() is not v2.branch())
+        assert(v2.branch() == v2.copy().branch())
+        del v1, v2, v3, l1, l2
+        assert(not versions.branchCache)
+
     def testGetSourceVersion(self):
         v = VersionFromString('/conary.rpath.com@rpl:linux/4.3-1-0/autconf213/1')
         assert(not v.isBranchedBinary())